@@ -173,11 +173,254 @@ def run_migrations():
         db.commit()
         db.close()
         print("[OK] mercadolibre.size_grid table verified/created")
-        return True
     except Exception as e:
         print(f"Size grid table migration error: {e}")
         return False
 
+    # 6. Integer join key on mercadolibre.selling_calculation
+    # item_id is a VARCHAR holding product_catalog_sync.id; joining through
+    # CAST(id AS CHAR) can't use an index, so keep a generated, indexed INT copy.
+    try:
+        db = SessionLocal()
+        print("Checking for 'item_id_int' in 'mercadolibre.selling_calculation'...")
+        result = db.execute(text("""
+            SELECT count(*) 
+            FROM INFORMATION_SCHEMA.COLUMNS 
+            WHERE TABLE_SCHEMA = 'mercadolibre' 
+            AND TABLE_NAME = 'selling_calculation'
+            AND COLUMN_NAME = 'item_id_int'
+        """))
+        if result.scalar() == 0:
+            print("Auto-migration: Adding item_id_int column to mercadolibre.selling_calculation...")
+            db.execute(text("""
+                ALTER TABLE mercadolibre.selling_calculation
+                ADD COLUMN item_id_int BIGINT
+                    GENERATED ALWAYS AS (IF(item_id REGEXP '^[0-9]+$', CAST(item_id AS UNSIGNED), NULL)) STORED,
+                ADD INDEX idx_selling_calculation_item_id_int (item_id_int)
+            """))
+            db.commit()
+            print("[OK] Added item_id_int column")
+        db.close()
+        print("[OK] Selling calculation migrations completed")
+    except Exception as e:
+        print(f"Selling calculation migration error: {e}")
+        return False
+
+    # 7. Competence scrape job queue tables
+    try:
+        db = SessionLocal()
+        print("Checking if mercadolibre.scrape_jobs tables exist...")
+        db.execute(text("""
+            CREATE TABLE IF NOT EXISTS mercadolibre.scrape_jobs (
+                id VARCHAR(36) PRIMARY KEY,
+                policy VARCHAR(100),
+                status VARCHAR(50) DEFAULT 'queued',
+                total_items INT DEFAULT 0,
+                dispatched_items INT DEFAULT 0,
+                completed_items INT DEFAULT 0,
+                failed_items INT DEFAULT 0,
+                error VARCHAR(1000),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                INDEX idx_scrape_jobs_created_at (created_at)
+            )
+        """))
+        db.execute(text("""
+            CREATE TABLE IF NOT EXISTS mercadolibre.scrape_job_items (
+                job_id VARCHAR(36) NOT NULL,
+                product_code VARCHAR(100) NOT NULL,
+                status VARCHAR(50) DEFAULT 'queued',
+                attempts INT DEFAULT 0,
+                error VARCHAR(1000),
+                dispatched_at DATETIME,
+                finished_at DATETIME,
+                PRIMARY KEY (job_id, product_code),
+                INDEX idx_scrape_job_items_status (job_id, status)
+            )
+        """))
+        db.commit()
+        db.close()
+        print("[OK] mercadolibre.scrape_jobs tables verified/created")
+    except Exception as e:
+        print(f"Scrape jobs table migration error: {e}")
+        return False
+
+    # 8. Competitor price history (append-only, compact)
+    try:
+        db = SessionLocal()
+        print("Checking if mercadolibre.competence_price_history tables exist...")
+        db.execute(text("""
+            CREATE TABLE IF NOT EXISTS mercadolibre.competitors (
+                id SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+                name VARCHAR(100) NOT NULL,
+                UNIQUE KEY uq_competitors_name (name)
+            )
+        """))
+        db.execute(text("""
+            CREATE TABLE IF NOT EXISTS mercadolibre.competence_price_history (
+                product_code VARCHAR(100) NOT NULL,
+                ts DATETIME NOT NULL,
+                price_cents BIGINT NOT NULL,
+                competitor_id SMALLINT UNSIGNED NULL,
+                PRIMARY KEY (product_code, ts)
+            )
+        """))
+        db.commit()
+        db.close()
+        print("[OK] mercadolibre.competence_price_history tables verified/created")
+    except Exception as e:
+        print(f"Price history table migration error: {e}")
+        return False
+
+    # 9. Outbound webhook outbox
+    try:
+        db = SessionLocal()
+        print("Checking if mercadolibre.webhook_outbox table exists...")
+        db.execute(text("""
+            CREATE TABLE IF NOT EXISTS mercadolibre.webhook_outbox (
+                id VARCHAR(36) PRIMARY KEY,
+                event_type VARCHAR(50),
+                item_id VARCHAR(255),
+                site VARCHAR(50),
+                url VARCHAR(500),
+                payload TEXT,
+                status VARCHAR(20) DEFAULT 'pending',
+                attempts INT DEFAULT 0,
+                next_attempt_at DATETIME,
+                claimed_by VARCHAR(36),
+                claimed_at DATETIME,
+                last_error VARCHAR(1000),
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                delivered_at DATETIME,
+                INDEX idx_webhook_outbox_due (status, next_attempt_at),
+                INDEX idx_webhook_outbox_claim (claimed_by)
+            )
+        """))
+        db.commit()
+        db.close()
+        print("[OK] mercadolibre.webhook_outbox table verified/created")
+    except Exception as e:
+        print(f"Webhook outbox table migration error: {e}")
+        return False
+
+    # 10. Lookup index for coalescing pending outbox updates of the same item
+    try:
+        db = SessionLocal()
+        result = db.execute(text("""
+            SELECT count(*)
+            FROM INFORMATION_SCHEMA.STATISTICS
+            WHERE TABLE_SCHEMA = 'mercadolibre'
+            AND TABLE_NAME = 'webhook_outbox'
+            AND INDEX_NAME = 'idx_webhook_outbox_coalesce'
+        """))
+        if result.scalar() == 0:
+            print("Auto-migration: Adding coalescing index to mercadolibre.webhook_outbox...")
+            db.execute(text("""
+                ALTER TABLE mercadolibre.webhook_outbox
+                ADD INDEX idx_webhook_outbox_coalesce (item_id, event_type, site, status)
+            """))
+            db.commit()
+            print("[OK] Added idx_webhook_outbox_coalesce")
+        db.close()
+    except Exception as e:
+        print(f"Webhook outbox index migration error: {e}")
+        return False
+
+    # 11. Local Drive metadata index and its changes page token
+    try:
+        db = SessionLocal()
+        print("Checking if mercadolibre.drive_files / drive_sync_state tables exist...")
+        db.execute(text("""
+            CREATE TABLE IF NOT EXISTS mercadolibre.drive_files (
+                id VARCHAR(128) PRIMARY KEY,
+                parent_id VARCHAR(128),
+                name VARCHAR(500),
+                mime_type VARCHAR(255),
+                size BIGINT,
+                md5 VARCHAR(64),
+                modified_time DATETIME,
+                thumbnail_link TEXT,
+                web_view_link VARCHAR(500),
+                web_content_link VARCHAR(500),
+                synced_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_drive_files_parent (parent_id, modified_time)
+            )
+        """))
+        db.execute(text("""
+            CREATE TABLE IF NOT EXISTS mercadolibre.drive_sync_state (
+                name VARCHAR(50) PRIMARY KEY,
+                page_token VARCHAR(255),
+                full_sync_at DATETIME,
+                synced_at DATETIME
+            )
+        """))
+        db.commit()
+        db.close()
+        print("[OK] Drive index tables verified/created")
+    except Exception as e:
+        print(f"Drive index tables migration error: {e}")
+        return False
+
+    # 12. Selling batch tracking: recalculation stamp and persisted batches
+    # ON UPDATE only fires when a value changes, so a recalculation with the
+    # same result is stamped by a BEFORE UPDATE trigger.
+    try:
+        db = SessionLocal()
+        print("Checking for 'calculated_at' in 'mercadolibre.selling_calculation'...")
+        result = db.execute(text("""
+            SELECT count(*)
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = 'mercadolibre'
+            AND TABLE_NAME = 'selling_calculation'
+            AND COLUMN_NAME = 'calculated_at'
+        """))
+        if result.scalar() == 0:
+            print("Auto-migration: Adding calculated_at column to mercadolibre.selling_calculation...")
+            db.execute(text("""
+                ALTER TABLE mercadolibre.selling_calculation
+                ADD COLUMN calculated_at DATETIME(6) NULL
+                    DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)
+            """))
+            db.commit()
+            print("[OK] Added calculated_at column")
+
+        result = db.execute(text("""
+            SELECT count(*)
+            FROM INFORMATION_SCHEMA.TRIGGERS
+            WHERE TRIGGER_SCHEMA = 'mercadolibre'
+            AND TRIGGER_NAME = 'selling_calculation_stamp'
+        """))
+        if result.scalar() == 0:
+            try:
+                db.execute(text("""
+                    CREATE TRIGGER mercadolibre.selling_calculation_stamp
+                    BEFORE UPDATE ON mercadolibre.selling_calculation
+                    FOR EACH ROW SET NEW.calculated_at = CURRENT_TIMESTAMP(6)
+                """))
+                db.commit()
+                print("[OK] Added selling_calculation_stamp trigger")
+            except Exception as e:
+                db.rollback()
+                print(f"WARNING: could not create selling_calculation_stamp trigger "
+                      f"(unchanged recalculations won't be seen by batch status): {e}")
+
+        db.execute(text("""
+            CREATE TABLE IF NOT EXISTS mercadolibre.selling_batches (
+                id VARCHAR(36) PRIMARY KEY,
+                item_ids MEDIUMTEXT,
+                sent_at DATETIME(6),
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_selling_batches_created_at (created_at)
+            )
+        """))
+        db.commit()
+        db.close()
+        print("[OK] Selling batch tables verified/created")
+        return True
+    except Exception as e:
+        print(f"Selling batch migration error: {e}")
+        return False
+
 if __name__ == "__main__":
     run_migrations()
 
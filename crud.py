@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, distinct, asc, desc, func
+from sqlalchemy import or_, and_, distinct, asc, desc, func
 from models import Product, User, ScrappedCompetence, TiendaNubeProductStatus, TiendaNubeAttribute
 from schemas import UserCreate
 
@@ -23,6 +23,14 @@ def get_product(db: Session, product_id: int):
         p.tienda_nube_url = url
     return p
 
+def get_product_drive_urls(db: Session, product_ids):
+    """{product_id: drive_url} for many products in one query (products without a URL are skipped)."""
+    rows = db.query(Product.id, Product.drive_url).filter(
+        Product.id.in_(product_ids),
+        Product.drive_url.isnot(None)
+    ).all()
+    return {row.id: row.drive_url for row in rows if row.drive_url}
+
 def get_products(db: Session, skip: int = 0, limit: int = 50, 
                  category: str = None, brand: str = None, 
                  search: str = None,
@@ -267,11 +275,60 @@ def get_brands(db: Session):
 
 # --- Competence CRUD ---
 
+_COMPETENCE_COUNTS_CACHE = {}
+_COMPETENCE_COUNTS_TTL_SECONDS = 15
+
+def invalidate_competence_counts():
+    """Drop cached competence counters (call after any write to scrapped_competence)."""
+    _COMPETENCE_COUNTS_CACHE.clear()
+
+def get_competence_counts(db: Session, search: str = None, status: str = None):
+    """Filtered total plus per-status counters in a single grouped query.
+
+    Rows are grouped by status; each group reports its full size and how many of
+    its rows match the listing filters, so one round-trip yields everything."""
+    import time
+    from sqlalchemy import case
+
+    cache_key = (search, status)
+    cached = _COMPETENCE_COUNTS_CACHE.get(cache_key)
+    if cached and time.time() < cached[1]:
+        return cached[0]
+
+    filters = [ScrappedCompetence.catalog_link != '', ScrappedCompetence.catalog_link != None]
+    if status:
+        filters.append(ScrappedCompetence.status == status)
+    if search:
+        filters.append(or_(
+            ScrappedCompetence.title.ilike(f"%{search}%"),
+            ScrappedCompetence.competitor.ilike(f"%{search}%"),
+            ScrappedCompetence.product_name.ilike(f"%{search}%"),
+            ScrappedCompetence.product_code.ilike(f"%{search}%")
+        ))
+
+    rows = db.query(
+        ScrappedCompetence.status,
+        func.count().label("status_count"),
+        func.sum(case((and_(*filters), 1), else_=0)).label("matching_count")
+    ).group_by(ScrappedCompetence.status).all()
+
+    counts = {"total": 0, "pending_count": 0, "completed_count": 0, "error_count": 0}
+    for row_status, status_count, matching_count in rows:
+        counts["total"] += int(matching_count or 0)
+        if row_status is None or row_status == 'pending':
+            counts["pending_count"] += status_count
+        elif row_status == 'completed':
+            counts["completed_count"] += status_count
+        elif row_status == 'error':
+            counts["error_count"] += status_count
+
+    _COMPETENCE_COUNTS_CACHE[cache_key] = (counts, time.time() + _COMPETENCE_COUNTS_TTL_SECONDS)
+    return counts
+
 def get_competence_items(db: Session, skip: int = 0, limit: int = 100,
                          search: str = None, status: str = None):
     """Get competition scraping entries with optional search and filter."""
     from models import Product, SellingCalculation
-    from sqlalchemy import cast, String
     
     query = db.query(
         ScrappedCompetence, 
@@ -279,7 +336,7 @@ def get_competence_items(db: Session, skip: int = 0, limit: int = 100,
     ).outerjoin(
         Product, ScrappedCompetence.product_code == Product.product_code
     ).outerjoin(
-        SellingCalculation, cast(Product.id, String) == SellingCalculation.item_id
+        SellingCalculation, SellingCalculation.item_id_int == Product.id
     ).filter(
         (ScrappedCompetence.catalog_link != '') & 
         (ScrappedCompetence.catalog_link != None)
@@ -296,7 +353,6 @@ def get_competence_items(db: Session, skip: int = 0, limit: int = 100,
             ScrappedCompetence.product_code.ilike(f"%{search}%")
         ))
         
-    total = query.count()
     results = query.order_by(desc(ScrappedCompetence.timestamp)).offset(skip).limit(limit).all()
     
     # Map results into dictionaries to ensure extra fields are preserved for Pydantic
@@ -311,25 +367,153 @@ def get_competence_items(db: Session, skip: int = 0, limit: int = 100,
         item_dict["auto_meli_cost"] = auto_cost
         items.append(item_dict)
     
-    # Counts by status
-    pending_count = db.query(ScrappedCompetence).filter(
-        (ScrappedCompetence.status == None) | (ScrappedCompetence.status == 'pending')
-    ).count()
-    completed_count = db.query(ScrappedCompetence).filter(
-        ScrappedCompetence.status == 'completed'
-    ).count()
-    error_count = db.query(ScrappedCompetence).filter(
-        ScrappedCompetence.status == 'error'
-    ).count()
+    # Total and counts by status (one grouped query, briefly cached)
+    counts = get_competence_counts(db, search=search, status=status)
     
     return {
         "items": items,
-        "total": total,
-        "pending_count": pending_count,
-        "completed_count": completed_count,
-        "error_count": error_count
+        **counts
     }
 
+COMPETENCE_RECALC_OVERRIDES = (
+    'ml_commision_percentage', 'estimated_returns_percentage', 'shipping_cost',
+    'packaging_cost', 'advertising_cost', 'withholdings_gross_income_tax', 'financial_cost'
+)
+
+def recalculate_competence_margins(db: Session, overrides: dict, product_codes: list = None,
+                                   search: str = None, status: str = None, batch_size: int = 500):
+    """Apply parameter overrides and recompute all derived cost/margin columns in bulk.
+
+    Uses the same formula as the single-item PATCH, expressed as one UPDATE
+    statement per batch of product codes so thousands of rows are recomputed
+    server-side without loading them into Python."""
+    from sqlalchemy import update, literal, case
+
+    sc = ScrappedCompetence
+    overrides = {k: v for k, v in overrides.items() if k in COMPETENCE_RECALC_OVERRIDES and v is not None}
+
+    def param(name):
+        # Overrides enter as literals so no assignment depends on another
+        # column of the same UPDATE (MySQL evaluates SET left to right).
+        if name in overrides:
+            return literal(overrides[name])
+        return func.coalesce(getattr(sc, name), 0)
+
+    selling_price = func.coalesce(sc.selling_price, 0)
+    product_cost = func.coalesce(sc.product_cost, 0)
+    ml_comm = selling_price * param('ml_commision_percentage') / 100
+    ret_cost = selling_price * param('estimated_returns_percentage') / 100
+    total = (product_cost + ml_comm + param('shipping_cost') + param('packaging_cost')
+             + param('advertising_cost') + ret_cost + param('withholdings_gross_income_tax')
+             + param('financial_cost'))
+    profit = selling_price - total
+
+    values = dict(overrides)
+    values.update({
+        'ml_commision': ml_comm,
+        'returns_cost': ret_cost,
+        'total_costs': total,
+        'net_profit': profit,
+        'net_margin_percentage': case((selling_price > 0, profit * 100 / selling_price), else_=0),
+        'markup_percentage': case((product_cost > 0, profit * 100 / product_cost), else_=0),
+    })
+
+    # Resolve the target set once, then update it in batches
+    query = db.query(sc.product_code).filter(sc.catalog_link != '', sc.catalog_link != None)
+    if product_codes:
+        query = query.filter(sc.product_code.in_(product_codes))
+    if status:
+        query = query.filter(sc.status == status)
+    if search:
+        query = query.filter(or_(
+            sc.title.ilike(f"%{search}%"),
+            sc.competitor.ilike(f"%{search}%"),
+            sc.product_name.ilike(f"%{search}%"),
+            sc.product_code.ilike(f"%{search}%")
+        ))
+    codes = [row[0] for row in query.all()]
+
+    updated = 0
+    batches = 0
+    try:
+        for i in range(0, len(codes), batch_size):
+            chunk = codes[i:i + batch_size]
+            result = db.execute(
+                update(sc).where(sc.product_code.in_(chunk)).values(**values),
+                execution_options={"synchronize_session": False}
+            )
+            db.commit()
+            updated += result.rowcount
+            batches += 1
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if batches:
+            invalidate_competence_counts()
+
+    return {"matched": len(codes), "updated": updated, "batches": batches}
+
+COMPETENCE_PRICE_SOURCES = {
+    "selling_price": "c.selling_price",
+    "competitor_price": "c.price",
+}
+
+def apply_competence_prices(db: Session, product_codes: list, source: str = "selling_price",
+                            adjustment_percentage: float = None, dry_run: bool = False):
+    """Copy competence-driven prices to the catalog for many items in one joined UPDATE.
+
+    Sets price_mercadolibre, marks it as manually changed and stamps
+    price_meli_updated_at. Rows whose price would not change are left alone.
+    With dry_run the same join is only SELECTed and returned as a diff."""
+    from sqlalchemy import text, bindparam
+
+    if source not in COMPETENCE_PRICE_SOURCES:
+        raise ValueError(f"Invalid price source: {source}")
+    if not product_codes:
+        return {"dry_run": dry_run, "updated": 0, "changes": []}
+
+    # Cents kept, like the per-item PATCH /api/competence/item sync
+    new_price = f"ROUND({COMPETENCE_PRICE_SOURCES[source]} * (1 + :adjustment / 100), 2)"
+    join_and_filter = f"""
+        FROM product_catalog_sync p
+        JOIN mercadolibre.scrapped_competence c ON c.product_code = p.product_code
+        WHERE c.product_code IN :codes
+          AND {new_price} > 0
+          AND (p.price_mercadolibre IS NULL OR p.price_mercadolibre != {new_price})
+    """
+    params = {"codes": list(set(product_codes)), "adjustment": adjustment_percentage or 0}
+
+    diff_sql = text(f"""
+        SELECT p.id AS product_id, p.product_code, p.product_name,
+               p.price_mercadolibre AS current_price, {new_price} AS new_price
+        {join_and_filter}
+        ORDER BY p.product_code
+    """).bindparams(bindparam("codes", expanding=True))
+    changes = [dict(r._mapping) for r in db.execute(diff_sql, params).fetchall()]
+
+    if dry_run or not changes:
+        return {"dry_run": dry_run, "updated": 0, "changes": changes}
+
+    update_sql = text(f"""
+        UPDATE product_catalog_sync p
+        JOIN mercadolibre.scrapped_competence c ON c.product_code = p.product_code
+        SET p.price_mercadolibre = {new_price},
+            p.mercadolibre_price_manually_changed = 1,
+            p.price_meli_updated_at = NOW()
+        WHERE c.product_code IN :codes
+          AND {new_price} > 0
+          AND (p.price_mercadolibre IS NULL OR p.price_mercadolibre != {new_price})
+    """).bindparams(bindparam("codes", expanding=True))
+    try:
+        result = db.execute(update_sql, params)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return {"dry_run": False, "updated": result.rowcount, "changes": changes}
+
 def get_competence_item_by_code(db: Session, product_code: str):
     return db.query(ScrappedCompetence).filter(ScrappedCompetence.product_code == product_code).first()
 
@@ -373,6 +557,7 @@ def create_competence_item(db: Session, url: str, product_code: str = None, prod
             "ts": datetime.now()
         })
         db.commit()
+        invalidate_competence_counts()
         
         # Fetch back for return (optional, standard ORM fetch)
         return db.query(ScrappedCompetence).filter(ScrappedCompetence.product_code == effective_code).first()
@@ -380,6 +565,80 @@ def create_competence_item(db: Session, url: str, product_code: str = None, prod
         db.rollback()
         raise e
 
+def bulk_create_competence_items(db: Session, rows: list, chunk_size: int = 500):
+    """Create many competence entries at once.
+
+    rows: dicts with catalog_link (or url), product_code and product_name.
+    Duplicates are removed in memory, existing catalog_links / product_codes
+    are filtered with one set-based query, and the rest is written with
+    multi-row INSERTs of `chunk_size` rows."""
+    from sqlalchemy import insert
+    from datetime import datetime
+
+    stats = {"created": 0, "skipped": 0, "skipped_duplicates": 0, "skipped_existing": 0, "skipped_invalid": 0}
+
+    # 1. Normalize (product_code falls back to the URL tail, as in create_competence_item)
+    normalized = []
+    for row in rows:
+        url = (row.get("catalog_link") or row.get("url") or "").strip()
+        if not url:
+            stats["skipped_invalid"] += 1
+            continue
+        normalized.append({
+            "product_code": (row.get("product_code") or "").strip() or url.split('/')[-1][:50],
+            "catalog_link": url,
+            "product_name": (row.get("product_name") or "").strip()
+        })
+
+    # 2. Find what is already tracked with one set-based query
+    existing_codes, existing_urls = set(), set()
+    if normalized:
+        existing = db.query(ScrappedCompetence.product_code, ScrappedCompetence.catalog_link).filter(or_(
+            ScrappedCompetence.catalog_link.in_({r["catalog_link"] for r in normalized}),
+            ScrappedCompetence.product_code.in_({r["product_code"] for r in normalized})
+        )).all()
+        existing_codes = {r[0] for r in existing}
+        existing_urls = {r[1] for r in existing}
+
+    # Dedupe in memory by URL and by product_code (the table's PK)
+    candidates = []
+    seen_urls, seen_codes = set(), set()
+    for r in normalized:
+        if r["product_code"] in existing_codes or r["catalog_link"] in existing_urls:
+            stats["skipped_existing"] += 1
+        elif r["catalog_link"] in seen_urls or r["product_code"] in seen_codes:
+            stats["skipped_duplicates"] += 1
+        else:
+            seen_urls.add(r["catalog_link"])
+            seen_codes.add(r["product_code"])
+            candidates.append(r)
+
+    # 3. Multi-row INSERTs in chunks (same defaults as create_competence_item)
+    now = datetime.now()
+    try:
+        for i in range(0, len(candidates), chunk_size):
+            chunk = [
+                {
+                    **c,
+                    "status": "pending", "title": "", "price": 0, "competitor": "",
+                    "price_in_installments": "", "image": "", "timestamp": now,
+                    "api_cost_total": 0, "remaining_credits": 0
+                }
+                for c in candidates[i:i + chunk_size]
+            ]
+            db.execute(insert(ScrappedCompetence.__table__).values(chunk))
+            db.commit()
+            stats["created"] += len(chunk)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if stats["created"]:
+            invalidate_competence_counts()
+
+    stats["skipped"] = stats["skipped_duplicates"] + stats["skipped_existing"] + stats["skipped_invalid"]
+    return stats
+
 def delete_competence_item(db: Session, product_code: str):
     """Delete a competence entry by product_code."""
     try:
@@ -387,6 +646,7 @@ def delete_competence_item(db: Session, product_code: str):
         sql = text("DELETE FROM mercadolibre.scrapped_competence WHERE product_code = :code")
         result = db.execute(sql, {"code": product_code})
         db.commit()
+        invalidate_competence_counts()
         return result.rowcount > 0
     except Exception as e:
         print(f"Error in delete: {e}")
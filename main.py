@@ -1,5 +1,6 @@
 import sys
 import os
+import threading
 from typing import Optional, List, Dict, Any
 
 print("DEBUG: Starting main.py", file=sys.stderr)
@@ -21,7 +22,7 @@ except Exception as e:
     raise
 
 try:
-    from routers import products, metadata, auth, competence, prompts, drive_auth, selling, performance, orders
+    from routers import products, metadata, auth, competence, prompts, drive_auth, selling, performance, orders, webhooks
     print("DEBUG: Imported routers", file=sys.stderr)
 except Exception as e:
     print(f"ERROR: Failed to import routers: {e}", file=sys.stderr)
@@ -81,6 +82,7 @@ async def add_performance_headers(request, call_next):
 
 # Include routers
 app.include_router(products.router)
+app.include_router(products.public_router)
 app.include_router(metadata.router)
 app.include_router(auth.router)
 app.include_router(competence.router)
@@ -89,6 +91,7 @@ app.include_router(drive_auth.router)
 app.include_router(selling.router)
 app.include_router(performance.router)
 app.include_router(orders.router)
+app.include_router(webhooks.router)
 
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
@@ -310,6 +313,58 @@ def startup_tasks():
     except Exception as e:
         print(f"Error during startup tasks: {e}")
 
+    try:
+        from services.dashboard_warmer import start_dashboard_warmer
+        start_dashboard_warmer()
+    except Exception as e:
+        print(f"Error starting dashboard warmer: {e}")
+
+    try:
+        from services.price_history import start_price_history_capture
+        start_price_history_capture()
+    except Exception as e:
+        print(f"Error starting price history capture: {e}")
+
+    try:
+        from services.drive_index import start_drive_index_sync
+        start_drive_index_sync()
+    except Exception as e:
+        print(f"Error starting Drive index sync: {e}")
+
+    if os.getenv("DRIVE_STARTUP_BENCHMARK", "0") == "1":
+        def drive_benchmark():
+            try:
+                from services.drive_service import benchmark_drive_client
+                print(f"Drive client startup benchmark: {benchmark_drive_client()}")
+            except Exception as e:
+                print(f"Drive client benchmark error: {e}")
+        # Off the startup path: warms Drive credentials while the app starts serving
+        threading.Thread(target=drive_benchmark, name="drive-benchmark", daemon=True).start()
+
+@app.on_event("startup")
+async def start_async_workers():
+    """Start workers that live on the event loop"""
+    try:
+        from services.webhook_outbox import start_outbox_workers
+        start_outbox_workers()
+    except Exception as e:
+        print(f"Error starting webhook outbox workers: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_tasks():
+    """Stop outbox workers and close pooled outbound HTTP connections"""
+    try:
+        from services.webhook_outbox import stop_outbox_workers
+        await stop_outbox_workers()
+    except Exception as e:
+        print(f"Error stopping webhook outbox workers: {e}")
+
+    try:
+        from services.http_client import close_client
+        await close_client()
+    except Exception as e:
+        print(f"Error closing HTTP client: {e}")
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8080))
     uvicorn.run(app, host="0.0.0.0", port=port, reload=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Numeric, DateTime, Float, JSON
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, Text, Numeric, DateTime, Float, JSON, Computed, Index
 from datetime import datetime
 from db_conn import Base
 
@@ -115,11 +115,123 @@ class ScrappedCompetence(Base):
     markup_percentage = Column(Numeric(10, 2))
 
 
+class Competitor(Base):
+    """Dictionary of competitor names so history rows only carry a small int."""
+    __tablename__ = "competitors"
+    __table_args__ = {'schema': 'mercadolibre'}
+
+    id = Column(SmallInteger, primary_key=True, autoincrement=True)
+    name = Column(String(100), unique=True)
+
+
+class CompetencePriceHistory(Base):
+    """Append-only competitor price points, one row per (product_code, scrape timestamp)."""
+    __tablename__ = "competence_price_history"
+    __table_args__ = {'schema': 'mercadolibre'}
+
+    product_code = Column(String(100), primary_key=True)
+    ts = Column(DateTime, primary_key=True)
+    price_cents = Column(BigInteger)
+    competitor_id = Column(SmallInteger)
+
+
+class WebhookDelivery(Base):
+    """Outbox row: a webhook written in the same transaction as the change that triggers it."""
+    __tablename__ = "webhook_outbox"
+    __table_args__ = (
+        Index('idx_webhook_outbox_coalesce', 'item_id', 'event_type', 'site', 'status'),
+        {'schema': 'mercadolibre'}
+    )
+
+    id = Column(String(36), primary_key=True)  # delivery id returned to the client
+    event_type = Column(String(50))
+    item_id = Column(String(255))
+    site = Column(String(50))
+    url = Column(String(500))
+    payload = Column(Text)  # JSON body
+    status = Column(String(20), default="pending")  # pending, sending, delivered, dead
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    claimed_by = Column(String(36))
+    claimed_at = Column(DateTime)
+    last_error = Column(String(1000))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    delivered_at = Column(DateTime)
+
+
+class DriveFile(Base):
+    """Local copy of Drive file metadata, kept in sync with the Drive changes feed."""
+    __tablename__ = "drive_files"
+    __table_args__ = (
+        Index('idx_drive_files_parent', 'parent_id', 'modified_time'),
+        {'schema': 'mercadolibre'}
+    )
+
+    id = Column(String(128), primary_key=True)  # Drive file id
+    parent_id = Column(String(128))
+    name = Column(String(500))
+    mime_type = Column(String(255))
+    size = Column(BigInteger)
+    md5 = Column(String(64))
+    modified_time = Column(DateTime)
+    thumbnail_link = Column(Text)
+    web_view_link = Column(String(500))
+    web_content_link = Column(String(500))
+    synced_at = Column(DateTime, default=datetime.utcnow)
+
+
+class DriveSyncState(Base):
+    """Persisted Drive changes page token."""
+    __tablename__ = "drive_sync_state"
+    __table_args__ = {'schema': 'mercadolibre'}
+
+    name = Column(String(50), primary_key=True)
+    page_token = Column(String(255))
+    full_sync_at = Column(DateTime)
+    synced_at = Column(DateTime)
+
+
+class ScrapeJob(Base):
+    __tablename__ = "scrape_jobs"
+    __table_args__ = {'schema': 'mercadolibre'}
+
+    id = Column(String(36), primary_key=True)
+    policy = Column(String(100))  # 'codes' or 'stale:<hours>h'
+    status = Column(String(50), default="queued")  # queued, dispatching, running, completed, partial, failed
+    total_items = Column(Integer, default=0)
+    dispatched_items = Column(Integer, default=0)
+    completed_items = Column(Integer, default=0)
+    failed_items = Column(Integer, default=0)
+    error = Column(String(1000))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ScrapeJobItem(Base):
+    __tablename__ = "scrape_job_items"
+    __table_args__ = {'schema': 'mercadolibre'}
+
+    job_id = Column(String(36), primary_key=True)
+    product_code = Column(String(100), primary_key=True)
+    status = Column(String(50), default="queued")  # queued, dispatched, completed, failed
+    attempts = Column(Integer, default=0)
+    error = Column(String(1000))
+    dispatched_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+
 class SellingCalculation(Base):
     __tablename__ = "selling_calculation"
     __table_args__ = {'schema': 'mercadolibre'}
 
     item_id = Column(String(50), primary_key=True)
+    # Integer shadow of item_id (product_catalog_sync.id) so joins don't need a CAST.
+    # Generated by MySQL on every write from the external calculator (see auto_migrate).
+    item_id_int = Column(
+        BigInteger,
+        Computed("IF(item_id REGEXP '^[0-9]+$', CAST(item_id AS UNSIGNED), NULL)", persisted=True),
+        index=True
+    )
     category_id = Column(String(50))
     sale_fee_amount = Column(Float)
     fixed_fee = Column(Float)
@@ -133,6 +245,19 @@ class SellingCalculation(Base):
     ship_discount = Column(Float)
     ship_cost_full_amount = Column(Float)
     total_selling_cost = Column(Float)
+    # Stamped by MySQL on every insert/update of the row (see auto_migrate)
+    calculated_at = Column(DateTime)
+
+
+class SellingBatch(Base):
+    """A batch of selling-cost recalculations, tracked until its rows are recalculated."""
+    __tablename__ = "selling_batches"
+    __table_args__ = {'schema': 'mercadolibre'}
+
+    id = Column(String(36), primary_key=True)
+    item_ids = Column(Text)  # JSON list of product_catalog_sync ids
+    sent_at = Column(DateTime)  # database time just before the webhooks were sent
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 
 class Prompt(Base):
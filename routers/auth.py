@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form
+from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form, Header
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.responses import Response
 from sqlalchemy.orm import Session
@@ -7,6 +7,8 @@ from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import os
+import time
+import asyncio
 
 import crud, models, schemas
 from db_conn import get_db
@@ -112,28 +114,99 @@ LOGO_FILENAMES = {
     "favicon": "app_logo_favicon",
 }
 
+LOGO_CACHE_TTL_SECONDS = int(os.getenv("LOGO_CACHE_TTL_SECONDS", "3600"))
+_LOGO_MISSING_TTL_SECONDS = 300
+
+# Latest file of every logo type, from a single files.list: {"files": {logo_type: file or None}, "expire_at"}
+_LOGO_FILES_CACHE = {}
+
+def _get_logo_files(service, folder_id, force=False):
+    """Resolve all logo types with one Drive query (cached, shared by /logo and /public-settings)."""
+    from services import drive_index
+
+    if not force and _LOGO_FILES_CACHE and _LOGO_FILES_CACHE["expire_at"] > time.time():
+        return _LOGO_FILES_CACHE["files"]
+
+    if not force and drive_index.is_ready():
+        files = drive_index.find_files(folder_id, name_contains=list(LOGO_FILENAMES.values()))
+    else:
+        name_filter = " or ".join(f"name contains '{prefix}'" for prefix in LOGO_FILENAMES.values())
+        query = f"({name_filter}) and '{folder_id}' in parents and trashed = false"
+        files = service.files().list(
+            q=query,
+            fields="files(id, name, mimeType)",
+            orderBy="modifiedTime desc",  # Most recent first
+            pageSize=50
+        ).execute().get('files', [])
+
+    found = {logo_type: None for logo_type in LOGO_FILENAMES}
+    for f in files:
+        for logo_type, prefix in LOGO_FILENAMES.items():
+            if found[logo_type] is None and prefix in f.get('name', ''):
+                found[logo_type] = f
+
+    ttl = LOGO_CACHE_TTL_SECONDS if all(found.values()) else _LOGO_MISSING_TTL_SECONDS
+    _LOGO_FILES_CACHE.update({"files": found, "expire_at": time.time() + ttl})
+    return found
+
 def _find_logo_file(service, logo_type, folder_id):
-    """Search Drive for a logo file by its fixed prefix name."""
-    prefix = LOGO_FILENAMES.get(logo_type)
-    if not prefix:
+    """Most recent Drive file of a logo type (None if not uploaded)."""
+    return _get_logo_files(service, folder_id).get(logo_type)
+
+def _public_logo_urls(files):
+    result = {}
+    for logo_type in ["light", "dark", "favicon"]:
+        key = f"logo_{logo_type}_url" if logo_type != "favicon" else "favicon_url"
+        result[key] = f"/logo/{logo_type}" if files.get(logo_type) else None
+    return result
+
+def _load_public_settings():
+    from services import drive_service
+
+    service = drive_service.get_drive_service()
+    if not service:
+        return None
+    return _public_logo_urls(_get_logo_files(service, drive_service.ROOT_FOLDER_ID))
+
+# In-memory logo cache: logo_type -> {"file_id", "mime_type", "content", "etag", "expire_at"}
+# (content None = no logo uploaded). Invalidated by upload_logo.
+_LOGO_CACHE = {}
+
+def invalidate_logo_cache(logo_type: Optional[str] = None):
+    _LOGO_FILES_CACHE.clear()
+    if logo_type:
+        _LOGO_CACHE.pop(logo_type, None)
+    else:
+        _LOGO_CACHE.clear()
+
+def _load_logo(logo_type):
+    """Resolve and download a logo from Drive into the cache (blocking; run in a thread)."""
+    from services import drive_service
+    import hashlib
+
+    service = drive_service.get_drive_service()
+    if not service:
         return None
-    
-    # Search for files starting with our prefix
-    query = f"name contains '{prefix}' and '{folder_id}' in parents and trashed = false"
-    results = service.files().list(
-        q=query, 
-        fields="files(id, name, mimeType)",
-        orderBy="modifiedTime desc",  # Most recent first
-        pageSize=5
-    ).execute()
-    
-    files = results.get('files', [])
-    if files:
-        return files[0]  # Return the most recent one
-    return None
+
+    logo_file = _find_logo_file(service, logo_type, drive_service.ROOT_FOLDER_ID)
+    if not logo_file:
+        entry = {"file_id": None, "mime_type": None, "content": None, "etag": None,
+                 "expire_at": time.time() + _LOGO_MISSING_TTL_SECONDS}
+    else:
+        content = service.files().get_media(fileId=logo_file['id']).execute()
+        entry = {
+            "file_id": logo_file['id'],
+            "mime_type": logo_file.get('mimeType', 'image/png'),
+            "content": content,
+            "etag": f'"{hashlib.md5(content).hexdigest()}"',
+            "expire_at": time.time() + LOGO_CACHE_TTL_SECONDS
+        }
+    _LOGO_CACHE[logo_type] = entry
+    return entry
 
 def _delete_old_logos(service, logo_type, folder_id):
     """Delete ALL old versions of a logo type to prevent duplicates."""
+    from services import drive_index
     prefix = LOGO_FILENAMES.get(logo_type)
     if not prefix:
         return
@@ -144,6 +217,7 @@ def _delete_old_logos(service, logo_type, folder_id):
     for f in results.get('files', []):
         try:
             service.files().delete(fileId=f['id']).execute()
+            drive_index.forget(f['id'])
             print(f"Deleted old logo: {f['name']} ({f['id']})")
         except Exception as e:
             print(f"Warning: Could not delete old logo {f['id']}: {e}")
@@ -195,6 +269,7 @@ async def upload_logo(
         
         file_id = uploaded_file.get('id')
         proxy_url = f"/logo/{logo_type}"
+        invalidate_logo_cache(logo_type)
         
         print(f"Logo '{logo_type}' uploaded: {filename} (ID: {file_id})")
         
@@ -214,31 +289,25 @@ async def upload_logo(
 
 
 @router.get("/logo/{logo_type}")
-async def get_logo_content(logo_type: str):
-    """Serve logo image from Drive. Searches by fixed filename — no JSON needed."""
+async def get_logo_content(logo_type: str, if_none_match: Optional[str] = Header(None)):
+    """Serve logo image. Bytes are cached in memory (Drive is only hit on a miss or after the TTL)."""
+    if logo_type not in LOGO_FILENAMES:
+        return Response(status_code=404)
     try:
-        from services import drive_service
-        
-        service = drive_service.get_drive_service()
-        if not service:
-            return Response(status_code=503, content=b"Drive unavailable")
-        
-        folder_id = drive_service.ROOT_FOLDER_ID
-        
-        # Find the logo file by name
-        logo_file = _find_logo_file(service, logo_type, folder_id)
-        if not logo_file:
+        entry = _LOGO_CACHE.get(logo_type)
+        if not entry or entry["expire_at"] < time.time():
+            entry = await asyncio.to_thread(_load_logo, logo_type)
+            if entry is None:
+                return Response(status_code=503, content=b"Drive unavailable")
+
+        if entry["content"] is None:
             return Response(status_code=404)
-        
-        file_id = logo_file['id']
-        mime_type = logo_file.get('mimeType', 'image/png')
-        
-        # Download content
-        content = service.files().get_media(fileId=file_id).execute()
-        
-        # Cache for 1 hour
-        headers = {"Cache-Control": "public, max-age=3600"}
-        return Response(content=content, media_type=mime_type, headers=headers)
+
+        # Cache for 1 hour, then revalidate with the ETag
+        headers = {"Cache-Control": "public, max-age=3600", "ETag": entry["etag"]}
+        if if_none_match and entry["etag"] in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry["content"], media_type=entry["mime_type"], headers=headers)
         
     except Exception as e:
         print(f"Error serving logo '{logo_type}': {e}")
@@ -247,22 +316,14 @@ async def get_logo_content(logo_type: str):
 
 @router.get("/public-settings")
 async def get_public_settings():
-    """Return proxy URLs for available logos (public, no auth needed)."""
+    """Return proxy URLs for available logos (public, no auth needed). Served from memory once resolved."""
     try:
-        from services import drive_service
-        
-        service = drive_service.get_drive_service()
-        if not service:
+        if _LOGO_FILES_CACHE and _LOGO_FILES_CACHE["expire_at"] > time.time():
+            return _public_logo_urls(_LOGO_FILES_CACHE["files"])
+
+        result = await asyncio.to_thread(_load_public_settings)
+        if result is None:
             return {"logo_light_url": None, "logo_dark_url": None, "favicon_url": None}
-        
-        folder_id = drive_service.ROOT_FOLDER_ID
-        
-        result = {}
-        for logo_type in ["light", "dark", "favicon"]:
-            found = _find_logo_file(service, logo_type, folder_id)
-            key = f"logo_{logo_type}_url" if logo_type != "favicon" else "favicon_url"
-            result[key] = f"/logo/{logo_type}" if found else None
-        
         return result
         
     except Exception as e:
@@ -296,11 +357,8 @@ async def debug_drive():
         
         files = results.get('files', [])
         
-        # Also check what _find_logo_file returns for each type
-        search_results = {}
-        for t in ["light", "dark", "favicon"]:
-            found = _find_logo_file(service, t, folder_id)
-            search_results[t] = found
+        # Also check what the logo lookup resolves for each type (bypassing the cache)
+        search_results = _get_logo_files(service, folder_id, force=True)
         
         return {
             "folder_id": folder_id,
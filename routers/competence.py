@@ -1,11 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks, UploadFile, File
 from sqlalchemy.orm import Session
 from db_conn import get_db
 from routers.auth import get_current_user
 import crud
 import schemas
-from schemas import CompetenceCreate, CompetenceUpdate, CompetenceResponse, CompetenceListResponse
-from typing import Optional
+from schemas import CompetenceCreate, CompetenceUpdate, CompetenceResponse, CompetenceListResponse, CompetenceImportRequest, CompetenceImportResponse, CompetenceRecalculateRequest, CompetenceRecalculateResponse, CompetenceApplyPricesRequest, CompetenceApplyPricesResponse, ScrapeJobCreate, ScrapeJobResponse, PriceWindowStats, PriceSparklinePoint
+from services import scrape_jobs, price_history, http_client
+from typing import Optional, List
 
 router = APIRouter(
     prefix="/api/competence",
@@ -16,7 +17,6 @@ router = APIRouter(
 WEBHOOK_SCRAPPING_URL = "https://service--import-meli-competence-scrapper-402745694567.us-central1.run.app/webhooks/start_scrapping"
 WEBHOOK_SECRET = "mati-gordo"
 
-import httpx
 from sqlalchemy import text
 
 @router.get("/debug-permissions")
@@ -142,12 +142,13 @@ def update_competence_item(code: str, updates: CompetenceUpdate, db: Session = D
     update_data['net_margin_percentage'] = margin * 100 # Store as 0-100 for consistency if requested or fix UI
     update_data['markup_percentage'] = markup * 100
 
+    # selling_price is stored too, so bulk margin recalculation and
+    # /apply-prices (source "selling_price") use the price set here
     for key, value in update_data.items():
-        if key == 'selling_price':
-            continue
         setattr(item, key, value)
     
     db.commit()
+    crud.invalidate_competence_counts()
     db.refresh(item)
     
     # --- PRICE SYNC LOGIC (Inventory ONLY) ---
@@ -166,6 +167,46 @@ def update_competence_item(code: str, updates: CompetenceUpdate, db: Session = D
     return CompetenceResponse.model_validate(item)
 
 
+@router.post("/recalculate", response_model=CompetenceRecalculateResponse)
+def recalculate_competence_items(request: CompetenceRecalculateRequest, db: Session = Depends(get_db)):
+    """Apply global cost assumptions to a filtered set of items and recompute their margins in bulk."""
+    overrides = request.model_dump(include=set(crud.COMPETENCE_RECALC_OVERRIDES), exclude_none=True)
+    try:
+        result = crud.recalculate_competence_margins(
+            db,
+            overrides,
+            product_codes=request.product_codes,
+            search=request.search,
+            status=request.status
+        )
+        print(f"Bulk competence recalculation: {result} (overrides: {overrides})")
+        return CompetenceRecalculateResponse(**result)
+    except Exception as e:
+        print(f"Error recalculating competence items: {e}")
+        raise HTTPException(status_code=500, detail=f"Database Error: {str(e)}")
+
+
+@router.post("/apply-prices", response_model=CompetenceApplyPricesResponse)
+def apply_competence_prices(request: CompetenceApplyPricesRequest, db: Session = Depends(get_db)):
+    """Apply competence-driven prices to the catalog's MercadoLibre price for many items at once."""
+    if request.source not in crud.COMPETENCE_PRICE_SOURCES:
+        raise HTTPException(status_code=400, detail=f"source must be one of {list(crud.COMPETENCE_PRICE_SOURCES)}")
+    try:
+        result = crud.apply_competence_prices(
+            db,
+            request.product_codes,
+            source=request.source,
+            adjustment_percentage=request.adjustment_percentage,
+            dry_run=request.dry_run
+        )
+        if not request.dry_run:
+            print(f"Applied competence prices to {result['updated']} catalog products (source: {request.source})")
+        return CompetenceApplyPricesResponse(**result)
+    except Exception as e:
+        print(f"Error applying competence prices: {e}")
+        raise HTTPException(status_code=500, detail=f"Database Error: {str(e)}")
+
+
 @router.post("")
 def create_competence(request: CompetenceCreate, db: Session = Depends(get_db)):
     """Create a new competence entry. Only the catalog_link is required from the frontend."""
@@ -189,6 +230,50 @@ def create_competence(request: CompetenceCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Database Error: {str(e)}")
 
 
+@router.post("/import", response_model=CompetenceImportResponse)
+def import_competence(request: CompetenceImportRequest, db: Session = Depends(get_db)):
+    """Bulk-create competence entries from a JSON list of {catalog_link, product_code, product_name}."""
+    try:
+        result = crud.bulk_create_competence_items(db, [item.model_dump() for item in request.items])
+        return CompetenceImportResponse(**result)
+    except Exception as e:
+        print(f"Error importing competence items: {e}")
+        raise HTTPException(status_code=500, detail=f"Database Error: {str(e)}")
+
+
+@router.post("/import-csv", response_model=CompetenceImportResponse)
+def import_competence_csv(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    """Bulk-create competence entries from a CSV with url (or catalog_link), product_code and product_name columns."""
+    import csv
+    import io
+
+    # Sync handler (threadpool): parsing and the bulk insert don't block the event loop
+    raw = file.file.read()
+    try:
+        content = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        content = raw.decode("latin-1")
+    try:
+        dialect = csv.Sniffer().sniff(content[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+
+    reader = csv.DictReader(io.StringIO(content), dialect=dialect)
+    rows = [
+        {(k or "").strip().lower(): (v or "").strip() for k, v in row.items() if k}
+        for row in reader
+    ]
+    if not rows:
+        raise HTTPException(status_code=400, detail="CSV vacío o sin encabezados (url, product_code, product_name)")
+
+    try:
+        result = crud.bulk_create_competence_items(db, rows)
+        return CompetenceImportResponse(**result)
+    except Exception as e:
+        print(f"Error importing competence CSV: {e}")
+        raise HTTPException(status_code=500, detail=f"Database Error: {str(e)}")
+
+
 @router.delete("")
 def delete_competence(code: str = Query(..., description="Product code of the item to delete"), db: Session = Depends(get_db)):
     """Delete a competence entry by product code."""
@@ -207,20 +292,127 @@ def delete_competence(code: str = Query(..., description="Product code of the it
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/start-scraping")
-def start_scraping(db: Session = Depends(get_db)):
+async def start_scraping():
     """Trigger global competence scraping via webhook."""
     data = {
         "secret": WEBHOOK_SECRET
     }
     try:
-        with httpx.Client(timeout=60.0) as client:
-            response = client.post(WEBHOOK_SCRAPPING_URL, json=data)
-            print(f"Scraping webhook sent. Status: {response.status_code}")
-            
-            if not (200 <= response.status_code < 300):
-                raise HTTPException(status_code=500, detail=f"Webhook failed with status {response.status_code}")
-                
-            return {"status": "success", "message": "Scraping started"}
+        response = await http_client.post(
+            "scrapper", WEBHOOK_SCRAPPING_URL, json=data, budget=http_client.budget("competence.start_scraping")
+        )
+        print(f"Scraping webhook sent. Status: {response.status_code}")
+
+        if not (200 <= response.status_code < 300):
+            raise HTTPException(status_code=500, detail=f"Webhook failed with status {response.status_code}")
+
+        return {"status": "success", "message": "Scraping started"}
+    except http_client.CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"Error sending scraping webhook: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to trigger scraping: {str(e)}")
+
+
+# --- Scrape job queue (selected codes or stale items only) ---
+
+def _scrape_job_response(job) -> ScrapeJobResponse:
+    response = ScrapeJobResponse.model_validate(job)
+    response.dispatch_mode = scrape_jobs.DISPATCH_MODE
+    return response
+
+
+@router.post("/scrape-jobs", response_model=ScrapeJobResponse)
+def create_scrape_job(request: ScrapeJobCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Queue a scrape for the given product codes, or for stale/errored items when no codes are given."""
+    try:
+        if request.product_codes:
+            codes = request.product_codes[:request.limit] if request.limit else request.product_codes
+            policy = "codes"
+        else:
+            stale_hours = request.stale_hours if request.stale_hours is not None else 24
+            codes = scrape_jobs.select_stale_codes(
+                db, stale_hours=stale_hours, include_errors=request.include_errors, limit=request.limit
+            )
+            policy = f"stale:{stale_hours}h"
+
+        job = scrape_jobs.create_job(db, codes, policy)
+        if job.total_items:
+            background_tasks.add_task(scrape_jobs.dispatch_job, job.id, WEBHOOK_SCRAPPING_URL, WEBHOOK_SECRET)
+        print(f"Scrape job {job.id} queued with {job.total_items} items ({policy})")
+        return _scrape_job_response(job)
+    except Exception as e:
+        db.rollback()
+        print(f"Error creating scrape job: {e}")
+        raise HTTPException(status_code=500, detail=f"Database Error: {str(e)}")
+
+
+@router.get("/scrape-jobs", response_model=List[ScrapeJobResponse])
+def list_scrape_jobs(limit: int = Query(20, ge=1, le=100), db: Session = Depends(get_db)):
+    """List the most recent scrape jobs."""
+    from models import ScrapeJob
+    jobs = db.query(ScrapeJob).order_by(ScrapeJob.created_at.desc()).limit(limit).all()
+    return [_scrape_job_response(j) for j in jobs]
+
+
+@router.get("/scrape-jobs/{job_id}", response_model=ScrapeJobResponse)
+def get_scrape_job_progress(job_id: str, db: Session = Depends(get_db)):
+    """Progress counters of a scrape job (reconciled against scrapped_competence on read)."""
+    try:
+        job = scrape_jobs.refresh_job_progress(db, job_id)
+    except Exception as e:
+        db.rollback()
+        print(f"Error refreshing scrape job {job_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Database Error: {str(e)}")
+    if not job:
+        raise HTTPException(status_code=404, detail="Scrape job not found")
+    if job.completed_items:
+        crud.invalidate_competence_counts()
+    return _scrape_job_response(job)
+
+
+# --- Competitor price history ---
+
+@router.get("/price-history/stats", response_model=List[PriceWindowStats])
+def get_price_history_stats(
+    code: str = Query(..., description="Product code"),
+    windows: str = Query("7,30,90", description="Comma separated window sizes in days"),
+    db: Session = Depends(get_db)
+):
+    """Min/max/avg competitor price over trailing windows."""
+    try:
+        window_list = [int(w) for w in windows.split(",") if w.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="windows must be a comma separated list of integers")
+    try:
+        return price_history.window_stats(db, code, window_list)
+    except Exception as e:
+        print(f"Error reading price history stats for {code}: {e}")
+        raise HTTPException(status_code=500, detail=f"Database Error: {str(e)}")
+
+
+@router.get("/price-history/sparkline", response_model=List[PriceSparklinePoint])
+def get_price_history_sparkline(
+    code: str = Query(..., description="Product code"),
+    days: int = Query(30, ge=1, le=730),
+    points: int = Query(60, ge=1, le=price_history.MAX_SPARKLINE_POINTS),
+    db: Session = Depends(get_db)
+):
+    """Downsampled competitor price series for trend sparklines."""
+    try:
+        return price_history.sparkline(db, code, days=days, points=points)
+    except Exception as e:
+        print(f"Error reading price sparkline for {code}: {e}")
+        raise HTTPException(status_code=500, detail=f"Database Error: {str(e)}")
+
+
+@router.post("/price-history/capture")
+def capture_price_history(db: Session = Depends(get_db)):
+    """Append current scraped prices to the history now (normally done periodically)."""
+    try:
+        appended = price_history.capture_price_snapshots(db)
+        return {"status": "success", "appended": appended}
+    except Exception as e:
+        db.rollback()
+        print(f"Error capturing price history: {e}")
+        raise HTTPException(status_code=500, detail=f"Database Error: {str(e)}")
@@ -5,6 +5,9 @@ from fastapi import APIRouter, Request, HTTPException, Depends
 from fastapi.responses import RedirectResponse, JSONResponse
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
+from sqlalchemy.orm import Session
+from db_conn import get_db
+from routers.auth import get_current_user
 # import main  # Removed to fix circular import
 
 router = APIRouter(prefix="/api/drive", tags=["drive-auth"])
@@ -138,6 +141,10 @@ def auth_callback(request: Request, code: str, state: str = None):
             f.write(token_b64)
             
         print(f"DEBUG: Successfully updated {TOKEN_JSON_FILE} and {TOKEN_B64_FILE} via web flow")
+
+        # Drop cached credentials/services so the new token is used right away
+        from services.drive_service import reset_drive_service
+        reset_drive_service()
         
         # Guardar en base de datos de manera persistente
         try:
@@ -185,5 +192,22 @@ def debug_drive_config():
         if config:
             debug_info["client_id_exists"] = config.get('client_id') is not None
             debug_info["client_id_prefix"] = config.get('client_id')[:15] if config.get('client_id') else None
+
+    # Drive client startup timings (see services/drive_service.benchmark_drive_client)
+    from services.drive_service import STARTUP_BENCHMARK
+    debug_info["drive_client_benchmark"] = STARTUP_BENCHMARK
     
     return debug_info
+
+@router.get("/index")
+def drive_index_status():
+    """State of the local Drive metadata index (see services/drive_index)."""
+    from services import drive_index
+    return drive_index.status()
+
+@router.post("/index/resync")
+def drive_index_resync(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+    """Drop the changes page token; the background sync copies every file again (e.g. after switching Drive accounts)."""
+    from services import drive_index
+    drive_index.reset(db)
+    return {"status": "scheduled", "message": "The index will be copied again by the next sync pass"}
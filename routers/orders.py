@@ -18,7 +18,10 @@ from schemas import (
     TopCategoryItem
 )
 
+import os
+import threading
 import time
+from datetime import date, timedelta
 
 router = APIRouter(
     prefix="/api/orders",
@@ -28,6 +31,8 @@ router = APIRouter(
 
 _ORDERS_CACHE = {}
 _CACHE_TTL_SECONDS = 45
+_CACHE_MAX_ENTRIES = 500
+_CACHE_LOCK = threading.Lock()
 
 def get_from_cache(cache_key: str):
     if cache_key in _ORDERS_CACHE:
@@ -35,13 +40,21 @@ def get_from_cache(cache_key: str):
         if time.time() < expire_at:
             return val
         else:
-            del _ORDERS_CACHE[cache_key]
+            _ORDERS_CACHE.pop(cache_key, None)
     return None
 
 def set_in_cache(cache_key: str, value: any, ttl: int = _CACHE_TTL_SECONDS):
-    if len(_ORDERS_CACHE) > 500:
-        _ORDERS_CACHE.clear()
-    _ORDERS_CACHE[cache_key] = (value, time.time() + ttl)
+    with _CACHE_LOCK:
+        if len(_ORDERS_CACHE) >= _CACHE_MAX_ENTRIES and cache_key not in _ORDERS_CACHE:
+            # Drop expired entries, then the ones closest to expiring (warmed presets live longest)
+            now = time.time()
+            for key in [k for k, (_, expire_at) in _ORDERS_CACHE.items() if expire_at <= now]:
+                del _ORDERS_CACHE[key]
+            if len(_ORDERS_CACHE) >= _CACHE_MAX_ENTRIES:
+                by_expiry = sorted(_ORDERS_CACHE, key=lambda k: _ORDERS_CACHE[k][1])
+                for key in by_expiry[:len(_ORDERS_CACHE) - _CACHE_MAX_ENTRIES + 1]:
+                    del _ORDERS_CACHE[key]
+        _ORDERS_CACHE[cache_key] = (value, time.time() + ttl)
 
 def build_filter_clause_and_params(
     start_date: Optional[str] = None,
@@ -79,6 +92,212 @@ def build_filter_clause_and_params(
         
     return filter_clause, params
 
+def dashboard_cache_key(prefix: str, start_date, end_date, condition_item, status, category_id, search) -> str:
+    return f"{prefix}:{start_date}:{end_date}:{condition_item}:{status}:{category_id}:{search}"
+
+# --- Day-partitioned aggregates ---
+# Aggregates are stored per (kind, day, filter signature) so overlapping ranges
+# ("last 30 days" yesterday vs. today) reuse every day they have in common and
+# only the missing days are queried. Today's partition changes constantly and
+# is kept short-lived; closed days only change on late status updates.
+_PARTITION_CACHE = {}
+_PARTITION_MAX_ENTRIES = 20000
+_PARTITION_TODAY_TTL_SECONDS = _CACHE_TTL_SECONDS
+_PARTITION_PAST_TTL_SECONDS = int(os.getenv("ORDERS_PARTITION_TTL_SECONDS", "21600"))
+_PARTITION_MAX_DAYS = 400
+_PARTITION_LOCK = threading.Lock()
+
+_PARTITION_SQL = {
+    # Additive per-day KPIs (a venta_id belongs to a single created_at day)
+    "daily": """
+        SELECT 
+            DATE(created_at) as sales_date,
+            COUNT(DISTINCT venta_id) as sales_count,
+            COALESCE(SUM(quantity), 0) as quantity,
+            COALESCE(SUM(gross_price), 0) as revenue,
+            COALESCE(SUM(sale_fee), 0) as fee
+        FROM mercadolibre.v_orders_for_metrics
+        WHERE 1=1 {filter_clause}
+        GROUP BY DATE(created_at)
+    """,
+    "products": """
+        SELECT 
+            DATE(created_at) as sales_date,
+            title,
+            item_id,
+            SUM(quantity) as quantity,
+            SUM(gross_price) as revenue
+        FROM mercadolibre.v_orders_for_metrics
+        WHERE 1=1 {filter_clause}
+        GROUP BY DATE(created_at), title, item_id
+    """,
+    "categories": """
+        SELECT 
+            DATE(created_at) as sales_date,
+            category_id,
+            SUM(gross_price) as revenue
+        FROM mercadolibre.v_orders_for_metrics
+        WHERE 1=1 {filter_clause}
+        GROUP BY DATE(created_at), category_id
+    """,
+}
+
+def _parse_day(value: Optional[str]) -> Optional[date]:
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+def _set_partition(key: tuple, value, day: date):
+    ttl = _PARTITION_TODAY_TTL_SECONDS if day >= date.today() else _PARTITION_PAST_TTL_SECONDS
+    with _PARTITION_LOCK:
+        if len(_PARTITION_CACHE) >= _PARTITION_MAX_ENTRIES and key not in _PARTITION_CACHE:
+            # Drop expired entries, then the tenth closest to expiring (amortizes the sort)
+            now = time.time()
+            for k in [k for k, (_, expire_at) in _PARTITION_CACHE.items() if expire_at <= now]:
+                del _PARTITION_CACHE[k]
+            if len(_PARTITION_CACHE) >= _PARTITION_MAX_ENTRIES:
+                by_expiry = sorted(_PARTITION_CACHE, key=lambda k: _PARTITION_CACHE[k][1])
+                for k in by_expiry[:max(1, _PARTITION_MAX_ENTRIES // 10)]:
+                    del _PARTITION_CACHE[k]
+        _PARTITION_CACHE[key] = (value, time.time() + ttl)
+
+def _missing_spans(days: List[date]) -> List[tuple]:
+    """Group sorted days into contiguous (first, last) spans."""
+    spans = []
+    for day in days:
+        if spans and day == spans[-1][1] + timedelta(days=1):
+            spans[-1] = (spans[-1][0], day)
+        else:
+            spans.append((day, day))
+    return spans
+
+def get_day_partitions(
+    db: Session,
+    kind: str,
+    start_date: Optional[str],
+    end_date: Optional[str],
+    condition_item: Optional[str] = None,
+    status: Optional[str] = None,
+    category_id: Optional[str] = None,
+    search: Optional[str] = None
+):
+    """Return an ordered list of (day, partition) for the range, querying only
+    the days that are not cached yet. Returns None when the range can't be
+    partitioned (open-ended, malformed or too long) so callers fall back to a
+    direct aggregation."""
+    start, end = _parse_day(start_date), _parse_day(end_date)
+    if not start or not end or end < start or (end - start).days >= _PARTITION_MAX_DAYS:
+        return None
+
+    signature = f"{condition_item}:{status}:{category_id}:{search}"
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    now = time.time()
+
+    found = {}
+    missing = []
+    for day in days:
+        entry = _PARTITION_CACHE.get((kind, day, signature))
+        if entry and now < entry[1]:
+            found[day] = entry[0]
+        else:
+            missing.append(day)
+
+    for span_start, span_end in _missing_spans(missing):
+        filter_clause, params = build_filter_clause_and_params(
+            span_start.isoformat(), span_end.isoformat(), condition_item, status, category_id, search
+        )
+        rows = db.execute(text(_PARTITION_SQL[kind].format(filter_clause=filter_clause)), params).fetchall()
+
+        fetched = {}
+        for r in rows:
+            day = _parse_day(str(r.sales_date)[:10])
+            if day is None:
+                continue
+            if kind == "daily":
+                fetched[day] = {
+                    "sales_count": int(r.sales_count or 0),
+                    "quantity": float(r.quantity or 0.0),
+                    "revenue": float(r.revenue or 0.0),
+                    "fee": float(r.fee or 0.0),
+                }
+            elif kind == "products":
+                fetched.setdefault(day, {})[(r.title, r.item_id)] = (float(r.quantity or 0.0), float(r.revenue or 0.0))
+            else:
+                fetched.setdefault(day, {})[r.category_id] = float(r.revenue or 0.0)
+
+        # Days without sales are cached too (as empty partitions)
+        for offset in range((span_end - span_start).days + 1):
+            day = span_start + timedelta(days=offset)
+            found[day] = fetched.get(day, {})
+            _set_partition((kind, day, signature), found[day], day)
+
+    return [(day, found[day]) for day in days]
+
+def compute_order_metrics(
+    db: Session,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    condition_item: Optional[str] = None,
+    status: Optional[str] = None,
+    category_id: Optional[str] = None,
+    search: Optional[str] = None
+) -> OrderMetricResponse:
+    """Aggregate KPIs for the range, assembled from cached day partitions when possible."""
+    partitions = get_day_partitions(db, "daily", start_date, end_date, condition_item, status, category_id, search)
+    if partitions is not None:
+        sales_count = sum(p.get("sales_count", 0) for _, p in partitions)
+        units_sold = sum(p.get("quantity", 0.0) for _, p in partitions)
+        gross_income = sum(p.get("revenue", 0.0) for _, p in partitions)
+        fee = sum(p.get("fee", 0.0) for _, p in partitions)
+        return OrderMetricResponse(
+            total_sales_count=sales_count,
+            total_units_sold=units_sold,
+            total_gross_income=gross_income,
+            total_fee=fee,
+            total_net_income=gross_income - fee,
+            average_order_value=(gross_income / sales_count) if sales_count > 0 else 0.0
+        )
+
+    filter_clause, params = build_filter_clause_and_params(start_date, end_date, condition_item, status, category_id, search)
+    
+    sql = text(f"""
+        SELECT 
+            COUNT(DISTINCT venta_id) as total_sales_count,
+            COALESCE(SUM(quantity), 0) as total_units_sold,
+            COALESCE(SUM(gross_price), 0) as total_gross_income,
+            COALESCE(SUM(sale_fee), 0) as total_fee
+        FROM mercadolibre.v_orders_for_metrics
+        WHERE 1=1 {filter_clause}
+    """)
+    
+    row = db.execute(sql, params).first()
+    if not row:
+        return OrderMetricResponse(
+            total_sales_count=0,
+            total_units_sold=0.0,
+            total_gross_income=0.0,
+            total_fee=0.0,
+            total_net_income=0.0,
+            average_order_value=0.0
+        )
+    
+    sales_count = int(row.total_sales_count or 0)
+    units_sold = float(row.total_units_sold or 0.0)
+    gross_income = float(row.total_gross_income or 0.0)
+    fee = float(row.total_fee or 0.0)
+    net_income = gross_income - fee
+    aov = (gross_income / sales_count) if sales_count > 0 else 0.0
+    
+    return OrderMetricResponse(
+        total_sales_count=sales_count,
+        total_units_sold=units_sold,
+        total_gross_income=gross_income,
+        total_fee=fee,
+        total_net_income=net_income,
+        average_order_value=aov
+    )
+
 @router.get("/metrics", response_model=OrderMetricResponse)
 def get_order_metrics(
     start_date: Optional[str] = Query(None),
@@ -90,52 +309,13 @@ def get_order_metrics(
     db: Session = Depends(get_db)
 ):
     """Get summarized KPIs (Revenue, Fees, Units, Count, AOV) for MercadoLibre sales."""
-    cache_key = f"metrics:{start_date}:{end_date}:{condition_item}:{status}:{category_id}:{search}"
+    cache_key = dashboard_cache_key("metrics", start_date, end_date, condition_item, status, category_id, search)
     cached = get_from_cache(cache_key)
     if cached is not None:
         return cached
 
-    filter_clause, params = build_filter_clause_and_params(start_date, end_date, condition_item, status, category_id, search)
-    
-    sql = text(f"""
-        SELECT 
-            COUNT(DISTINCT venta_id) as total_sales_count,
-            COALESCE(SUM(quantity), 0) as total_units_sold,
-            COALESCE(SUM(gross_price), 0) as total_gross_income,
-            COALESCE(SUM(sale_fee), 0) as total_fee
-        FROM mercadolibre.v_orders_for_metrics
-        WHERE 1=1 {filter_clause}
-    """)
-    
     try:
-        row = db.execute(sql, params).first()
-        if not row:
-            res = OrderMetricResponse(
-                total_sales_count=0,
-                total_units_sold=0.0,
-                total_gross_income=0.0,
-                total_fee=0.0,
-                total_net_income=0.0,
-                average_order_value=0.0
-            )
-            set_in_cache(cache_key, res)
-            return res
-        
-        sales_count = int(row.total_sales_count or 0)
-        units_sold = float(row.total_units_sold or 0.0)
-        gross_income = float(row.total_gross_income or 0.0)
-        fee = float(row.total_fee or 0.0)
-        net_income = gross_income - fee
-        aov = (gross_income / sales_count) if sales_count > 0 else 0.0
-        
-        res = OrderMetricResponse(
-            total_sales_count=sales_count,
-            total_units_sold=units_sold,
-            total_gross_income=gross_income,
-            total_fee=fee,
-            total_net_income=net_income,
-            average_order_value=aov
-        )
+        res = compute_order_metrics(db, start_date, end_date, condition_item, status, category_id, search)
         set_in_cache(cache_key, res)
         return res
     except Exception as e:
@@ -195,21 +375,26 @@ def get_orders_list(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-@router.get("/chart-data", response_model=List[OrderChartItem])
-def get_chart_data(
-    start_date: Optional[str] = Query(None),
-    end_date: Optional[str] = Query(None),
-    condition_item: Optional[str] = Query(None),
-    status: Optional[str] = Query(None),
-    category_id: Optional[str] = Query(None),
-    search: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
-):
-    """Get aggregated daily statistics for Chart.js sales graph."""
-    cache_key = f"chart:{start_date}:{end_date}:{condition_item}:{status}:{category_id}:{search}"
-    cached = get_from_cache(cache_key)
-    if cached is not None:
-        return cached
+def compute_chart_data(
+    db: Session,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    condition_item: Optional[str] = None,
+    status: Optional[str] = None,
+    category_id: Optional[str] = None,
+    search: Optional[str] = None
+) -> List[OrderChartItem]:
+    """Daily sales series for the range, assembled from cached day partitions when possible."""
+    partitions = get_day_partitions(db, "daily", start_date, end_date, condition_item, status, category_id, search)
+    if partitions is not None:
+        return [
+            OrderChartItem(
+                date=day.isoformat(),
+                revenue=p["revenue"],
+                orders_count=p["sales_count"],
+                quantity=p["quantity"]
+            ) for day, p in partitions if p
+        ]
 
     filter_clause, params = build_filter_clause_and_params(start_date, end_date, condition_item, status, category_id, search)
     
@@ -225,25 +410,20 @@ def get_chart_data(
         ORDER BY sales_date ASC
     """)
     
-    try:
-        result = db.execute(sql, params).fetchall()
-        
-        chart_data = []
-        for r in result:
-            chart_data.append(OrderChartItem(
-                date=str(r.sales_date),
-                revenue=float(r.revenue or 0.0),
-                orders_count=int(r.orders_count or 0),
-                quantity=float(r.quantity or 0.0)
-            ))
-            
-        set_in_cache(cache_key, chart_data)
-        return chart_data
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    result = db.execute(sql, params).fetchall()
+    
+    chart_data = []
+    for r in result:
+        chart_data.append(OrderChartItem(
+            date=str(r.sales_date),
+            revenue=float(r.revenue or 0.0),
+            orders_count=int(r.orders_count or 0),
+            quantity=float(r.quantity or 0.0)
+        ))
+    return chart_data
 
-@router.get("/top-stats", response_model=TopStatsResponse)
-def get_top_stats(
+@router.get("/chart-data", response_model=List[OrderChartItem])
+def get_chart_data(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
     condition_item: Optional[str] = Query(None),
@@ -252,12 +432,57 @@ def get_top_stats(
     search: Optional[str] = Query(None),
     db: Session = Depends(get_db)
 ):
-    """Get top 5 products and top 5 categories."""
-    cache_key = f"top:{start_date}:{end_date}:{condition_item}:{status}:{category_id}:{search}"
+    """Get aggregated daily statistics for Chart.js sales graph."""
+    cache_key = dashboard_cache_key("chart", start_date, end_date, condition_item, status, category_id, search)
     cached = get_from_cache(cache_key)
     if cached is not None:
         return cached
 
+    try:
+        chart_data = compute_chart_data(db, start_date, end_date, condition_item, status, category_id, search)
+        set_in_cache(cache_key, chart_data)
+        return chart_data
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+def compute_top_stats(
+    db: Session,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    condition_item: Optional[str] = None,
+    status: Optional[str] = None,
+    category_id: Optional[str] = None,
+    search: Optional[str] = None
+) -> TopStatsResponse:
+    """Top 5 products and categories, merged from cached day partitions when possible."""
+    product_partitions = get_day_partitions(db, "products", start_date, end_date, condition_item, status, category_id, search)
+    if product_partitions is not None:
+        category_partitions = get_day_partitions(db, "categories", start_date, end_date, condition_item, status, category_id, search)
+
+        product_totals = {}
+        for _, partition in product_partitions:
+            for key, (quantity, revenue) in partition.items():
+                total = product_totals.setdefault(key, [0.0, 0.0])
+                total[0] += quantity
+                total[1] += revenue
+
+        category_totals = {}
+        for _, partition in category_partitions:
+            for cat, revenue in partition.items():
+                category_totals[cat] = category_totals.get(cat, 0.0) + revenue
+
+        top_products = [
+            TopProductItem(title=title, item_id=item_id, quantity=quantity, revenue=revenue)
+            for (title, item_id), (quantity, revenue) in sorted(
+                product_totals.items(), key=lambda kv: kv[1][1], reverse=True
+            )[:5]
+        ]
+        top_categories = [
+            TopCategoryItem(category_id=cat, revenue=revenue)
+            for cat, revenue in sorted(category_totals.items(), key=lambda kv: kv[1], reverse=True)[:5]
+        ]
+        return TopStatsResponse(top_products=top_products, top_categories=top_categories)
+
     filter_clause, params = build_filter_clause_and_params(start_date, end_date, condition_item, status, category_id, search)
     
     products_sql = text(f"""
@@ -284,27 +509,45 @@ def get_top_stats(
         LIMIT 5
     """)
     
+    prod_rows = db.execute(products_sql, params).fetchall()
+    cat_rows = db.execute(categories_sql, params).fetchall()
+    
+    top_products = [
+        TopProductItem(
+            title=r.title,
+            item_id=r.item_id,
+            quantity=float(r.quantity or 0.0),
+            revenue=float(r.revenue or 0.0)
+        ) for r in prod_rows
+    ]
+    
+    top_categories = [
+        TopCategoryItem(
+            category_id=r.category_id,
+            revenue=float(r.revenue or 0.0)
+        ) for r in cat_rows
+    ]
+    
+    return TopStatsResponse(top_products=top_products, top_categories=top_categories)
+
+@router.get("/top-stats", response_model=TopStatsResponse)
+def get_top_stats(
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+    condition_item: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    category_id: Optional[str] = Query(None),
+    search: Optional[str] = Query(None),
+    db: Session = Depends(get_db)
+):
+    """Get top 5 products and top 5 categories."""
+    cache_key = dashboard_cache_key("top", start_date, end_date, condition_item, status, category_id, search)
+    cached = get_from_cache(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        prod_rows = db.execute(products_sql, params).fetchall()
-        cat_rows = db.execute(categories_sql, params).fetchall()
-        
-        top_products = [
-            TopProductItem(
-                title=r.title,
-                item_id=r.item_id,
-                quantity=float(r.quantity or 0.0),
-                revenue=float(r.revenue or 0.0)
-            ) for r in prod_rows
-        ]
-        
-        top_categories = [
-            TopCategoryItem(
-                category_id=r.category_id,
-                revenue=float(r.revenue or 0.0)
-            ) for r in cat_rows
-        ]
-        
-        res = TopStatsResponse(top_products=top_products, top_categories=top_categories)
+        res = compute_top_stats(db, start_date, end_date, condition_item, status, category_id, search)
         set_in_cache(cache_key, res)
         return res
     except Exception as e:
@@ -1,14 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Response, Header
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from db_conn import get_db
 from schemas import ProductResponse, PublishRequest, ProductUpdate, TiendaNubeAttributeSchema, TiendaNubeStatusResponse, MercadoLibreAttributeSchema, MercadoLibreProductStatusSchema, SizeGridSchema, SizeGridUpdateSchema
 from routers.auth import get_current_user
 import crud
-import httpx
 import asyncio
-from services import drive_service
+from services import drive_service, http_client, webhook_outbox, image_cache
 import models
+from fastapi.responses import StreamingResponse, FileResponse
 from pydantic import BaseModel
 import os
 
@@ -18,15 +18,34 @@ router = APIRouter(
     dependencies=[Depends(get_current_user)]  # ALL routes require auth
 )
 
+# Routes used directly as <img src> (no Authorization header possible)
+public_router = APIRouter(prefix="/api/products", tags=["products"])
+
 # Webhook configuration
 WEBHOOK_URL = "https://import-gestion-inventario-402745694567.us-central1.run.app/webhooks/publications"
 WEBHOOK_SECRET = "mati-gordo"
 
+# Browser cache lifetime of proxied Drive images (revalidated with the ETag afterwards)
+DRIVE_IMAGE_BROWSER_MAX_AGE = int(os.getenv("DRIVE_IMAGE_BROWSER_MAX_AGE", "604800"))
+
+# Drive uploads running at once across all photo upload requests
+DRIVE_UPLOAD_CONCURRENCY = int(os.getenv("DRIVE_UPLOAD_CONCURRENCY", "4"))
+
+# Intermediate MercadoLibre status written while the external service works
+MELI_PENDING_STATUS = {"publish": "en proceso", "pause": "pausando", "delete": "eliminando"}
+
 class BulkPublishTNRequest(BaseModel):
     item_ids: List[int]
 
-def send_webhook(item_id: any, event_type: str, site: Optional[str] = None, extra_data: dict = None):
-    """Send webhook notification for events (publish/paused/update/pre-publish)"""
+class BulkPublishMeliRequest(BaseModel):
+    item_ids: List[int]
+    action: str = "publish"  # 'publish', 'pause' or 'delete'
+
+class ProductFilesBatchRequest(BaseModel):
+    product_ids: List[int]
+
+def build_webhook_payload(item_id: any, event_type: str, site: Optional[str] = None, extra_data: dict = None):
+    """Webhook body for events (publish/paused/update/pre-publish)"""
     effective_site = site if site else "mercadolibre"
     
     # Keep item_id as provided (integer if integer, string if string) 
@@ -47,21 +66,13 @@ def send_webhook(item_id: any, event_type: str, site: Optional[str] = None, extr
     
     if extra_data:
         data["data"] = extra_data
-    try:
-        print(f"DEBUG: Sending webhook to {WEBHOOK_URL} with data: {data}")
-        with httpx.Client(timeout=30.0) as client:
-            response = client.post(WEBHOOK_URL, json=data)
-            status = response.status_code
-            print(f"Webhook sent: {event_type} - Status: {status}")
-            
-            if status in (200, 202):
-                return True, "Success"
-            else:
-                error_body = response.text[:500]
-                return False, f"Status: {status} - {error_body}"
-    except Exception as e:
-        print(f"Webhook error: {e}")
-        return False, str(e)
+    return data
+
+def queue_webhook(db: Session, item_id: any, event_type: str, site: Optional[str] = None, extra_data: dict = None):
+    """Add the webhook to the outbox in the caller's transaction; returns the delivery id.
+    Call wake_workers() after the commit so delivery starts right away."""
+    data = build_webhook_payload(item_id, event_type, site, extra_data)
+    return webhook_outbox.enqueue(db, WEBHOOK_URL, data, event_type, item_id=item_id, site=site or "mercadolibre")
 
 @router.get("/", response_model=List[ProductResponse])
 def read_products(
@@ -160,6 +171,7 @@ def read_product(product_id: int, db: Session = Depends(get_db)):
 def update_publish_status(
     product_id: int, 
     request: PublishRequest, 
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """Trigger publish/pause/delete webhook and update status in DB"""
@@ -182,23 +194,19 @@ def update_publish_status(
         
         db_product.status = new_status
     
-    db.commit()
-    db.refresh(db_product)
-    
-    # Send webhook notification (external service will set final status)
+    # Queue webhook notification in the same transaction (external service will set final status)
     effective_action = request.action
     effective_site = request.site if request.site else "mercadolibre"
     
     # Extra safety: if we're doing a TN action, ensure site is correct
-    print(f"DEBUG: Triggering webhook - site='{effective_site}', action='{effective_action}', item_id={product_id}")
+    print(f"DEBUG: Queueing webhook - site='{effective_site}', action='{effective_action}', item_id={product_id}")
+    delivery_id = queue_webhook(db, product_id, effective_action, site=effective_site)
     
-    success, msg = send_webhook(product_id, effective_action, site=effective_site)
+    db.commit()
+    db.refresh(db_product)
+    webhook_outbox.wake_workers()
     
-    if not success:
-        print(f"ERROR: Webhook failed for item {product_id}: {msg}")
-    else:
-        print(f"SUCCESS: Webhook sent for item {product_id}")
-        
+    response.headers["X-Webhook-Delivery-Id"] = delivery_id
     return db_product
 
 @router.delete("/{product_id}/delete-meli")
@@ -208,20 +216,16 @@ def delete_meli_publication(product_id: int, db: Session = Depends(get_db)):
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
         
-    # Set intermediate status
+    # Set intermediate status and queue the webhook together
     db_product.status = 'eliminando'
+    delivery_id = queue_webhook(db, product_id, "delete", site="mercadolibre")
     db.commit()
-    db.refresh(db_product)
-    
-    # Trigger webhook
-    success, msg = send_webhook(product_id, "delete", site="mercadolibre")
-    if not success:
-        raise HTTPException(status_code=500, detail=f"Error enviando solicitud de eliminación: {msg}")
+    webhook_outbox.wake_workers()
         
-    return {"status": "success", "message": "Solicitud de eliminación enviada"}
+    return {"status": "success", "message": "Solicitud de eliminación enviada", "delivery_id": delivery_id}
 
 @router.post("/{product_id}/sync-pictures")
-def sync_meli_pictures(product_id: int):
+async def sync_meli_pictures(product_id: int):
     """Proxy picture sync request to webhook to avoid CORS issues"""
     data = {
         "event_type": "meli_pictures",
@@ -230,13 +234,16 @@ def sync_meli_pictures(product_id: int):
     }
     try:
         print(f"DEBUG: Proxied webhook sync-pictures for item {product_id}")
-        with httpx.Client(timeout=30.0) as client:
-            response = client.post(WEBHOOK_URL, json=data)
-            if response.status_code in (200, 202):
-                return {"message": "Sincronización iniciada"}
-            else:
-                print(f"ERROR: Webhook returned {response.status_code} - {response.text}")
-                raise HTTPException(status_code=500, detail=f"Error de webhook: {response.status_code}")
+        response = await http_client.post(
+            "publications", WEBHOOK_URL, json=data, budget=http_client.budget("products.sync_pictures")
+        )
+        if response.status_code in (200, 202):
+            return {"message": "Sincronización iniciada"}
+        else:
+            print(f"ERROR: Webhook returned {response.status_code} - {response.text}")
+            raise HTTPException(status_code=500, detail=f"Error de webhook: {response.status_code}")
+    except http_client.CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -244,17 +251,23 @@ def sync_meli_pictures(product_id: int):
 def patch_product(
     product_id: int, 
     request: ProductUpdate, 
+    response: Response,
     db: Session = Depends(get_db)
 ):
     updates = request.dict(exclude_unset=True)
+
+    # If Tienda Nube price is updated, notify the service (committed by update_product)
+    delivery_id = None
+    if "price_tienda_nube" in updates:
+        delivery_id = queue_webhook(db, product_id, "update", site="tienda-nube")
+
     db_product = crud.update_product(db, product_id=product_id, updates=updates)
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
-        
-    # If Tienda Nube price was updated, notify the service
-    if "price_tienda_nube" in updates:
-        send_webhook(product_id, "update", site="tienda-nube")
-        
+
+    if delivery_id:
+        webhook_outbox.wake_workers()
+        response.headers["X-Webhook-Delivery-Id"] = delivery_id
     return db_product
 
 @router.put("/{product_id}", response_model=ProductResponse)
@@ -283,38 +296,61 @@ def notify_product_update(product_id: int, site: Optional[str] = None, db: Sessi
     # Only update ML status column when it's a MercadoLibre update
     if effective_site == "mercadolibre":
         product.status = "actualizando"
-        db.commit()
-        db.refresh(product)
-        
-    success, msg = send_webhook(product_id, "update", site=effective_site)
-    if not success:
-        raise HTTPException(status_code=500, detail=f"Failed to send webhook: {msg}")
-        
-    return {"status": "success", "message": f"Update notification sent for {effective_site}"}
 
-@router.post("/bulk-publish-tn")
-async def bulk_publish_tienda_nube(request: BulkPublishTNRequest, db: Session = Depends(get_db)):
-    """Send individual publication requests for each item to avoid 500 errors on the external service"""
-    if not request.item_ids:
-        raise HTTPException(status_code=400, detail="No item IDs provided")
-    
-    results = []
-    for item_id in request.item_ids:
-        # We send them individually because the external service fails with 500 when receiving an array
-        success, msg = send_webhook(item_id, "publish", site="tienda-nube")
-        results.append({"item_id": item_id, "success": success, "message": msg})
-    
-    # Check if at least some succeeded
-    succeeded = [r for r in results if r["success"]]
-    if not succeeded:
-        raise HTTPException(status_code=500, detail=f"Todos los productos fallaron. Último error: {results[-1]['message']}")
+    delivery_id = queue_webhook(db, product_id, "update", site=effective_site)
+    db.commit()
+    webhook_outbox.wake_workers()
         
+    return {"status": "success", "message": f"Update notification queued for {effective_site}", "delivery_id": delivery_id}
+
+def _queue_bulk_webhooks(db: Session, item_ids: List[int], event_type: str, site: str):
+    """One outbox delivery per item (the external service can't take arrays), added to the
+    caller's transaction; the caller commits and then wakes the workers.
+
+    success only means queued: the outcome of each item is its delivery's status."""
+    return [
+        {"item_id": item_id, "success": True, "message": "Queued",
+         "delivery_id": queue_webhook(db, item_id, event_type, site=site)}
+        for item_id in item_ids
+    ]
+
+def _bulk_queued_response(results: list):
     return {
-        "status": "success", 
-        "message": f"Se procesaron {len(succeeded)} de {len(request.item_ids)} productos correctamente.",
+        "status": "success",
+        "message": f"Se encolaron {len(results)} productos para su procesamiento.",
         "details": results
     }
 
+@router.post("/bulk-publish-tn")
+def bulk_publish_tienda_nube(request: BulkPublishTNRequest, db: Session = Depends(get_db)):
+    """Queue one publication webhook per item in the outbox (delivered and retried by its workers)"""
+    if not request.item_ids:
+        raise HTTPException(status_code=400, detail="No item IDs provided")
+    item_ids = list(dict.fromkeys(request.item_ids))
+
+    results = _queue_bulk_webhooks(db, item_ids, "publish", "tienda-nube")
+    db.commit()
+    webhook_outbox.wake_workers()
+    return _bulk_queued_response(results)
+
+@router.post("/bulk-publish-meli")
+def bulk_publish_mercadolibre(request: BulkPublishMeliRequest, db: Session = Depends(get_db)):
+    """Bulk publish/pause/delete on MercadoLibre: one status UPDATE and the per-item outbox
+    rows in the same transaction, so no item is left in an intermediate status without its webhook"""
+    if request.action not in MELI_PENDING_STATUS:
+        raise HTTPException(status_code=400, detail="action must be 'publish', 'pause' or 'delete'")
+    if not request.item_ids:
+        raise HTTPException(status_code=400, detail="No item IDs provided")
+    item_ids = list(dict.fromkeys(request.item_ids))
+
+    db.query(models.Product).filter(models.Product.id.in_(item_ids)).update(
+        {"status": MELI_PENDING_STATUS[request.action]}, synchronize_session=False
+    )
+    results = _queue_bulk_webhooks(db, item_ids, request.action, "mercadolibre")
+    db.commit()
+    webhook_outbox.wake_workers()
+    return _bulk_queued_response(results)
+
 
 
 class PrePublishRequest(BaseModel):
@@ -322,13 +358,14 @@ class PrePublishRequest(BaseModel):
     field: Optional[str] = None # 'product_name_meli' or 'description'
 
 @router.post("/{product_id}/pre-publish")
-def trigger_pre_publish(
+async def trigger_pre_publish(
     product_id: int, 
     request: PrePublishRequest,
     db: Session = Depends(get_db)
 ):
     """Send pre-publish webhook to external service for AI content generation"""
-    product = crud.get_product(db, product_id)
+    # Sync DB call: keep it off the event loop
+    product = await asyncio.to_thread(crud.get_product, db, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
@@ -347,68 +384,103 @@ def trigger_pre_publish(
     
     try:
         print(f"DEBUG: Sending AI pre-publish webhook for item {product_id} (field: {request.field})")
-        with httpx.Client(timeout=30.0) as client:
-            response = client.post(WEBHOOK_URL, json=data)
-            if 200 <= response.status_code < 300:
-                return {
-                    "status": "success", 
-                    "message": "Solicitud enviada al servicio de AI. El campo se actualizará en unos momentos.",
-                    "field": request.field
-                }
-            else:
-                print(f"ERROR: AI Webhook returned {response.status_code} - {response.text}")
-                raise HTTPException(status_code=500, detail=f"Error del servicio de AI: {response.status_code}")
+        response = await http_client.post(
+            "publications", WEBHOOK_URL, json=data, budget=http_client.budget("products.pre_publish")
+        )
+        if 200 <= response.status_code < 300:
+            return {
+                "status": "success", 
+                "message": "Solicitud enviada al servicio de AI. El campo se actualizará en unos momentos.",
+                "field": request.field
+            }
+        else:
+            print(f"ERROR: AI Webhook returned {response.status_code} - {response.text}")
+            raise HTTPException(status_code=500, detail=f"Error del servicio de AI: {response.status_code}")
+    except http_client.CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/{product_id}/upload")
-async def upload_product_photo(
-    product_id: int,
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db)
-):
-    # 1. Fetch product
-    product = crud.get_product(db, product_id)
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
+_drive_upload_semaphore = None
+_folder_locks = {}
+
+def _upload_slots() -> asyncio.Semaphore:
+    global _drive_upload_semaphore
+    if _drive_upload_semaphore is None:
+        _drive_upload_semaphore = asyncio.Semaphore(DRIVE_UPLOAD_CONCURRENCY)
+    return _drive_upload_semaphore
 
-    # 2. Get Drive Service
+def _create_product_folder(product_id: int):
     service = drive_service.get_drive_service()
     if not service:
-        raise HTTPException(status_code=500, detail="Could not connect to Google Drive")
+        return None
+    return drive_service.create_folder(service, str(product_id), parent_id=drive_service.ROOT_FOLDER_ID)
+
+def _reload_drive_url(db: Session, product):
+    # End this session's transaction first: under REPEATABLE READ the refresh would
+    # otherwise read the snapshot taken before another request committed drive_url
+    db.rollback()
+    db.refresh(product)
+    return product.drive_url
 
-    # 3. Determine Folder ID
-    folder_id = None
+async def _ensure_product_folder(db: Session, product) -> str:
+    """Drive folder id of the product, creating the folder once (concurrent uploads wait for it)."""
     if product.drive_url:
         folder_id = drive_service.extract_id_from_url(product.drive_url)
-    
-    # 4. If no folder, create one
-    if not folder_id:
-        folder_name = str(product.id)
-        new_folder = drive_service.create_folder(
-            service, 
-            folder_name, 
-            parent_id=drive_service.ROOT_FOLDER_ID
-        )
-        if new_folder:
-            folder_id = new_folder.get('id')
+        if folder_id:
+            return folder_id
+
+    lock = _folder_locks.setdefault(product.id, asyncio.Lock())
+    async with lock:
+        # Another request may have created it while we waited (DB calls run in a
+        # thread so they don't block the event loop)
+        drive_url = await asyncio.to_thread(_reload_drive_url, db, product)
+        folder_id = drive_service.extract_id_from_url(drive_url) if drive_url else None
+        if not folder_id:
+            new_folder = await asyncio.to_thread(_create_product_folder, product.id)
+            if not new_folder:
+                raise HTTPException(status_code=500, detail="Failed to create Drive folder")
             # Save new URL to DB
             new_url = new_folder.get('webViewLink')
-            crud.update_product(db, product_id, {'drive_url': new_url})
-            product.drive_url = new_url # Update local obj for response
-        else:
-            raise HTTPException(status_code=500, detail="Failed to create Drive folder")
+            await asyncio.to_thread(crud.update_product, db, product.id, {'drive_url': new_url})
+            product.drive_url = new_url  # Update local obj for response
+            folder_id = new_folder.get('id')
+
+    # The folder exists and is committed: later requests take the fast path
+    if _folder_locks.get(product.id) is lock:
+        del _folder_locks[product.id]
+    return folder_id
+
+def _upload_spooled_file(file: UploadFile, folder_id: str):
+    """Stream the upload's spooled temp file to Drive (runs in a worker thread with its own client)."""
+    service = drive_service.get_drive_service()
+    if not service:
+        raise RuntimeError("Could not connect to Google Drive")
+    file.file.seek(0)
+    return drive_service.upload_stream(service, file.file, file.filename, folder_id, content_type=file.content_type)
+
+async def _upload_to_folder(file: UploadFile, folder_id: str):
+    async with _upload_slots():
+        uploaded = await asyncio.to_thread(_upload_spooled_file, file, folder_id)
+    drive_service.invalidate_folder_listing(folder_id)
+    return uploaded
+
+async def _get_product_for_upload(db: Session, product_id: int):
+    product = await asyncio.to_thread(crud.get_product, db, product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return product, await _ensure_product_folder(db, product)
+
+@router.post("/{product_id}/upload")
+async def upload_product_photo(
+    product_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db)
+):
+    product, folder_id = await _get_product_for_upload(db, product_id)
 
-    # 5. Upload file
     try:
-        content = await file.read()
-        uploaded_file = drive_service.upload_file(
-            service, 
-            content, 
-            file.filename, 
-            folder_id, 
-            content_type=file.content_type
-        )
+        uploaded_file = await _upload_to_folder(file, folder_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload file to Drive: {str(e)}")
 
@@ -421,6 +493,63 @@ async def upload_product_photo(
         "drive_url": product.drive_url or uploaded_file.get('webViewLink') 
     }
 
+@router.post("/{product_id}/upload-multiple")
+async def upload_product_photos(
+    product_id: int,
+    files: List[UploadFile] = File(...),
+    db: Session = Depends(get_db)
+):
+    """Upload several photos at once: one folder lookup/creation, uploads streamed to Drive concurrently."""
+    product, folder_id = await _get_product_for_upload(db, product_id)
+
+    results = await asyncio.gather(
+        *(_upload_to_folder(file, folder_id) for file in files),
+        return_exceptions=True
+    )
+
+    uploaded, failed = [], []
+    for file, result in zip(files, results):
+        if isinstance(result, Exception) or not result:
+            print(f"Error uploading {file.filename} for product {product_id}: {result}")
+            failed.append({"filename": file.filename, "error": str(result) or "Unknown error"})
+        else:
+            uploaded.append({"filename": file.filename, "file_id": result.get('id')})
+
+    if files and not uploaded:
+        raise HTTPException(status_code=500, detail=f"Failed to upload files to Drive: {failed[0]['error']}")
+
+    return {
+        "detail": f"{len(uploaded)} of {len(files)} files uploaded",
+        "drive_url": product.drive_url,
+        "uploaded": uploaded,
+        "failed": failed
+    }
+
+@router.post("/files-batch")
+def get_products_files_batch(request: ProductFilesBatchRequest, db: Session = Depends(get_db)):
+    """Gallery files of many products: {product_id: [files]}. Folders resolve in one query and
+    are listed together (cached per folder), instead of one /files call per product."""
+    result = {product_id: [] for product_id in request.product_ids}
+    if not request.product_ids:
+        return result
+
+    folders = {}
+    for product_id, drive_url in crud.get_product_drive_urls(db, request.product_ids).items():
+        folder_id = drive_service.extract_id_from_url(drive_url)
+        if folder_id:
+            folders[product_id] = folder_id
+    if not folders:
+        return result
+
+    service = drive_service.get_drive_service()
+    if not service:
+        return result
+
+    listings = drive_service.list_files_batch(service, list(folders.values()))
+    for product_id, folder_id in folders.items():
+        result[product_id] = listings.get(folder_id, [])
+    return result
+
 @router.get("/{product_id}/files")
 def get_product_files(
     product_id: int,
@@ -464,6 +593,7 @@ def get_tienda_nube_attributes(product_id: int, db: Session = Depends(get_db)):
 def update_tienda_nube_attributes(
     product_id: int, 
     request: TiendaNubeAttributeSchema, 
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """Update or create extra attributes for Tienda Nube"""
@@ -471,9 +601,12 @@ def update_tienda_nube_attributes(
     # Ensure item_id is correct
     updates['item_id'] = product_id
     try:
+        # Notify external service that attributes (SEO, price, tags) have changed;
+        # the outbox row is committed together with the attributes
+        delivery_id = queue_webhook(db, product_id, "update", site="tienda-nube")
         attrs = crud.update_tn_attributes(db, product_id, updates)
-        # Notify external service that attributes (SEO, price, tags) have changed
-        send_webhook(product_id, "update", site="tienda-nube")
+        webhook_outbox.wake_workers()
+        response.headers["X-Webhook-Delivery-Id"] = delivery_id
         return attrs
     except Exception as e:
         print(f"Error updating TN attributes: {e}")
@@ -568,12 +701,12 @@ def update_mercadolibre_size_grid(
 
 
 @router.post("/{product_id}/mercadolibre-size-grid/generate-template")
-def generate_mercadolibre_size_grid_template(product_id: int):
-    """Trigger create_template webhook for Size Grid"""
-    success, msg = send_webhook(product_id, "create_template")
-    if not success:
-        raise HTTPException(status_code=502, detail=f"Error al solicitar creación de plantilla: {msg}")
-    return {"message": "Plantilla solicitada con éxito"}
+def generate_mercadolibre_size_grid_template(product_id: int, db: Session = Depends(get_db)):
+    """Queue create_template webhook for Size Grid"""
+    delivery_id = queue_webhook(db, product_id, "create_template")
+    db.commit()
+    webhook_outbox.wake_workers()
+    return {"message": "Plantilla solicitada con éxito", "delivery_id": delivery_id}
 
 
 @router.post("/{product_id}/mercadolibre-size-grid/create")
@@ -582,49 +715,69 @@ def create_mercadolibre_size_grid(
     request: Optional[SizeGridUpdateSchema] = None,
     db: Session = Depends(get_db)
 ):
-    """Save current settings if provided and trigger create_size_grid webhook"""
-    if request and request.settings is not None:
-        try:
+    """Save current settings if provided and queue create_size_grid webhook (one transaction)"""
+    delivery_id = queue_webhook(db, product_id, "create_size_grid")
+    try:
+        if request and request.settings is not None:
             crud.update_size_grid_settings(db, product_id, request.settings)
-        except Exception as e:
-            db.rollback()
-            raise HTTPException(status_code=500, detail=f"Error al guardar plantilla: {str(e)}")
-            
-    success, msg = send_webhook(product_id, "create_size_grid")
-    if not success:
-        raise HTTPException(status_code=502, detail=f"Error al crear guía de talles: {msg}")
-    return {"message": "Guía de talles enviada a creación con éxito"}
-
-
-@router.get("/drive-image/{file_id}")
-def get_drive_image(file_id: str, size: str = "thumbnail"):
-    """Proxy endpoint to serve Drive images with authentication"""
-    from fastapi.responses import StreamingResponse
-    import io
-    
-    service = drive_service.get_drive_service()
-    if not service:
-        raise HTTPException(status_code=500, detail="Drive service unavailable")
-    
+        else:
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error al guardar plantilla: {str(e)}")
+
+    webhook_outbox.wake_workers()
+    return {"message": "Guía de talles enviada a creación con éxito", "delivery_id": delivery_id}
+
+
+@public_router.get("/drive-image/{file_id}")
+def get_drive_image(file_id: str, size: str = "thumbnail", if_none_match: Optional[str] = Header(None)):
+    """Proxy endpoint to serve Drive images with the app's Drive credentials.
+
+    Public like the files' own "anyone with the link" Drive URLs, so gallery
+    <img> tags can use it.
+
+    size: 'thumbnail' / 'large' (resized WebP) or 'original'. Served from the
+    on-disk cache when possible; the first request streams from Drive."""
+    service = None
     try:
-        # Get file metadata to determine mime type
-        file_metadata = service.files().get(fileId=file_id, fields="mimeType").execute()
+        service = drive_service.get_drive_service()
+        if not service:
+            raise HTTPException(status_code=500, detail="Drive service unavailable")
+
+        # Get file metadata to determine mime type and content version (cached in memory)
+        file_metadata = image_cache.get_metadata(service, file_id)
         mime_type = file_metadata.get('mimeType', 'image/jpeg')
-        
-        # Download file content
-        request = service.files().get_media(fileId=file_id)
-        file_content = io.BytesIO()
-        
-        from googleapiclient.http import MediaIoBaseDownload
-        downloader = MediaIoBaseDownload(file_content, request)
-        
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        
-        file_content.seek(0)
-        return StreamingResponse(file_content, media_type=mime_type)
-        
+        md5 = file_metadata.get('md5Checksum')
+        file_size = int(file_metadata['size']) if file_metadata.get('size') else None
+
+        variant = size if size in image_cache.VARIANTS and mime_type.startswith('image/') else "original"
+        headers = {"Cache-Control": f"private, max-age={DRIVE_IMAGE_BROWSER_MAX_AGE}"}
+        if md5:
+            etag = f'"{file_id}-{md5}-{variant}"'
+            headers["ETag"] = etag
+            if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+                return Response(status_code=304, headers=headers)
+
+        original_path = image_cache.cache_path(file_id, md5, "original")
+        if variant == "original":
+            if image_cache.lookup(original_path):
+                return FileResponse(original_path, media_type=mime_type, headers=headers)
+            # Stream straight through while filling the cache
+            return StreamingResponse(
+                image_cache.stream_original(file_id, original_path, file_size),
+                media_type=mime_type, headers=headers
+            )
+
+        variant_path = image_cache.cache_path(file_id, md5, variant)
+        if not image_cache.lookup(variant_path):
+            image_cache.ensure_original(file_id, original_path, file_size)
+            if not image_cache.ensure_variant(original_path, variant_path, variant):
+                return FileResponse(original_path, media_type=mime_type, headers=headers)
+        return FileResponse(variant_path, media_type="image/webp", headers=headers)
+
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error serving Drive image: {e}")
         raise HTTPException(status_code=404, detail="Image not found")
@@ -3,9 +3,16 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from db_conn import get_db
 from routers.auth import get_current_user
-from schemas import SellingCalculationResponse
-from models import SellingCalculation, Product
+from schemas import SellingCalculationResponse, SellingBatchRequest, SellingBatchResponse, SellingBatchItemResult, SellingBatchStatusResponse, SellingEstimateRequest, SellingEstimateResponse, SellingReconcileResponse
+from services import fee_calculator, http_client
+from models import SellingCalculation, SellingBatch, Product
+from db_conn import SessionLocal
+from datetime import datetime, timedelta
 import httpx
+import asyncio
+import json
+import os
+import uuid
 
 router = APIRouter(
     prefix="/api/selling",
@@ -16,6 +23,14 @@ router = APIRouter(
 SELLING_WEBHOOK_URL = "https://import-gestion-inventario-402745694567.us-central1.run.app/webhooks/selling_calculation"
 WEBHOOK_SECRET = "mati-gordo"
 
+# Batch fan-out settings
+SELLING_BATCH_CONCURRENCY = int(os.getenv("SELLING_BATCH_CONCURRENCY", "5"))
+SELLING_BATCH_RETRIES = int(os.getenv("SELLING_BATCH_RETRIES", "2"))
+SELLING_BATCH_MAX_ITEMS = 1000
+
+# Batches (mercadolibre.selling_batches) are kept this long for status checks
+_SELLING_BATCH_TTL_SECONDS = 3600
+
 from typing import Optional
 
 @router.get("/by-code/", response_model=Optional[SellingCalculationResponse])
@@ -28,12 +43,11 @@ def get_selling_calculation_by_code(product_code: str, db: Session = Depends(get
     try:
         if not product_code:
             return None
-        product = db.query(Product).filter(Product.product_code == product_code).first()
-        if not product:
-            return None
-            
-        result = db.query(SellingCalculation).filter(
-            SellingCalculation.item_id == str(product.id)
+        # Single indexed join on the integer shadow key (no CAST on either side)
+        result = db.query(SellingCalculation).join(
+            Product, Product.id == SellingCalculation.item_id_int
+        ).filter(
+            Product.product_code == product_code
         ).first()
 
         return result
@@ -41,21 +55,27 @@ def get_selling_calculation_by_code(product_code: str, db: Session = Depends(get
         print(f"Error getting selling calculation for {product_code}: {e}")
         return None
 
+def _product_id_by_code(db: Session, product_code: str):
+    row = db.query(Product.id).filter(Product.product_code == product_code).first()
+    return row[0] if row else None
+
 @router.post("/by-code/{product_code}/calculate")
-def trigger_selling_calculation_by_code(product_code: str, db: Session = Depends(get_db)):
+async def trigger_selling_calculation_by_code(product_code: str, db: Session = Depends(get_db)):
     """Trigger the external webhook to calculate selling costs using product_code"""
-    product = db.query(Product).filter(Product.product_code == product_code).first()
-    if not product:
+    # Sync DB call: keep it off the event loop
+    item_id = await asyncio.to_thread(_product_id_by_code, db, product_code)
+    if item_id is None:
         raise HTTPException(status_code=404, detail="Producto no encontrado en el catálogo")
         
     payload = {
-        "item_id": product.id,
+        "item_id": item_id,
         "secret": WEBHOOK_SECRET
     }
 
     try:
-        with httpx.Client(timeout=15.0) as client:
-            response = client.post(SELLING_WEBHOOK_URL, json=payload)
+        response = await http_client.post(
+            "selling", SELLING_WEBHOOK_URL, json=payload, budget=http_client.budget("selling.calculate")
+        )
 
         if response.status_code in (200, 202):
             return {
@@ -68,6 +88,8 @@ def trigger_selling_calculation_by_code(product_code: str, db: Session = Depends
                 detail=f"Error del servicio externo: {response.status_code} - {response.text[:200]}"
             )
 
+    except http_client.CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except httpx.TimeoutException:
         raise HTTPException(
             status_code=504,
@@ -78,3 +100,152 @@ def trigger_selling_calculation_by_code(product_code: str, db: Session = Depends
             status_code=500,
             detail=f"Error enviando solicitud de cálculo: {str(e)}"
         )
+
+
+def _create_batch(request: SellingBatchRequest):
+    """Resolve the batch products in one query and persist the batch; returns (batch_id, products, not_found)."""
+    db = SessionLocal()
+    try:
+        query = db.query(Product.id, Product.product_code)
+        if request.product_codes and request.category:
+            query = query.filter((Product.product_code.in_(request.product_codes)) | (Product.product_type_path == request.category))
+        elif request.product_codes:
+            query = query.filter(Product.product_code.in_(request.product_codes))
+        else:
+            query = query.filter(Product.product_type_path == request.category)
+        products = query.limit(SELLING_BATCH_MAX_ITEMS + 1).all()
+        if len(products) > SELLING_BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=400, detail=f"Máximo {SELLING_BATCH_MAX_ITEMS} productos por lote")
+
+        found_codes = {p.product_code for p in products}
+        not_found = [c for c in (request.product_codes or []) if c not in found_codes]
+
+        batch_id = str(uuid.uuid4())
+        db.query(SellingBatch).filter(
+            SellingBatch.created_at < datetime.utcnow() - timedelta(seconds=_SELLING_BATCH_TTL_SECONDS)
+        ).delete(synchronize_session=False)
+        # Database clock, the same one that stamps selling_calculation.calculated_at
+        sent_at = db.execute(text("SELECT CURRENT_TIMESTAMP(6)")).scalar()
+        db.add(SellingBatch(id=batch_id, item_ids=json.dumps([p.id for p in products]), sent_at=sent_at))
+        db.commit()
+        return batch_id, [(p.product_code, p.id) for p in products], not_found
+    finally:
+        db.close()
+
+
+async def _post_calculation(semaphore: asyncio.Semaphore, product_code: str, item_id: int):
+    """POST one item to the selling webhook, retrying timeouts and 5xx with backoff."""
+    payload = {"item_id": item_id, "secret": WEBHOOK_SECRET}
+    message = ""
+    attempts = 0
+    async with semaphore:
+        for attempt in range(SELLING_BATCH_RETRIES + 1):
+            attempts = attempt + 1
+            try:
+                response = await http_client.post(
+                    "selling", SELLING_WEBHOOK_URL, json=payload, budget=http_client.budget("selling.calculate_batch")
+                )
+                if response.status_code in (200, 202):
+                    return SellingBatchItemResult(product_code=product_code, item_id=item_id, success=True, attempts=attempts, message="Cálculo iniciado")
+                message = f"Error del servicio externo: {response.status_code} - {response.text[:200]}"
+                if response.status_code < 500:
+                    break
+            except http_client.CircuitOpenError as e:
+                message = str(e)
+                break
+            except httpx.TimeoutException:
+                message = "El servicio externo tardó demasiado"
+            except Exception as e:
+                message = f"Error enviando solicitud de cálculo: {str(e)}"
+            if attempt < SELLING_BATCH_RETRIES:
+                await asyncio.sleep(0.5 * (2 ** attempt))
+    return SellingBatchItemResult(product_code=product_code, item_id=item_id, success=False, attempts=attempts, message=message)
+
+
+@router.post("/calculate-batch", response_model=SellingBatchResponse)
+async def trigger_selling_calculation_batch(request: SellingBatchRequest):
+    """Trigger the selling-cost webhook for many products (codes and/or a whole category) concurrently."""
+    if not request.product_codes and not request.category:
+        raise HTTPException(status_code=400, detail="Indique product_codes o category")
+
+    batch_id, products, not_found = await asyncio.to_thread(_create_batch, request)
+
+    semaphore = asyncio.Semaphore(max(1, SELLING_BATCH_CONCURRENCY))
+    results = await asyncio.gather(*(
+        _post_calculation(semaphore, product_code, item_id) for product_code, item_id in products
+    ))
+
+    sent = sum(1 for r in results if r.success)
+    print(f"Selling batch {batch_id}: {sent}/{len(results)} calculations sent")
+    return SellingBatchResponse(
+        batch_id=batch_id,
+        requested=len(products),
+        sent=sent,
+        failed=len(results) - sent,
+        not_found=not_found,
+        results=results
+    )
+
+
+@router.get("/calculate-batch/{batch_id}", response_model=SellingBatchStatusResponse)
+def get_selling_calculation_batch_status(batch_id: str, db: Session = Depends(get_db)):
+    """Completion of a batch: items whose selling_calculation row was (re)calculated after it was sent."""
+    batch = db.query(SellingBatch).filter(SellingBatch.id == batch_id).first()
+    if not batch or batch.created_at < datetime.utcnow() - timedelta(seconds=_SELLING_BATCH_TTL_SECONDS):
+        raise HTTPException(status_code=404, detail="Lote no encontrado o expirado")
+
+    item_ids = json.loads(batch.item_ids or "[]")
+    done = set()
+    if item_ids:
+        rows = db.query(SellingCalculation.item_id_int).filter(
+            SellingCalculation.item_id_int.in_(item_ids),
+            SellingCalculation.calculated_at > batch.sent_at
+        ).all()
+        done = {int(r[0]) for r in rows}
+    pending = [i for i in item_ids if i not in done]
+
+    return SellingBatchStatusResponse(
+        batch_id=batch_id,
+        total=len(item_ids),
+        calculated=len(item_ids) - len(pending),
+        pending=len(pending),
+        pending_item_ids=pending
+    )
+
+
+SELLING_ESTIMATE_MAX_PRICES = 10000
+
+@router.post("/estimate", response_model=SellingEstimateResponse)
+def estimate_selling_costs(request: SellingEstimateRequest, db: Session = Depends(get_db)):
+    """What-if selling costs for many candidate prices, computed locally (no webhook round-trip)."""
+    if not request.prices:
+        raise HTTPException(status_code=400, detail="Indique al menos un precio")
+    if len(request.prices) > SELLING_ESTIMATE_MAX_PRICES:
+        raise HTTPException(status_code=400, detail=f"Máximo {SELLING_ESTIMATE_MAX_PRICES} precios por consulta")
+
+    category_id = request.category_id
+    ship_cost = request.ship_cost
+    if request.product_code:
+        stored = db.query(SellingCalculation).join(
+            Product, Product.id == SellingCalculation.item_id_int
+        ).filter(Product.product_code == request.product_code).first()
+        if not stored and not category_id:
+            raise HTTPException(status_code=404, detail="El producto no tiene un cálculo de costos previo")
+        if stored:
+            category_id = category_id or stored.category_id
+            if ship_cost is None:
+                ship_cost = stored.ship_cost_amount or stored.ship_cost_full_amount
+
+    tables = fee_calculator.load_fee_tables(db)
+    return SellingEstimateResponse(
+        product_code=request.product_code,
+        category_id=category_id,
+        estimates=fee_calculator.estimate_prices(tables, request.prices, category_id, ship_cost)
+    )
+
+@router.get("/estimate/reconcile", response_model=SellingReconcileResponse)
+def reconcile_selling_estimates(limit: int = 1000, refresh: bool = False, db: Session = Depends(get_db)):
+    """Compare the local calculator with the webhook results stored in selling_calculation."""
+    if refresh:
+        fee_calculator.load_fee_tables(db, force=True)
+    return fee_calculator.reconcile(db, limit=min(max(limit, 1), 20000))
@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from db_conn import get_db
+from routers.auth import get_current_user
+from schemas import WebhookDeliveryResponse, CircuitBreakerState
+from models import WebhookDelivery
+from services import webhook_outbox, http_client
+
+router = APIRouter(
+    prefix="/api/webhooks",
+    tags=["webhooks"],
+    dependencies=[Depends(get_current_user)]
+)
+
+@router.get("/deliveries", response_model=List[WebhookDeliveryResponse])
+def list_webhook_deliveries(
+    status: Optional[str] = None,
+    item_id: Optional[str] = None,
+    ids: Optional[str] = None,
+    limit: int = 50,
+    db: Session = Depends(get_db)
+):
+    """Latest outbox deliveries, e.g. status=dead for the dead-letter list, or
+    ids=a,b,c for the per-item results of a bulk publish"""
+    query = db.query(WebhookDelivery)
+    if ids:
+        delivery_ids = [i.strip() for i in ids.split(",") if i.strip()][:500]
+        query = query.filter(WebhookDelivery.id.in_(delivery_ids))
+    if status:
+        query = query.filter(WebhookDelivery.status == status)
+    if item_id:
+        query = query.filter(WebhookDelivery.item_id == item_id)
+    return query.order_by(WebhookDelivery.created_at.desc()).limit(min(limit, 500)).all()
+
+@router.get("/deliveries/{delivery_id}", response_model=WebhookDeliveryResponse)
+def get_webhook_delivery(delivery_id: str, db: Session = Depends(get_db)):
+    """Delivery state of a queued webhook (id returned by the publish/update endpoints)"""
+    delivery = db.query(WebhookDelivery).filter(WebhookDelivery.id == delivery_id).first()
+    if not delivery:
+        raise HTTPException(status_code=404, detail="Delivery not found")
+    return delivery
+
+@router.post("/deliveries/{delivery_id}/retry", response_model=WebhookDeliveryResponse)
+def retry_webhook_delivery(delivery_id: str, db: Session = Depends(get_db)):
+    """Re-queue a dead-lettered delivery"""
+    delivery = webhook_outbox.requeue(db, delivery_id)
+    if not delivery:
+        raise HTTPException(status_code=404, detail="Delivery not found")
+    return delivery
+
+@router.get("/breakers", response_model=List[CircuitBreakerState])
+def get_circuit_breakers():
+    """Circuit breaker state of every outbound integration"""
+    return http_client.breaker_states()
@@ -144,6 +144,16 @@ class CompetenceCreate(BaseModel):
     product_code: Optional[str] = None
     product_name: Optional[str] = None
 
+class CompetenceImportRequest(BaseModel):
+    items: List[CompetenceCreate]
+
+class CompetenceImportResponse(BaseModel):
+    created: int
+    skipped: int
+    skipped_duplicates: int = 0  # repeated within the uploaded list
+    skipped_existing: int = 0    # catalog_link or product_code already tracked
+    skipped_invalid: int = 0     # missing URL
+
 class CompetenceUpdate(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     selling_price: Optional[float] = None
@@ -168,6 +178,79 @@ class CompetenceResponse(CompetenceBase):
     timestamp: Optional[datetime] = None
     # No id field in DB
 
+class CompetenceRecalculateRequest(BaseModel):
+    """Bulk margin recalculation: global assumptions to apply plus the target filter."""
+    # Target selection (all items with a catalog_link when omitted)
+    product_codes: Optional[List[str]] = None
+    search: Optional[str] = None
+    status: Optional[str] = None
+    # Parameter overrides (existing per-item values are kept when omitted)
+    ml_commision_percentage: Optional[float] = None
+    estimated_returns_percentage: Optional[float] = None
+    shipping_cost: Optional[float] = None
+    packaging_cost: Optional[float] = None
+    advertising_cost: Optional[float] = None
+    withholdings_gross_income_tax: Optional[float] = None
+    financial_cost: Optional[float] = None
+
+class CompetenceApplyPricesRequest(BaseModel):
+    """Push competence-driven prices to product_catalog_sync.price_mercadolibre."""
+    product_codes: List[str]
+    source: str = "selling_price"  # 'selling_price' or 'competitor_price'
+    adjustment_percentage: Optional[float] = None  # e.g. -2 to undercut the source by 2%
+    dry_run: bool = False
+
+class CompetencePriceChange(BaseModel):
+    product_id: int
+    product_code: str
+    product_name: Optional[str] = None
+    current_price: Optional[float] = None
+    new_price: float
+
+class CompetenceApplyPricesResponse(BaseModel):
+    dry_run: bool
+    updated: int
+    changes: List[CompetencePriceChange]
+
+class CompetenceRecalculateResponse(BaseModel):
+    matched: int
+    updated: int
+    batches: int
+
+class ScrapeJobCreate(BaseModel):
+    """Either explicit product codes or a staleness policy (items not scraped in `stale_hours`)."""
+    product_codes: Optional[List[str]] = None
+    stale_hours: Optional[int] = 24
+    include_errors: bool = True
+    limit: Optional[int] = None
+
+class ScrapeJobResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: str
+    policy: Optional[str] = None
+    status: Optional[str] = None
+    total_items: int = 0
+    dispatched_items: int = 0
+    completed_items: int = 0
+    failed_items: int = 0
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    dispatch_mode: Optional[str] = None  # 'codes' or 'full' (scrapper can't take codes: global scrape)
+
+class PriceWindowStats(BaseModel):
+    days: int
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    avg_price: Optional[float] = None
+    samples: int = 0
+
+class PriceSparklinePoint(BaseModel):
+    ts: datetime
+    price: float
+    min_price: float
+    max_price: float
+
 class CompetenceListResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     items: List[CompetenceResponse]
@@ -215,6 +298,88 @@ class SellingCalculationResponse(BaseModel):
     total_selling_cost: Optional[float] = None
 
 
+class SellingBatchRequest(BaseModel):
+    """Products to (re)calculate: explicit codes and/or every product of a category."""
+    product_codes: Optional[List[str]] = None
+    category: Optional[str] = None
+
+class SellingBatchItemResult(BaseModel):
+    product_code: Optional[str] = None
+    item_id: Optional[int] = None
+    success: bool
+    attempts: int = 0
+    message: str
+
+class SellingBatchResponse(BaseModel):
+    batch_id: str
+    requested: int
+    sent: int
+    failed: int
+    not_found: List[str] = []
+    results: List[SellingBatchItemResult]
+
+class SellingBatchStatusResponse(BaseModel):
+    batch_id: str
+    total: int
+    calculated: int
+    pending: int
+    pending_item_ids: List[int] = []
+
+
+class SellingEstimateRequest(BaseModel):
+    """What-if prices for a catalog product (or a bare category)."""
+    prices: List[float]
+    product_code: Optional[str] = None
+    category_id: Optional[str] = None
+    ship_cost: Optional[float] = None
+
+class SellingEstimate(BaseModel):
+    price: float
+    percentage_fee: Optional[float] = None
+    meli_percentage_fee: Optional[float] = None
+    financing_add_on_fee: Optional[float] = None
+    fixed_fee: Optional[float] = None
+    sale_fee_amount: float
+    ship_cost_amount: float
+    total_selling_cost: float
+    net_amount: float
+
+class SellingEstimateResponse(BaseModel):
+    product_code: Optional[str] = None
+    category_id: Optional[str] = None
+    estimates: List[SellingEstimate]
+
+class SellingReconcileResponse(BaseModel):
+    compared: int
+    within_one_peso: int
+    mean_abs_error: float
+    max_abs_error: float
+    worst_item_ids: List[str]
+
+
+class WebhookDeliveryResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: str
+    event_type: Optional[str] = None
+    item_id: Optional[str] = None
+    site: Optional[str] = None
+    status: str
+    attempts: int = 0
+    next_attempt_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    delivered_at: Optional[datetime] = None
+
+
+class CircuitBreakerState(BaseModel):
+    target: str
+    state: str  # closed, open, half-open
+    calls_in_window: int
+    failures_in_window: int
+    retry_after_seconds: Optional[float] = None
+    last_error: Optional[str] = None
+
+
 # --- Performance / Quality Score Schemas ---
 
 class PerformanceRuleRow(BaseModel):
@@ -0,0 +1,122 @@
+"""
+Dashboard Warmer
+Precomputes the standard date presets of the orders dashboard in a background
+thread, so the first load after a cold start (or a cache expiry) is served from
+memory instead of aggregating v_orders_for_metrics on the request path.
+
+Presets that include today are cached with the dashboard's own TTL and
+re-warmed a little more often than that, so they stay warm without being
+staler than a request-cached entry. Closed ranges (last_month) are refreshed
+every ORDERS_WARMUP_INTERVAL_SECONDS.
+
+Configuration (environment variables):
+    ORDERS_WARMUP_INTERVAL_SECONDS  refresh period of closed ranges, 0 disables the warmer (default 300)
+    ORDERS_WARMUP_PRESETS           comma separated preset names
+                                    (default "today,7d,30d,this_month,last_month")
+"""
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+WARMUP_INTERVAL_SECONDS = int(os.getenv("ORDERS_WARMUP_INTERVAL_SECONDS", "300"))
+WARMUP_PRESETS = [
+    p.strip() for p in os.getenv("ORDERS_WARMUP_PRESETS", "today,7d,30d,this_month,last_month").split(",")
+    if p.strip()
+]
+
+# Open ranges are re-warmed this long before their cache entries expire
+_OPEN_REFRESH_MARGIN_SECONDS = 10
+
+_warmer_thread = None
+
+
+def preset_range(preset, today=None):
+    """Return (start_date, end_date) as YYYY-MM-DD strings for a preset name."""
+    today = today or date.today()
+    if preset == "today":
+        start, end = today, today
+    elif preset.endswith("d") and preset[:-1].isdigit():
+        # "7d" -> the last 7 days including today
+        start, end = today - timedelta(days=int(preset[:-1]) - 1), today
+    elif preset == "this_month":
+        start, end = today.replace(day=1), today
+    elif preset == "last_month":
+        end = today.replace(day=1) - timedelta(days=1)
+        start = end.replace(day=1)
+    else:
+        return None
+    return start.isoformat(), end.isoformat()
+
+
+def warm_dashboard_cache(include_closed=True):
+    """Recompute /metrics, /chart-data and /top-stats for the configured presets
+    (only those that include today when include_closed is False)."""
+    from db_conn import SessionLocal
+    from routers import orders
+
+    # Closed ranges can't change: keep them until the next refresh replaces them.
+    # Ranges that include today get the dashboard's own TTL, so they are never staler
+    # than an entry cached by a request.
+    closed_ttl = max(WARMUP_INTERVAL_SECONDS, orders._CACHE_TTL_SECONDS) + 60
+    today = date.today().isoformat()
+    computations = [
+        ("metrics", orders.compute_order_metrics),
+        ("chart", orders.compute_chart_data),
+        ("top", orders.compute_top_stats),
+    ]
+
+    db = SessionLocal()
+    try:
+        for preset in WARMUP_PRESETS:
+            date_range = preset_range(preset)
+            if not date_range:
+                print(f"Dashboard warmer: unknown preset '{preset}', skipping")
+                continue
+            start_date, end_date = date_range
+            is_open = end_date >= today
+            if not is_open and not include_closed:
+                continue
+            ttl = orders._CACHE_TTL_SECONDS if is_open else closed_ttl
+            for prefix, compute in computations:
+                try:
+                    value = compute(db, start_date, end_date)
+                    cache_key = orders.dashboard_cache_key(prefix, start_date, end_date, None, None, None, None)
+                    orders.set_in_cache(cache_key, value, ttl=ttl)
+                except Exception as e:
+                    db.rollback()
+                    print(f"Dashboard warmer: error warming {prefix} for '{preset}': {e}")
+    finally:
+        db.close()
+
+
+def _warmer_loop():
+    from routers import orders
+
+    # Open ranges must be refreshed before their (short) cache entries expire
+    open_interval = max(1, min(WARMUP_INTERVAL_SECONDS, orders._CACHE_TTL_SECONDS - _OPEN_REFRESH_MARGIN_SECONDS))
+    next_closed = 0.0
+    while True:
+        started = time.time()
+        include_closed = started >= next_closed
+        try:
+            warm_dashboard_cache(include_closed=include_closed)
+            if include_closed:
+                next_closed = started + WARMUP_INTERVAL_SECONDS
+                print(f"Dashboard warmer: refreshed {len(WARMUP_PRESETS)} presets in {time.time() - started:.2f}s")
+        except Exception as e:
+            print(f"Dashboard warmer error: {e}")
+        time.sleep(max(0.0, open_interval - (time.time() - started)))
+
+
+def start_dashboard_warmer():
+    """Start the background refresh thread (idempotent)."""
+    global _warmer_thread
+    if WARMUP_INTERVAL_SECONDS <= 0 or not WARMUP_PRESETS:
+        print("Dashboard warmer disabled")
+        return None
+    if _warmer_thread and _warmer_thread.is_alive():
+        return _warmer_thread
+    _warmer_thread = threading.Thread(target=_warmer_loop, name="dashboard-warmer", daemon=True)
+    _warmer_thread.start()
+    return _warmer_thread
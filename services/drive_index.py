@@ -0,0 +1,432 @@
+"""
+Drive Metadata Index
+Local copy of the Drive file metadata (id, parent folder, name, mime type,
+size, md5, modifiedTime, links) in mercadolibre.drive_files, so gallery
+listings, logo lookups and the settings file lookup are answered from the
+database instead of asking Drive on every request.
+
+Only the app's folders are indexed: the files in ROOT_DRIVE_FOLDER_ID and
+LOGOS_FOLDER_ID, and the files of the folders directly inside them (the
+product folders). Anything else the account can see is ignored.
+
+A background thread keeps the table in sync with the Drive changes feed. The
+first run copies the non-trashed files of those folders with files.list and
+stores the start page token taken just before the copy. After that, each pass
+reads only the changes since the persisted token (drive_sync_state) and upserts
+or deletes the affected rows. Writes made by this app (uploads, new folders,
+deleted logos) are also recorded at once, so they are visible before the next
+pass.
+
+Passes run on one instance at a time: each takes a MySQL named lock (GET_LOCK)
+and instances that don't get it skip the pass. A resync only clears the page
+token; the next pass (wherever it runs) does the full copy.
+
+Reads only use the index while the last pass, by this or another instance, is
+recent (see is_ready); otherwise callers fall back to live Drive queries. Drive's
+thumbnailLink is a short-lived URL, so listings from the index point images at
+the /api/products/drive-image proxy instead of the stored link.
+
+Configuration (environment variables):
+    DRIVE_INDEX_SYNC_SECONDS        time between changes-feed passes, 0 disables the index (default 30)
+    DRIVE_INDEX_MAX_STALENESS_SECONDS  age of the last good pass after which reads go live (default 300)
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import or_, text
+
+from db_conn import SessionLocal, engine
+from models import DriveFile, DriveSyncState
+
+DRIVE_INDEX_SYNC_SECONDS = int(os.getenv("DRIVE_INDEX_SYNC_SECONDS", "30"))
+DRIVE_INDEX_MAX_STALENESS_SECONDS = int(os.getenv("DRIVE_INDEX_MAX_STALENESS_SECONDS", "300"))
+
+FILE_FIELDS = "id, name, mimeType, parents, size, md5Checksum, modifiedTime, thumbnailLink, webViewLink, webContentLink, trashed"
+FOLDER_MIME = "application/vnd.google-apps.folder"
+IMAGE_PROXY_PATH = "/api/products/drive-image"
+_STATE_NAME = "drive"
+_LOCK_NAME = "mercadolibre.drive_index_sync"
+_WRITE_CHUNK = 500
+# Parent folders per files.list query in the full copy
+_LIST_PARENTS_CHUNK = 50
+
+_sync_thread = None
+_last_synced = 0.0
+_sync_lock = threading.Lock()
+_wake = threading.Event()
+
+
+def is_ready() -> bool:
+    """True while the last successful pass of this process is recent enough to trust the index."""
+    return DRIVE_INDEX_SYNC_SECONDS > 0 and time.time() - _last_synced < DRIVE_INDEX_MAX_STALENESS_SECONDS
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _to_row(f: dict, now: datetime) -> dict:
+    parents = f.get("parents") or [None]
+    return {
+        "id": f["id"],
+        "parent_id": parents[0],
+        "name": f.get("name"),
+        "mime_type": f.get("mimeType"),
+        "size": int(f["size"]) if f.get("size") else None,
+        "md5": f.get("md5Checksum"),
+        "modified_time": _parse_time(f.get("modifiedTime")),
+        "thumbnail_link": f.get("thumbnailLink"),
+        "web_view_link": f.get("webViewLink"),
+        "web_content_link": f.get("webContentLink"),
+        "synced_at": now,
+    }
+
+
+def _to_file(row: DriveFile) -> dict:
+    """Index row in the shape Drive's files.list returns (images link to the stable proxy)."""
+    f = {
+        "id": row.id,
+        "name": row.name,
+        "mimeType": row.mime_type,
+        "webViewLink": row.web_view_link,
+        "thumbnailLink": row.thumbnail_link,
+        "webContentLink": row.web_content_link,
+    }
+    if (row.mime_type or "").startswith("image/"):
+        # The stored thumbnailLink expires after a while; the proxy URL doesn't
+        f["thumbnailLink"] = f"{IMAGE_PROXY_PATH}/{row.id}?size=thumbnail"
+        f["largeImageLink"] = f"{IMAGE_PROXY_PATH}/{row.id}?size=large"
+    if row.size is not None:
+        f["size"] = str(row.size)
+    if row.md5:
+        f["md5Checksum"] = row.md5
+    if row.modified_time:
+        f["modifiedTime"] = row.modified_time.isoformat(timespec="milliseconds") + "Z"
+    return f
+
+
+def _apply(db, upserts: list, removed_ids: list):
+    """Replace the rows of changed files and drop removed/trashed ones (chunked, portable SQL)."""
+    now = datetime.utcnow()
+    rows = [_to_row(f, now) for f in upserts]
+    stale_ids = [r["id"] for r in rows] + list(removed_ids)
+    for start in range(0, len(stale_ids), _WRITE_CHUNK):
+        db.query(DriveFile).filter(DriveFile.id.in_(stale_ids[start:start + _WRITE_CHUNK])).delete(
+            synchronize_session=False
+        )
+    for start in range(0, len(rows), _WRITE_CHUNK):
+        db.bulk_insert_mappings(DriveFile, rows[start:start + _WRITE_CHUNK])
+
+
+def _split_changes(files: list):
+    upserts, removed = {}, set()
+    for f in files:
+        if f.get("trashed"):
+            removed.add(f["id"])
+            upserts.pop(f["id"], None)
+        else:
+            upserts[f["id"]] = f
+            removed.discard(f["id"])
+    return list(upserts.values()), list(removed)
+
+
+def _index_roots() -> list:
+    """Folders whose files (and whose subfolders' files) are indexed."""
+    from services import drive_service
+    return list(dict.fromkeys([
+        drive_service.ROOT_FOLDER_ID,
+        os.getenv("LOGOS_FOLDER_ID", drive_service.ROOT_FOLDER_ID)
+    ]))
+
+
+def _parent(f: dict):
+    return (f.get("parents") or [None])[0]
+
+
+def _list_children(service, parent_ids: list) -> list:
+    files = []
+    for start in range(0, len(parent_ids), _LIST_PARENTS_CHUNK):
+        parents = " or ".join(f"'{p}' in parents" for p in parent_ids[start:start + _LIST_PARENTS_CHUNK])
+        page_token = None
+        while True:
+            results = service.files().list(
+                q=f"({parents}) and trashed = false",
+                fields=f"nextPageToken, files({FILE_FIELDS})",
+                pageSize=1000,
+                pageToken=page_token,
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True
+            ).execute()
+            files.extend(results.get("files", []))
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                break
+    return files
+
+
+def full_sync(service, db) -> str:
+    """Copy the indexed folders into the index; returns the page token to follow changes from."""
+    start_token = service.changes().getStartPageToken(supportsAllDrives=True).execute()["startPageToken"]
+    top = _list_children(service, _index_roots())
+    subfolders = list(dict.fromkeys(f["id"] for f in top if f.get("mimeType") == FOLDER_MIME))
+    files = {f["id"]: f for f in top + _list_children(service, subfolders)}
+
+    db.query(DriveFile).delete(synchronize_session=False)
+    _apply(db, list(files.values()), [])
+    print(f"Drive index: full sync copied {len(files)} files")
+    return start_token
+
+
+def _split_scope(db, files: list):
+    """(files inside the indexed folders, ids of the rest) for a batch of changed files."""
+    roots = set(_index_roots())
+    # Folders whose files are indexed: the roots and the folders directly inside them,
+    # known from the index or arriving in this same batch
+    folders = set(roots)
+    folders.update(f["id"] for f in files if f.get("mimeType") == FOLDER_MIME and _parent(f) in roots)
+    unknown = list({_parent(f) for f in files} - folders - {None})
+    for start in range(0, len(unknown), _WRITE_CHUNK):
+        rows = db.query(DriveFile.id).filter(
+            DriveFile.id.in_(unknown[start:start + _WRITE_CHUNK]),
+            DriveFile.parent_id.in_(roots),
+            DriveFile.mime_type == FOLDER_MIME
+        ).all()
+        folders.update(r[0] for r in rows)
+    inside = [f for f in files if _parent(f) in folders]
+    outside = [f["id"] for f in files if _parent(f) not in folders]
+    return inside, outside
+
+
+def sync_changes(service, db, page_token: str) -> tuple:
+    """Apply the changes since `page_token`; returns (new token, number of changes)."""
+    changed, count = [], 0
+    while True:
+        results = service.changes().list(
+            pageToken=page_token,
+            fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))",
+            pageSize=1000,
+            supportsAllDrives=True,
+            includeItemsFromAllDrives=True
+        ).execute()
+        for change in results.get("changes", []):
+            count += 1
+            if change.get("removed") or not change.get("file"):
+                changed.append({"id": change["fileId"], "trashed": True})
+            else:
+                changed.append(change["file"])
+        if results.get("newStartPageToken"):
+            page_token = results["newStartPageToken"]
+            break
+        page_token = results["nextPageToken"]
+
+    upserts, removed_ids = _split_changes(changed)
+    # Files outside the indexed folders are dropped too, in case they were moved out
+    upserts, outside_ids = _split_scope(db, upserts)
+    _apply(db, upserts, removed_ids + outside_ids)
+    return page_token, count
+
+
+@contextmanager
+def _leadership():
+    """Yields True when this process may run a pass (holds the MySQL named lock).
+
+    The lock belongs to a dedicated connection and is released with it. Other
+    databases (the local SQLite fallback) have a single process, so the
+    in-process lock is enough there."""
+    if engine.dialect.name != "mysql":
+        yield True
+        return
+    conn = engine.connect()
+    try:
+        acquired = conn.execute(text("SELECT GET_LOCK(:name, 0)"), {"name": _LOCK_NAME}).scalar() == 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": _LOCK_NAME})
+    finally:
+        conn.close()
+
+
+def _follow(db):
+    """Trust the index as fresh as the last pass another instance committed."""
+    global _last_synced
+    state = db.query(DriveSyncState).filter(DriveSyncState.name == _STATE_NAME).first()
+    if state and state.page_token and state.synced_at:
+        age = max(0.0, (datetime.utcnow() - state.synced_at).total_seconds())
+        _last_synced = max(_last_synced, time.time() - age)
+
+
+def sync_once(service=None) -> dict:
+    """One pass: full copy when there is no persisted token yet, otherwise the changes since it."""
+    global _last_synced
+    from services import drive_service
+
+    service = service or drive_service.get_drive_service()
+    if not service:
+        return {"status": "skipped", "reason": "Drive not connected"}
+
+    with _sync_lock, _leadership() as leader:
+        db = SessionLocal()
+        try:
+            if not leader:
+                _follow(db)
+                return {"status": "skipped", "reason": "Another instance is syncing"}
+            state = db.query(DriveSyncState).filter(DriveSyncState.name == _STATE_NAME).first()
+            now = datetime.utcnow()
+            if not state or not state.page_token:
+                token = full_sync(service, db)
+                if not state:
+                    state = DriveSyncState(name=_STATE_NAME)
+                    db.add(state)
+                state.full_sync_at = now
+                count, mode = None, "full"
+            else:
+                token, count = sync_changes(service, db, state.page_token)
+                mode = "changes"
+            state.page_token = token
+            state.synced_at = now
+            db.commit()
+            _last_synced = time.time()
+            return {"status": "ok", "mode": mode, "changes": count}
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+def reset(db):
+    """Forget the page token so the next pass copies everything again (e.g. after switching Drive accounts)."""
+    global _last_synced
+    db.query(DriveSyncState).filter(DriveSyncState.name == _STATE_NAME).update(
+        {"page_token": None}, synchronize_session=False
+    )
+    db.commit()
+    _last_synced = 0.0
+    _wake.set()
+
+
+def status() -> dict:
+    db = SessionLocal()
+    try:
+        state = db.query(DriveSyncState).filter(DriveSyncState.name == _STATE_NAME).first()
+        return {
+            "enabled": DRIVE_INDEX_SYNC_SECONDS > 0,
+            "ready": is_ready(),
+            "files": db.query(DriveFile).count(),
+            "full_sync_at": state.full_sync_at.isoformat() if state and state.full_sync_at else None,
+            "synced_at": state.synced_at.isoformat() if state and state.synced_at else None,
+        }
+    finally:
+        db.close()
+
+
+# --- Reads -------------------------------------------------------------------
+
+def list_folders(folder_ids: list, image_only: bool = True, limit_per_folder: int = None) -> dict:
+    """{folder_id: [files]} for many folders with one query, most recently modified first."""
+    folder_ids = list(dict.fromkeys(folder_ids))
+    listings = {folder_id: [] for folder_id in folder_ids}
+    if not folder_ids:
+        return listings
+    db = SessionLocal()
+    try:
+        query = db.query(DriveFile).filter(DriveFile.parent_id.in_(folder_ids))
+        if image_only:
+            query = query.filter(DriveFile.mime_type.like("image/%"))
+        for row in query.order_by(DriveFile.modified_time.desc()).all():
+            files = listings[row.parent_id]
+            if limit_per_folder is None or len(files) < limit_per_folder:
+                files.append(_to_file(row))
+        return listings
+    finally:
+        db.close()
+
+
+def list_folder(folder_id: str, image_only: bool = True, limit: int = None) -> list:
+    return list_folders([folder_id], image_only, limit)[folder_id]
+
+
+def find_files(folder_id: str, name: str = None, name_contains: list = None) -> list:
+    """Files of a folder by exact name or name substrings, most recently modified first."""
+    db = SessionLocal()
+    try:
+        query = db.query(DriveFile).filter(DriveFile.parent_id == folder_id)
+        if name is not None:
+            query = query.filter(DriveFile.name == name)
+        if name_contains:
+            query = query.filter(or_(*(DriveFile.name.contains(part) for part in name_contains)))
+        return [_to_file(row) for row in query.order_by(DriveFile.modified_time.desc()).all()]
+    finally:
+        db.close()
+
+
+# --- Local writes --------------------------------------------------------------
+
+def record(file: dict, name: str = None, folder_id: str = None, mime_type: str = None):
+    """Add a file this app just created/updated, without waiting for the changes feed."""
+    if DRIVE_INDEX_SYNC_SECONDS <= 0 or not file or not file.get("id"):
+        return
+    f = dict(file)
+    f.setdefault("name", name)
+    f.setdefault("mimeType", mime_type)
+    if folder_id and not f.get("parents"):
+        f["parents"] = [folder_id]
+    f.setdefault("modifiedTime", datetime.utcnow().isoformat(timespec="milliseconds") + "Z")
+    _write(lambda db: _apply(db, [f], []))
+
+
+def forget(file_id: str):
+    """Drop a file this app just deleted."""
+    if DRIVE_INDEX_SYNC_SECONDS <= 0 or not file_id:
+        return
+    _write(lambda db: _apply(db, [], [file_id]))
+
+
+def _write(apply):
+    db = SessionLocal()
+    try:
+        apply(db)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Drive index: local write failed (the changes feed will catch up): {e}")
+    finally:
+        db.close()
+
+
+# --- Background sync -------------------------------------------------------------
+
+def _sync_loop():
+    while True:
+        try:
+            result = sync_once()
+            if result.get("mode") == "full" or result.get("changes"):
+                print(f"Drive index: {result}")
+        except Exception as e:
+            print(f"Drive index sync error: {e}")
+        # A reset wakes the loop so the full copy starts right away
+        _wake.wait(DRIVE_INDEX_SYNC_SECONDS)
+        _wake.clear()
+
+
+def start_drive_index_sync():
+    """Start the background changes-feed thread (idempotent)."""
+    global _sync_thread
+    if DRIVE_INDEX_SYNC_SECONDS <= 0:
+        print("Drive index sync disabled")
+        return None
+    if _sync_thread and _sync_thread.is_alive():
+        return _sync_thread
+    _sync_thread = threading.Thread(target=_sync_loop, name="drive-index-sync", daemon=True)
+    _sync_thread.start()
+    return _sync_thread
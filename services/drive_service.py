@@ -1,11 +1,20 @@
 import os
+import time
+_import_started = time.perf_counter()
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google.oauth2 import service_account
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient import discovery_cache
 from googleapiclient.http import MediaIoBaseUpload
 import io
+import json
+import threading
+from datetime import datetime
+
+# Time spent importing the Google client libraries (reported by the startup benchmark)
+IMPORT_SECONDS = time.perf_counter() - _import_started
 
 # SCOPES required for Drive access
 SCOPES = ['https://www.googleapis.com/auth/drive']
@@ -22,8 +31,40 @@ else:
 # ROOT FOLDER ID: Get from Env Var or use default
 ROOT_FOLDER_ID = os.getenv('ROOT_DRIVE_FOLDER_ID', "1dd2P6OkaFgvkah-sBr_sjagAnCk31n-v")
 
-def get_drive_service():
-    """Builds and returns the Drive service."""
+# Refresh the shared access token this long before it expires
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv('DRIVE_TOKEN_REFRESH_MARGIN_SECONDS', '300'))
+
+# Process-wide credentials; Drive services are built per thread on top of them
+_creds = None
+_creds_source = None
+_creds_generation = 0
+_creds_lock = threading.RLock()
+_local = threading.local()
+
+# Drive v3 discovery document: read from disk once, never fetched over the network.
+# DRIVE_DISCOVERY_DOC may point to a pinned copy; otherwise the copy bundled with
+# google-api-python-client is used.
+DRIVE_DISCOVERY_DOC = os.getenv('DRIVE_DISCOVERY_DOC')
+_discovery_doc = None
+
+# Chunk size of streamed resumable uploads (Drive requires a multiple of 256 KB)
+UPLOAD_CHUNK_BYTES = max(1, int(os.getenv('DRIVE_UPLOAD_CHUNK_MB', '8'))) * 1024 * 1024
+
+# Image listings of product folders: folder_id -> (files, expire_at)
+FOLDER_LIST_TTL_SECONDS = int(os.getenv('DRIVE_FOLDER_LIST_TTL_SECONDS', '60'))
+FOLDER_LIST_LIMIT = 10  # images returned per folder
+_FOLDERS_PER_QUERY = 25  # keeps the OR-query well under Drive's query length limit
+_folder_files_cache = {}
+
+# "fake" serves an in-memory Drive (services/fake_drive.py) for local development and tests
+DRIVE_BACKEND = os.getenv('DRIVE_BACKEND', 'google')
+
+# Filled by benchmark_drive_client() at startup
+STARTUP_BENCHMARK = {}
+
+def _resolve_credentials():
+    """Find valid credentials (env refresh token, user token, service account, local flow).
+    Returns (creds, source) or (None, None)."""
     creds = None
     # SCOPES must strictly match the ones authorized in OAuth Playground
     SCOPES = ['https://www.googleapis.com/auth/drive']
@@ -58,7 +99,7 @@ def get_drive_service():
                     
                     if creds and creds.valid:
                         print(">>> AUTH: Using PERMANENT REFRESH TOKEN (Verified Success)", flush=True)
-                        return build('drive', 'v3', credentials=creds)
+                        return creds, "refresh_token"
             
             print("DEBUG: Permanent Refresh Token provided but could not be verified or refreshed.", flush=True)
         except Exception as e:
@@ -125,7 +166,7 @@ def get_drive_service():
             
             if creds and creds.valid:
                 print(">>> AUTH: Using USER CREDENTIALS (Full Quota)", flush=True)
-                return build('drive', 'v3', credentials=creds)
+                return creds, "user_token"
             else:
                 print(f"DEBUG: Creds were found but are not valid. Valid: {creds.valid if creds else 'N/A'}", flush=True)
         except Exception as e:
@@ -139,7 +180,7 @@ def get_drive_service():
             creds = service_account.Credentials.from_service_account_file(
                 service_account_path, scopes=SCOPES)
             print(">>> AUTH: Using SERVICE ACCOUNT (Warning: No individual quota)", flush=True)
-            return build('drive', 'v3', credentials=creds)
+            return creds, "service_account"
         except Exception as e:
             print(f"DEBUG: Service Account failed: {e}", flush=True)
 
@@ -151,12 +192,123 @@ def get_drive_service():
             with open(TOKEN_FILE, 'w') as token:
                 token.write(creds.to_json())
             print(">>> AUTH: Using LOCAL INTERACTIVE FLOW", flush=True)
-            return build('drive', 'v3', credentials=creds)
+            return creds, "interactive"
         except Exception as e:
             print(f"DEBUG: Interactive flow failed: {e}", flush=True)
 
     print("CRITICAL: No valid authentication found for Google Drive", flush=True)
-    return None
+    return None, None
+
+
+def _persist_user_token(creds):
+    """Keep the runtime token file in step with a refreshed user token."""
+    try:
+        with open(RUNTIME_TOKEN_FILE, 'w') as token:
+            token.write(creds.to_json())
+    except Exception as e:
+        print(f"DEBUG: Could not persist refreshed token: {e}", flush=True)
+
+
+def get_discovery_doc():
+    """Parsed Drive v3 discovery document (loaded and parsed once per process)."""
+    global _discovery_doc
+    if _discovery_doc is None:
+        if DRIVE_DISCOVERY_DOC and os.path.exists(DRIVE_DISCOVERY_DOC):
+            with open(DRIVE_DISCOVERY_DOC, 'r', encoding='utf-8') as f:
+                raw = f.read()
+        else:
+            raw = discovery_cache.get_static_doc('drive', 'v3')
+        if not raw:
+            raise RuntimeError("Drive v3 discovery document not available offline")
+        _discovery_doc = json.loads(raw)
+    return _discovery_doc
+
+
+def get_credentials():
+    """Process-wide credentials: resolved once, refreshed only when close to expiry."""
+    global _creds, _creds_source, _creds_generation
+    with _creds_lock:
+        if _creds is not None and _creds.expiry is not None and getattr(_creds, 'refresh_token', True):
+            remaining = (_creds.expiry - datetime.utcnow()).total_seconds()
+            if remaining < TOKEN_REFRESH_MARGIN_SECONDS:
+                try:
+                    _creds.refresh(Request())
+                    if _creds_source == "user_token":
+                        _persist_user_token(_creds)
+                    print(f"DEBUG: Drive token refreshed ({_creds_source})", flush=True)
+                except Exception as e:
+                    print(f"DEBUG: Drive token refresh failed, resolving credentials again: {e}", flush=True)
+                    _creds = None
+
+        if _creds is None:
+            _creds, _creds_source = _resolve_credentials()
+            _creds_generation += 1
+        return _creds
+
+
+def get_drive_service():
+    """Builds and returns the Drive service.
+
+    The service is built once per thread (httplib2 connections are not
+    thread-safe) on top of the shared credentials, and reused while those
+    credentials stay the same, so its HTTP connection is kept alive."""
+    if DRIVE_BACKEND == 'fake':
+        from services.fake_drive import get_fake_drive
+        return get_fake_drive()
+    creds = get_credentials()
+    if creds is None:
+        return None
+    cached = getattr(_local, 'service', None)
+    if cached is not None and getattr(_local, 'generation', None) == _creds_generation:
+        return cached
+    _local.service = build_from_document(get_discovery_doc(), credentials=creds)
+    _local.generation = _creds_generation
+    return _local.service
+
+
+def benchmark_drive_client(first_request: bool = True):
+    """Time each part of getting a usable Drive client (imports, discovery doc,
+    credentials, client build, first API call) and warm the caches on the way."""
+    timings = {"import_seconds": round(IMPORT_SECONDS, 4)}
+
+    started = time.perf_counter()
+    get_discovery_doc()
+    timings["discovery_doc_seconds"] = round(time.perf_counter() - started, 4)
+
+    started = time.perf_counter()
+    creds = get_credentials()
+    timings["credentials_seconds"] = round(time.perf_counter() - started, 4)
+    timings["credentials_source"] = _creds_source
+
+    if creds is not None:
+        started = time.perf_counter()
+        service = get_drive_service()
+        timings["build_seconds"] = round(time.perf_counter() - started, 4)
+
+        if first_request:
+            started = time.perf_counter()
+            try:
+                service.files().list(pageSize=1, fields="files(id)", q=f"'{ROOT_FOLDER_ID}' in parents").execute()
+                timings["first_request_seconds"] = round(time.perf_counter() - started, 4)
+            except Exception as e:
+                timings["first_request_error"] = str(e)[:200]
+
+    STARTUP_BENCHMARK.clear()
+    STARTUP_BENCHMARK.update(timings)
+    return timings
+
+
+def reset_drive_service():
+    """Forget cached credentials/services (e.g. after a new token is authorized)."""
+    global _creds, _creds_source, _creds_generation
+    with _creds_lock:
+        _creds, _creds_source = None, None
+        _creds_generation += 1
+
+def _index_written(file, name, folder_id, mime_type):
+    """Make a file we just created visible in the metadata index right away."""
+    from services import drive_index
+    drive_index.record(file, name=name, folder_id=folder_id, mime_type=mime_type)
 
 def create_folder(service, folder_name, parent_id=None):
     """Create a folder on Google Drive."""
@@ -174,6 +326,7 @@ def create_folder(service, folder_name, parent_id=None):
             supportsAllDrives=True
         ).execute()
         print(f'Folder ID: "{file.get("id")}". Link: {file.get("webViewLink")}')
+        _index_written(file, folder_name, parent_id, 'application/vnd.google-apps.folder')
         return file
     except Exception as e:
         print(f'An error occurred creating folder: {e}')
@@ -214,6 +367,7 @@ def upload_file(service, file_content, file_name, folder_id, content_type='image
             supportsAllDrives=True
         ).execute()
         print(f'File ID: "{file.get("id")}".')
+        _index_written(file, file_name, folder_id, content_type)
         
         if make_public:
             make_file_public(service, file.get('id'))
@@ -223,6 +377,27 @@ def upload_file(service, file_content, file_name, folder_id, content_type='image
         print(f'An error occurred uploading file: {e}')
         raise e
 
+def upload_stream(service, stream, file_name, folder_id, content_type='image/jpeg'):
+    """Upload a file-like object in UPLOAD_CHUNK_BYTES chunks (resumable), without reading it into memory."""
+    file_metadata = {
+        'name': file_name,
+        'parents': [folder_id]
+    }
+    media = MediaIoBaseUpload(stream, mimetype=content_type or 'application/octet-stream',
+                              chunksize=UPLOAD_CHUNK_BYTES, resumable=True)
+    request = service.files().create(
+        body=file_metadata,
+        media_body=media,
+        fields='id, webViewLink, thumbnailLink, webContentLink',
+        supportsAllDrives=True
+    )
+    file = None
+    while file is None:
+        _, file = request.next_chunk()
+    print(f'File ID: "{file.get("id")}".')
+    _index_written(file, file_name, folder_id, content_type)
+    return file
+
 def extract_id_from_url(url):
     """Extract folder ID from a Drive URL."""
     if not url: return None
@@ -241,19 +416,90 @@ def extract_id_from_url(url):
     # Regex might be safer but this covers common Copy Link formats
     return None
 
+def invalidate_folder_listing(folder_id):
+    _folder_files_cache.pop(folder_id, None)
+
+def _cached_listing(folder_id):
+    cached = _folder_files_cache.get(folder_id)
+    if cached and cached[1] > time.time():
+        return cached[0]
+    return None
+
 def list_files(service, folder_id):
-    """List files in a specific folder."""
+    """List files in a specific folder (from the metadata index when it is in sync,
+    otherwise from Drive, cached for FOLDER_LIST_TTL_SECONDS)."""
+    from services import drive_index
+    if drive_index.is_ready():
+        return drive_index.list_folder(folder_id, image_only=True, limit=FOLDER_LIST_LIMIT)
+
+    cached = _cached_listing(folder_id)
+    if cached is not None:
+        return cached
     try:
         # Search for images in this folder
         query = f"'{folder_id}' in parents and (mimeType contains 'image/') and trashed = false"
         results = service.files().list(
             q=query,
             fields="files(id, name, webViewLink, thumbnailLink, webContentLink)",
-            pageSize=10,
+            pageSize=FOLDER_LIST_LIMIT,
             supportsAllDrives=True,
             includeItemsFromAllDrives=True
         ).execute()
-        return results.get('files', [])
+        files = results.get('files', [])
+        _folder_files_cache[folder_id] = (files, time.time() + FOLDER_LIST_TTL_SECONDS)
+        return files
     except Exception as e:
         print(f'An error occurred listing files: {e}')
         return []
+
+def list_files_batch(service, folder_ids):
+    """Image listings of many folders: {folder_id: files}.
+
+    Answered by one query on the metadata index when it is in sync. Otherwise
+    cached folders are answered from memory and the rest are fetched with one
+    `'a' in parents or 'b' in parents ...` query per group of folders."""
+    from services import drive_index
+    if drive_index.is_ready():
+        return drive_index.list_folders(folder_ids, image_only=True, limit_per_folder=FOLDER_LIST_LIMIT)
+
+    listings = {}
+    missing = []
+    for folder_id in dict.fromkeys(folder_ids):
+        cached = _cached_listing(folder_id)
+        if cached is not None:
+            listings[folder_id] = cached
+        else:
+            missing.append(folder_id)
+
+    for start in range(0, len(missing), _FOLDERS_PER_QUERY):
+        group = missing[start:start + _FOLDERS_PER_QUERY]
+        found = {folder_id: [] for folder_id in group}
+        parents = " or ".join(f"'{folder_id}' in parents" for folder_id in group)
+        query = f"({parents}) and (mimeType contains 'image/') and trashed = false"
+        try:
+            page_token = None
+            while True:
+                results = service.files().list(
+                    q=query,
+                    fields="nextPageToken, files(id, name, parents, webViewLink, thumbnailLink, webContentLink)",
+                    pageSize=1000,
+                    pageToken=page_token,
+                    supportsAllDrives=True,
+                    includeItemsFromAllDrives=True
+                ).execute()
+                for f in results.get('files', []):
+                    for parent in f.pop('parents', []):
+                        if parent in found and len(found[parent]) < FOLDER_LIST_LIMIT:
+                            found[parent].append(f)
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+        except Exception as e:
+            print(f'An error occurred listing files of {len(group)} folders: {e}')
+            continue
+
+        expire_at = time.time() + FOLDER_LIST_TTL_SECONDS
+        for folder_id, files in found.items():
+            _folder_files_cache[folder_id] = (files, expire_at)
+            listings[folder_id] = files
+    return listings
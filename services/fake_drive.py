@@ -0,0 +1,325 @@
+"""
+Fake Drive Backend
+In-memory stand-in for the Drive v3 service object, for local development and
+tests without Google credentials. Enabled with DRIVE_BACKEND=fake, in which
+case drive_service.get_drive_service() returns the process-wide FakeDrive.
+
+It covers what this app uses: files().list/get/get_media/create/update/delete
+(with the `q` syntax of our queries: `in parents`, `contains`, `=`, `!=`,
+and/or/not, parentheses; plus orderBy and paging), permissions().create and
+the changes feed (changes().getStartPageToken/list), so the Drive metadata
+index can be exercised end to end. Responses are not trimmed to `fields`.
+"""
+import hashlib
+import re
+import threading
+import uuid
+from datetime import datetime
+
+FOLDER_MIME = "application/vnd.google-apps.folder"
+
+
+class _Request:
+    """Mimics googleapiclient's HttpRequest: execute(), and next_chunk() for uploads."""
+
+    def __init__(self, call):
+        self._call = call
+        self.headers = {}
+
+    def execute(self):
+        return self._call()
+
+    def next_chunk(self):
+        return None, self._call()
+
+
+def _now():
+    return datetime.utcnow().isoformat(timespec="milliseconds") + "Z"
+
+
+def _read_media(media_body) -> bytes:
+    if media_body is None:
+        return None
+    if hasattr(media_body, "getbytes"):
+        return media_body.getbytes(0, media_body.size())
+    return bytes(media_body)
+
+
+# --- Query language ------------------------------------------------------------
+
+_TOKEN = re.compile(r"\s*(?:(\()|(\))|'((?:[^'\\]|\\.)*)'|(!=|=)|([A-Za-z_][A-Za-z0-9_]*))")
+
+
+def _tokenize(q: str) -> list:
+    tokens, pos = [], 0
+    q = q.strip()
+    while pos < len(q):
+        m = _TOKEN.match(q, pos)
+        if not m or m.end() == pos:
+            raise ValueError(f"Invalid query near: {q[pos:]!r}")
+        lparen, rparen, string, op, word = m.groups()
+        if lparen:
+            tokens.append(("(", None))
+        elif rparen:
+            tokens.append((")", None))
+        elif string is not None:
+            tokens.append(("str", string.replace("\\'", "'")))
+        elif op:
+            tokens.append(("op", op))
+        else:
+            tokens.append(("word", word))
+        pos = m.end()
+    return tokens
+
+
+class _Query:
+    """Recursive-descent parser producing a predicate over file dicts."""
+
+    def __init__(self, q: str):
+        self.tokens = _tokenize(q or "")
+        self.pos = 0
+        self.predicate = self._expr() if self.tokens else (lambda f: True)
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected token in query: {self.tokens[self.pos]}")
+
+    def _peek(self, kind=None, value=None):
+        if self.pos >= len(self.tokens):
+            return None
+        token = self.tokens[self.pos]
+        if kind and token[0] != kind:
+            return None
+        if value and (token[1] or "").lower() != value:
+            return None
+        return token
+
+    def _take(self, kind=None, value=None):
+        token = self._peek(kind, value)
+        if token is None:
+            raise ValueError(f"Expected {value or kind} in query")
+        self.pos += 1
+        return token
+
+    def _expr(self):
+        left = self._term()
+        while self._peek("word", "or"):
+            self.pos += 1
+            left = (lambda a, b: lambda f: a(f) or b(f))(left, self._term())
+        return left
+
+    def _term(self):
+        left = self._factor()
+        while self._peek("word", "and"):
+            self.pos += 1
+            left = (lambda a, b: lambda f: a(f) and b(f))(left, self._factor())
+        return left
+
+    def _factor(self):
+        if self._peek("word", "not"):
+            self.pos += 1
+            inner = self._factor()
+            return lambda f: not inner(f)
+        if self._peek("("):
+            self.pos += 1
+            inner = self._expr()
+            self._take(")")
+            return inner
+        return self._comparison()
+
+    def _value(self):
+        kind, value = self._take()
+        if kind == "word" and value.lower() in ("true", "false"):
+            return value.lower() == "true"
+        if kind != "str":
+            raise ValueError(f"Expected a value in query, got {value!r}")
+        return value
+
+    def _comparison(self):
+        if self._peek("str"):
+            value = self._take("str")[1]
+            self._take("word", "in")
+            field = self._take("word")[1]
+            return lambda f: value in (f.get(field) or [])
+        field = self._take("word")[1]
+        if self._peek("word", "contains"):
+            self.pos += 1
+            value = self._value()
+            return lambda f: value in (f.get(field) or "")
+        op = self._take("op")[1]
+        value = self._value()
+        if op == "=":
+            return lambda f: f.get(field, False if isinstance(value, bool) else None) == value
+        return lambda f: f.get(field, False if isinstance(value, bool) else None) != value
+
+
+def _sort(files: list, order_by: str) -> list:
+    for part in reversed([p.strip() for p in (order_by or "").split(",") if p.strip()]):
+        field, _, direction = part.partition(" ")
+        files = sorted(files, key=lambda f: f.get(field) or "", reverse=direction.strip() == "desc")
+    return files
+
+
+# --- Resources -------------------------------------------------------------------
+
+class _Files:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def list(self, q=None, orderBy=None, pageSize=100, pageToken=None, **kwargs):
+        def call():
+            predicate = _Query(q).predicate
+            with self.drive.lock:
+                files = [dict(f) for f in self.drive.metadata.values() if predicate(f)]
+            files = _sort(files, orderBy)
+            start = int(pageToken or 0)
+            page = files[start:start + pageSize]
+            result = {"files": page}
+            if start + pageSize < len(files):
+                result["nextPageToken"] = str(start + pageSize)
+            return result
+        return _Request(call)
+
+    def get(self, fileId, **kwargs):
+        return _Request(lambda: dict(self.drive.require(fileId)))
+
+    def get_media(self, fileId, **kwargs):
+        def call():
+            self.drive.require(fileId)
+            content = self.drive.contents.get(fileId, b"")
+            match = re.match(r"bytes=(\d+)-(\d+)", request.headers.get("range", ""))
+            if match:
+                return content[int(match.group(1)):int(match.group(2)) + 1]
+            return content
+        request = _Request(call)
+        return request
+
+    def create(self, body=None, media_body=None, **kwargs):
+        body = dict(body or {})
+        if media_body is not None and hasattr(media_body, "mimetype"):
+            # Drive takes the type of the uploaded media when the metadata has none
+            body.setdefault("mimeType", media_body.mimetype())
+        return _Request(lambda: dict(self.drive.put(None, body, _read_media(media_body))))
+
+    def update(self, fileId, body=None, media_body=None, **kwargs):
+        def call():
+            self.drive.require(fileId)
+            return dict(self.drive.put(fileId, body or {}, _read_media(media_body)))
+        return _Request(call)
+
+    def delete(self, fileId, **kwargs):
+        return _Request(lambda: self.drive.remove(fileId))
+
+
+class _Permissions:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def create(self, fileId, body=None, **kwargs):
+        def call():
+            self.drive.require(fileId)
+            return {"id": "anyoneWithLink"}
+        return _Request(call)
+
+
+class _Changes:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def getStartPageToken(self, **kwargs):
+        return _Request(lambda: {"startPageToken": str(len(self.drive.log))})
+
+    def list(self, pageToken, pageSize=100, **kwargs):
+        def call():
+            start = int(pageToken)
+            with self.drive.lock:
+                entries = self.drive.log[start:start + pageSize]
+                end = start + len(entries)
+                changes = []
+                for file_id in entries:
+                    current = self.drive.metadata.get(file_id)
+                    if current is None:
+                        changes.append({"fileId": file_id, "removed": True})
+                    else:
+                        changes.append({"fileId": file_id, "removed": False, "file": dict(current)})
+                result = {"changes": changes}
+                if end < len(self.drive.log):
+                    result["nextPageToken"] = str(end)
+                else:
+                    result["newStartPageToken"] = str(end)
+            return result
+        return _Request(call)
+
+
+class FakeDrive:
+    """Drop-in for the object returned by googleapiclient's build('drive', 'v3')."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.metadata = {}  # file_id -> file metadata
+        self.contents = {}  # file_id -> bytes
+        self.log = []       # changed file ids, in order (the changes feed)
+
+    def files(self):
+        return _Files(self)
+
+    def permissions(self):
+        return _Permissions(self)
+
+    def changes(self):
+        return _Changes(self)
+
+    def require(self, file_id):
+        with self.lock:
+            if file_id not in self.metadata:
+                raise FileNotFoundError(f"File not found: {file_id}")
+            return self.metadata[file_id]
+
+    def put(self, file_id, body: dict, content: bytes = None) -> dict:
+        with self.lock:
+            is_new = file_id is None
+            file_id = file_id or uuid.uuid4().hex
+            meta = self.metadata.get(file_id, {
+                "id": file_id,
+                "mimeType": "application/octet-stream",
+                "parents": [],
+                "trashed": False,
+                "webViewLink": f"https://drive.google.com/file/d/{file_id}/view",
+                "webContentLink": f"https://drive.google.com/uc?id={file_id}&export=download",
+            })
+            meta.update({k: v for k, v in body.items() if k != "id"})
+            if is_new and meta["mimeType"] == FOLDER_MIME:
+                meta["webViewLink"] = f"https://drive.google.com/drive/folders/{file_id}"
+            if content is not None:
+                self.contents[file_id] = content
+                meta["size"] = str(len(content))
+                meta["md5Checksum"] = hashlib.md5(content).hexdigest()
+            meta["modifiedTime"] = _now()
+            self.metadata[file_id] = meta
+            self.log.append(file_id)
+            return meta
+
+    def remove(self, file_id):
+        with self.lock:
+            self.require(file_id)
+            del self.metadata[file_id]
+            self.contents.pop(file_id, None)
+            self.log.append(file_id)
+        return ""
+
+
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def get_fake_drive() -> FakeDrive:
+    """The process-wide fake (shared by every thread, like a real Drive account)."""
+    global _instance
+    with _instance_lock:
+        if _instance is None:
+            _instance = FakeDrive()
+        return _instance
+
+
+def reset_fake_drive():
+    global _instance
+    with _instance_lock:
+        _instance = None
@@ -0,0 +1,192 @@
+"""
+Selling Fee Calculator
+In-process estimate of the MercadoLibre selling costs that the external
+selling_calculation webhook writes to mercadolibre.selling_calculation.
+
+The fee structure is learned from the rows the webhook already stored:
+    - per category: percentage_fee (meli_percentage_fee + financing_add_on_fee)
+    - fixed fee tiers: the fixed_fee charged up to each price breakpoint
+    - free shipping threshold: lowest gross_amount that carries a shipping cost
+Shipping cost itself depends on the item (weight/size), so what-if estimates of
+an existing item reuse its stored ship_cost_amount above the threshold.
+
+    sale_fee_amount    = price * percentage_fee / 100 + fixed_fee(price)
+    ship_cost_amount   = item ship cost if price >= threshold else 0
+    total_selling_cost = sale_fee_amount + ship_cost_amount
+
+The webhook stays the source of truth: `reconcile` compares the local formula
+against the stored rows so drift in MercadoLibre's tables is visible. One item in
+every SELLING_FEE_HOLDOUT_MODULUS (by a stable hash of item_id) is kept out of the
+learned tables and only those held-out rows are reconciled, so the comparison is
+not against the data the tables were fitted to.
+
+Limitation: the tables ignore the listing type. selling_calculation does not
+store it, so classic and premium listings of the same category share one learned
+percentage (the most common one); items on the less common listing type are
+estimated with the wrong percentage and show up in `reconcile` as errors.
+
+Configuration (environment variables):
+    SELLING_FEE_TABLE_TTL_SECONDS  how long the learned tables are kept (default 3600)
+    SELLING_FEE_HOLDOUT_MODULUS    1 in N items is held out for reconcile (default 10)
+"""
+import os
+import threading
+import time
+import zlib
+from bisect import bisect_left
+from collections import Counter
+
+from sqlalchemy.orm import Session
+
+from models import SellingCalculation
+
+SELLING_FEE_TABLE_TTL_SECONDS = int(os.getenv("SELLING_FEE_TABLE_TTL_SECONDS", "3600"))
+SELLING_FEE_HOLDOUT_MODULUS = max(2, int(os.getenv("SELLING_FEE_HOLDOUT_MODULUS", "10")))
+
+_tables = None
+_tables_loaded_at = 0
+_tables_lock = threading.Lock()
+
+
+def _mode(values):
+    values = [round(v, 4) for v in values if v is not None]
+    return Counter(values).most_common(1)[0][0] if values else None
+
+
+def _is_holdout(item_id) -> bool:
+    """Stable split: the same items are always held out of the learned tables."""
+    return zlib.crc32(str(item_id).encode()) % SELLING_FEE_HOLDOUT_MODULUS == 0
+
+
+def _build_tables(rows):
+    """Learn category percentages, fixed fee tiers and shipping threshold from stored rows."""
+    by_category = {}
+    fixed_fee_max_price = {}
+    shipped_prices = []
+
+    for r in rows:
+        if r.category_id:
+            by_category.setdefault(r.category_id, []).append(r)
+        if r.gross_amount and r.fixed_fee is not None:
+            fee = round(r.fixed_fee, 2)
+            fixed_fee_max_price[fee] = max(fixed_fee_max_price.get(fee, 0), r.gross_amount)
+        if r.gross_amount and (r.ship_cost_amount or 0) > 0:
+            shipped_prices.append(r.gross_amount)
+
+    categories = {
+        category_id: {
+            "percentage_fee": _mode(r.percentage_fee for r in items),
+            "meli_percentage_fee": _mode(r.meli_percentage_fee for r in items),
+            "financing_add_on_fee": _mode(r.financing_add_on_fee for r in items),
+        }
+        for category_id, items in by_category.items()
+    }
+
+    # Fixed fee is a step function of the price: (upper price, fee) sorted by upper price
+    tiers = sorted((max_price, fee) for fee, max_price in fixed_fee_max_price.items())
+
+    return {
+        "categories": categories,
+        "default_percentage_fee": _mode(r.percentage_fee for r in rows) or 0,
+        "tier_prices": [p for p, _ in tiers],
+        "tier_fees": [f for _, f in tiers],
+        "free_shipping_threshold": min(shipped_prices) if shipped_prices else None,
+        "rows": len(rows),
+    }
+
+
+def load_fee_tables(db: Session, force: bool = False) -> dict:
+    """Learned fee tables (held-out items excluded), reloaded when older than the TTL."""
+    global _tables, _tables_loaded_at
+    with _tables_lock:
+        if not force and _tables is not None and time.time() - _tables_loaded_at < SELLING_FEE_TABLE_TTL_SECONDS:
+            return _tables
+        rows = db.query(
+            SellingCalculation.item_id,
+            SellingCalculation.category_id,
+            SellingCalculation.percentage_fee,
+            SellingCalculation.meli_percentage_fee,
+            SellingCalculation.financing_add_on_fee,
+            SellingCalculation.fixed_fee,
+            SellingCalculation.gross_amount,
+            SellingCalculation.ship_cost_amount
+        ).all()
+        rows = [r for r in rows if not _is_holdout(r.item_id)]
+        _tables = _build_tables(rows)
+        _tables_loaded_at = time.time()
+        print(f"Fee calculator: learned tables from {len(rows)} selling calculations")
+        return _tables
+
+
+def _fixed_fee(tables, price):
+    prices = tables["tier_prices"]
+    if not prices:
+        return 0.0
+    i = bisect_left(prices, price)
+    return tables["tier_fees"][min(i, len(prices) - 1)]
+
+
+def estimate_prices(tables: dict, prices, category_id: str = None, ship_cost: float = None) -> list:
+    """Estimate the selling costs for every candidate price of one item."""
+    category = tables["categories"].get(category_id) or {}
+    percentage_fee = category.get("percentage_fee")
+    if percentage_fee is None:
+        percentage_fee = tables["default_percentage_fee"]
+    threshold = tables["free_shipping_threshold"]
+
+    results = []
+    for price in prices:
+        price = float(price)
+        fixed_fee = _fixed_fee(tables, price)
+        sale_fee_amount = price * percentage_fee / 100 + fixed_fee
+        ships = ship_cost is not None and threshold is not None and price >= threshold
+        ship_cost_amount = ship_cost if ships else 0.0
+        total = sale_fee_amount + ship_cost_amount
+        results.append({
+            "price": price,
+            "percentage_fee": percentage_fee,
+            "meli_percentage_fee": category.get("meli_percentage_fee"),
+            "financing_add_on_fee": category.get("financing_add_on_fee"),
+            "fixed_fee": fixed_fee,
+            "sale_fee_amount": round(sale_fee_amount, 2),
+            "ship_cost_amount": round(ship_cost_amount, 2),
+            "total_selling_cost": round(total, 2),
+            "net_amount": round(price - total, 2),
+        })
+    return results
+
+
+def reconcile(db: Session, limit: int = 1000) -> dict:
+    """Compare local estimates with the stored webhook results of the held-out items."""
+    tables = load_fee_tables(db)
+    rows = db.query(
+        SellingCalculation.item_id,
+        SellingCalculation.category_id,
+        SellingCalculation.gross_amount,
+        SellingCalculation.ship_cost_amount,
+        SellingCalculation.total_selling_cost
+    ).filter(
+        SellingCalculation.gross_amount > 0,
+        SellingCalculation.total_selling_cost != None
+    ).order_by(SellingCalculation.item_id).yield_per(1000)
+
+    errors = []
+    worst = []
+    for r in rows:
+        if not _is_holdout(r.item_id):
+            continue
+        if len(errors) >= limit:
+            break
+        estimate = estimate_prices(tables, [r.gross_amount], r.category_id, r.ship_cost_amount)[0]
+        diff = abs(estimate["total_selling_cost"] - r.total_selling_cost)
+        errors.append(diff)
+        worst.append((diff, r.item_id))
+
+    worst.sort(reverse=True)
+    return {
+        "compared": len(errors),
+        "within_one_peso": sum(1 for e in errors if e <= 1),
+        "mean_abs_error": round(sum(errors) / len(errors), 2) if errors else 0,
+        "max_abs_error": round(worst[0][0], 2) if worst else 0,
+        "worst_item_ids": [item_id for _, item_id in worst[:10]],
+    }
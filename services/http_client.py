@@ -0,0 +1,242 @@
+"""
+Shared Outbound HTTP Client
+One application-lifetime httpx.AsyncClient for every outbound integration
+(publication webhooks, selling calculation, competence scrapper).
+
+Connections are pooled and kept alive between calls, so the TCP+TLS handshake
+to Cloud Run is paid once instead of on every request, and HTTP/2 multiplexes
+concurrent calls to the same service over one connection. Each target keeps
+its own timeout and in-flight limit; the client is closed on app shutdown.
+
+Every target also has a circuit breaker. When the failure rate (exceptions,
+timeouts and 5xx) over the recent window crosses the threshold the breaker
+opens and calls fail fast with CircuitOpenError instead of holding a worker for
+the full timeout. After the open period one probe call is let through
+(half-open): success closes the breaker, failure opens it again. Callers can
+also pass a latency budget, a hard cap on the total time of one call.
+
+Configuration (environment variables):
+    HTTP_CLIENT_HTTP2               enable HTTP/2 (default 1, needs the `h2` package)
+    HTTP_CLIENT_MAX_CONNECTIONS     pooled connections across all targets (default 50)
+    HTTP_CLIENT_KEEPALIVE_SECONDS   idle time before a pooled connection is closed (default 60)
+    BREAKER_FAILURE_RATE            failure ratio that opens a breaker (default 0.5)
+    BREAKER_MIN_CALLS               calls in the window before the rate is evaluated (default 5)
+    BREAKER_WINDOW_SECONDS          length of the failure-rate window (default 60)
+    BREAKER_OPEN_SECONDS            time a breaker stays open before probing (default 30)
+    LATENCY_BUDGETS                 per-endpoint budget overrides, e.g. "selling.calculate=5,competence.start_scraping=20"
+"""
+import asyncio
+import os
+import time
+from collections import deque
+
+import httpx
+
+HTTP_CLIENT_HTTP2 = os.getenv("HTTP_CLIENT_HTTP2", "1") == "1"
+HTTP_CLIENT_MAX_CONNECTIONS = int(os.getenv("HTTP_CLIENT_MAX_CONNECTIONS", "50"))
+HTTP_CLIENT_KEEPALIVE_SECONDS = float(os.getenv("HTTP_CLIENT_KEEPALIVE_SECONDS", "60"))
+
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", "60"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+
+# Per-target request timeout (seconds) and concurrent requests allowed
+TARGETS = {
+    "publications": {"timeout": 30.0, "max_in_flight": 20},
+    "selling": {"timeout": 15.0, "max_in_flight": 10},
+    "scrapper": {"timeout": float(os.getenv("SCRAPE_DISPATCH_TIMEOUT_SECONDS", "60")), "max_in_flight": 5},
+}
+
+# Latency budget (total seconds) of each request-path call site
+LATENCY_BUDGETS = {
+    "products.sync_pictures": 10.0,
+    "products.pre_publish": 15.0,
+    "competence.start_scraping": 15.0,
+    "selling.calculate": 10.0,
+    "selling.calculate_batch": 10.0,
+}
+for _override in os.getenv("LATENCY_BUDGETS", "").split(","):
+    if "=" in _override:
+        _name, _seconds = _override.split("=", 1)
+        LATENCY_BUDGETS[_name.strip()] = float(_seconds)
+
+_client = None
+_semaphores = {}
+_breakers = {}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a target whose breaker is open."""
+
+    def __init__(self, target: str, retry_after: float):
+        self.target = target
+        self.retry_after = retry_after
+        super().__init__(f"Servicio externo '{target}' no disponible (reintentar en {max(1, round(retry_after))}s)")
+
+
+class CircuitBreaker:
+    """Failure-rate breaker: closed -> open -> half-open (single probe) -> closed."""
+
+    def __init__(self, target: str):
+        self.target = target
+        self.state = "closed"
+        self.outcomes = deque()  # (timestamp, ok)
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.last_error = None
+
+    def _trim(self, now):
+        while self.outcomes and now - self.outcomes[0][0] > BREAKER_WINDOW_SECONDS:
+            self.outcomes.popleft()
+
+    def before_call(self):
+        now = time.time()
+        if self.state == "open":
+            remaining = self.opened_at + BREAKER_OPEN_SECONDS - now
+            if remaining > 0:
+                raise CircuitOpenError(self.target, remaining)
+            self.state = "half-open"
+        if self.state == "half-open":
+            if self.probe_in_flight:
+                raise CircuitOpenError(self.target, BREAKER_OPEN_SECONDS)
+            self.probe_in_flight = True
+
+    def record(self, ok: bool, error: str = None):
+        now = time.time()
+        if not ok:
+            self.last_error = error
+        if self.state == "half-open":
+            self.probe_in_flight = False
+            if ok:
+                self.state = "closed"
+                self.outcomes.clear()
+            else:
+                self._open(now)
+            return
+
+        self.outcomes.append((now, ok))
+        self._trim(now)
+        failures = sum(1 for _, success in self.outcomes if not success)
+        if len(self.outcomes) >= BREAKER_MIN_CALLS and failures / len(self.outcomes) >= BREAKER_FAILURE_RATE:
+            self._open(now)
+
+    def _open(self, now):
+        self.state = "open"
+        self.opened_at = now
+        self.outcomes.clear()
+        print(f"HTTP client: circuit for '{self.target}' opened ({self.last_error})")
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        self._trim(now)
+        failures = sum(1 for _, success in self.outcomes if not success)
+        retry_after = None
+        if self.state == "open":
+            retry_after = max(0.0, self.opened_at + BREAKER_OPEN_SECONDS - now)
+        return {
+            "target": self.target,
+            "state": self.state,
+            "calls_in_window": len(self.outcomes),
+            "failures_in_window": failures,
+            "retry_after_seconds": retry_after,
+            "last_error": self.last_error,
+        }
+
+
+def _breaker(target: str) -> CircuitBreaker:
+    if target not in _breakers:
+        _breakers[target] = CircuitBreaker(target)
+    return _breakers[target]
+
+
+def budget(endpoint: str) -> float:
+    """Latency budget of a call site (None = only the target timeout applies)."""
+    return LATENCY_BUDGETS.get(endpoint)
+
+
+def breaker_states() -> list:
+    """State of every target's breaker (for the status endpoint)."""
+    return [_breaker(target).snapshot() for target in TARGETS]
+
+
+def get_client() -> httpx.AsyncClient:
+    """The shared client, created on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        limits = httpx.Limits(
+            max_connections=HTTP_CLIENT_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_CLIENT_MAX_CONNECTIONS,
+            keepalive_expiry=HTTP_CLIENT_KEEPALIVE_SECONDS
+        )
+        try:
+            _client = httpx.AsyncClient(http2=HTTP_CLIENT_HTTP2, limits=limits, timeout=30.0)
+        except ImportError:
+            print("HTTP client: 'h2' package not installed, falling back to HTTP/1.1")
+            _client = httpx.AsyncClient(limits=limits, timeout=30.0)
+    return _client
+
+
+def _semaphore(target: str) -> asyncio.Semaphore:
+    if target not in _semaphores:
+        _semaphores[target] = asyncio.Semaphore(TARGETS[target]["max_in_flight"])
+    return _semaphores[target]
+
+
+async def post(target: str, url: str, json: dict, timeout: float = None, budget: float = None) -> httpx.Response:
+    """POST through the shared pool using the target's timeout, in-flight limit and breaker.
+
+    `budget` caps the total time of the call, waiting for a slot included;
+    exceeding it raises httpx.TimeoutException like any other timeout. Time
+    spent queued behind our own in-flight limit is local congestion, not a
+    target failure, so a budget that runs out before a slot is free raises
+    httpx.PoolTimeout and is not counted by the breaker."""
+    breaker = _breaker(target)
+    breaker.before_call()
+    timeout = timeout or TARGETS[target]["timeout"]
+    started = time.monotonic()
+    semaphore = _semaphore(target)
+
+    try:
+        if budget:
+            await asyncio.wait_for(semaphore.acquire(), timeout=budget)
+        else:
+            await semaphore.acquire()
+    except asyncio.TimeoutError:
+        breaker.probe_in_flight = False
+        raise httpx.PoolTimeout(f"Latency budget of {budget}s exceeded waiting for a '{target}' slot")
+    except asyncio.CancelledError:
+        breaker.probe_in_flight = False
+        raise
+
+    try:
+        if budget:
+            remaining = max(0.001, budget - (time.monotonic() - started))
+            try:
+                response = await asyncio.wait_for(
+                    get_client().post(url, json=json, timeout=min(timeout, remaining)), timeout=remaining
+                )
+            except asyncio.TimeoutError:
+                raise httpx.TimeoutException(f"Latency budget of {budget}s exceeded for '{target}'")
+        else:
+            response = await get_client().post(url, json=json, timeout=timeout)
+    except asyncio.CancelledError:
+        # Not the target's fault; release a half-open probe slot
+        breaker.probe_in_flight = False
+        raise
+    except Exception as e:
+        breaker.record(False, str(e) or e.__class__.__name__)
+        raise
+    finally:
+        semaphore.release()
+    breaker.record(response.status_code < 500, f"Status: {response.status_code}")
+    return response
+
+
+async def close_client():
+    """Close pooled connections (called on app shutdown)."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _semaphores.clear()
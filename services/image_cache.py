@@ -0,0 +1,230 @@
+"""
+Drive Image Cache
+Size-bounded on-disk LRU cache for the /api/products/drive-image proxy.
+
+Entries live in DRIVE_IMAGE_CACHE_DIR, named after (file id, md5Checksum,
+variant), so a photo replaced on Drive gets a new key and stale entries simply
+age out. Originals are streamed to the client chunk by chunk while being written
+to the cache; `thumbnail` and `large` variants are resized to WebP once, from
+the cached original, and served from disk afterwards. Least recently used files
+are evicted when the directory grows past DRIVE_IMAGE_CACHE_MAX_MB.
+
+File metadata (md5, mime type) is kept in memory for DRIVE_IMAGE_METADATA_TTL_SECONDS
+so a cache hit needs no Drive call at all.
+
+Configuration (environment variables):
+    DRIVE_IMAGE_CACHE_DIR             cache directory (default /tmp/drive_image_cache)
+    DRIVE_IMAGE_CACHE_MAX_MB          disk budget of the cache (default 512)
+    DRIVE_IMAGE_METADATA_TTL_SECONDS  in-memory metadata TTL (default 600)
+"""
+import os
+import threading
+import time
+import uuid
+
+DRIVE_IMAGE_CACHE_DIR = os.getenv("DRIVE_IMAGE_CACHE_DIR", "/tmp/drive_image_cache")
+DRIVE_IMAGE_CACHE_MAX_BYTES = int(os.getenv("DRIVE_IMAGE_CACHE_MAX_MB", "512")) * 1024 * 1024
+DRIVE_IMAGE_METADATA_TTL_SECONDS = int(os.getenv("DRIVE_IMAGE_METADATA_TTL_SECONDS", "600"))
+_METADATA_MAX_ENTRIES = 5000
+
+# Longest side in pixels of each resized variant
+VARIANTS = {"thumbnail": 320, "large": 1280}
+WEBP_QUALITY = 82
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+_lock = threading.Lock()
+_index = None  # path -> size in bytes
+_total_bytes = 0
+_metadata = {}  # file_id -> (metadata dict, expire_at)
+
+
+def _load_index():
+    global _index, _total_bytes
+    if _index is not None:
+        return
+    os.makedirs(DRIVE_IMAGE_CACHE_DIR, exist_ok=True)
+    _index = {}
+    for name in os.listdir(DRIVE_IMAGE_CACHE_DIR):
+        path = os.path.join(DRIVE_IMAGE_CACHE_DIR, name)
+        if name.endswith(".part"):
+            # Download interrupted by a restart
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        try:
+            _index[path] = os.path.getsize(path)
+        except OSError:
+            pass
+    _total_bytes = sum(_index.values())
+
+
+def cache_path(file_id: str, md5: str, variant: str) -> str:
+    safe_id = "".join(c for c in file_id if c.isalnum() or c in "-_")
+    return os.path.join(DRIVE_IMAGE_CACHE_DIR, f"{safe_id}_{md5 or 'nomd5'}_{variant}")
+
+
+def lookup(path: str) -> bool:
+    """True if the entry is cached; marks it as recently used."""
+    with _lock:
+        _load_index()
+        if path not in _index:
+            return False
+    try:
+        os.utime(path, None)
+        return True
+    except OSError:
+        with _lock:
+            _forget(path)
+        return False
+
+
+def _forget(path):
+    global _total_bytes
+    size = _index.pop(path, None)
+    if size:
+        _total_bytes -= size
+
+
+def _evict():
+    """Drop least recently used entries (by mtime) until the cache fits its budget."""
+    if _total_bytes <= DRIVE_IMAGE_CACHE_MAX_BYTES:
+        return
+    entries = []
+    for path in list(_index):
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except OSError:
+            _forget(path)
+    for _, path in sorted(entries):
+        if _total_bytes <= DRIVE_IMAGE_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        _forget(path)
+
+
+def _commit(tmp_path: str, path: str):
+    global _total_bytes
+    os.replace(tmp_path, path)
+    with _lock:
+        _load_index()
+        _forget(path)
+        _index[path] = os.path.getsize(path)
+        _total_bytes += _index[path]
+        _evict()
+
+
+def _tmp_path(path: str) -> str:
+    return f"{path}.{uuid.uuid4().hex[:8]}.part"
+
+
+def get_metadata(service, file_id: str) -> dict:
+    """mimeType/md5Checksum/size of a Drive file, cached in memory."""
+    cached = _metadata.get(file_id)
+    if cached and cached[1] > time.time():
+        return cached[0]
+    meta = service.files().get(
+        fileId=file_id, fields="mimeType, md5Checksum, size", supportsAllDrives=True
+    ).execute()
+    now = time.time()
+    with _lock:
+        if len(_metadata) >= _METADATA_MAX_ENTRIES:
+            for key in [k for k, (_, expire_at) in _metadata.items() if expire_at <= now]:
+                del _metadata[key]
+            # Still full: drop the oldest entries (dicts keep insertion order)
+            for key in list(_metadata)[:len(_metadata) - _METADATA_MAX_ENTRIES + 1]:
+                del _metadata[key]
+        _metadata[file_id] = (meta, now + DRIVE_IMAGE_METADATA_TTL_SECONDS)
+    return meta
+
+
+def stream_original(file_id: str, path: str, size: int = None):
+    """Yield the file from Drive chunk by chunk while writing it into the cache.
+
+    StreamingResponse may advance the generator from different threadpool
+    threads, so every chunk is a ranged request made with the Drive client of
+    the thread running it (clients are per thread, see drive_service)."""
+    from services import drive_service
+
+    with _lock:
+        _load_index()
+    tmp_path = _tmp_path(path)
+    completed = False
+    try:
+        with open(tmp_path, "wb") as cache_file:
+            offset = 0
+            while True:
+                service = drive_service.get_drive_service()
+                if not service:
+                    raise RuntimeError("Drive service unavailable")
+                request = service.files().get_media(fileId=file_id)
+                if size:
+                    request.headers["range"] = f"bytes={offset}-{min(offset + DOWNLOAD_CHUNK_BYTES, size) - 1}"
+                chunk = request.execute()
+                if chunk:
+                    cache_file.write(chunk)
+                    offset += len(chunk)
+                    yield chunk
+                if not size or not chunk or offset >= size:
+                    break
+        completed = True
+    finally:
+        if completed:
+            _commit(tmp_path, path)
+        else:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def ensure_original(file_id: str, path: str, size: int = None):
+    """Make sure the original is cached (downloading it without a client attached)."""
+    if not lookup(path):
+        for _ in stream_original(file_id, path, size):
+            pass
+
+
+def ensure_variant(original_path: str, path: str, variant: str) -> bool:
+    """Create the resized WebP variant from the cached original; False if it can't be made."""
+    if lookup(path):
+        return True
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        print("Drive image cache: Pillow not installed, serving originals")
+        return False
+
+    max_side = VARIANTS[variant]
+    tmp_path = _tmp_path(path)
+    try:
+        with Image.open(original_path) as image:
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_side, max_side))
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+            image.save(tmp_path, "WEBP", quality=WEBP_QUALITY, method=4)
+        _commit(tmp_path, path)
+        return True
+    except Exception as e:
+        print(f"Drive image cache: could not build {variant} for {original_path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+
+
+def stats() -> dict:
+    with _lock:
+        _load_index()
+        return {
+            "entries": len(_index),
+            "bytes": _total_bytes,
+            "max_bytes": DRIVE_IMAGE_CACHE_MAX_BYTES,
+            "metadata_entries": len(_metadata),
+        }
@@ -0,0 +1,149 @@
+"""
+Competitor Price History
+Append-only, compact history of the prices scraped into
+mercadolibre.scrapped_competence (which only keeps the latest value).
+
+Rows are (product_code, ts, price_cents, competitor_id): prices as integer
+cents and competitors as small ints from mercadolibre.competitors, keyed by
+(product_code, ts) so trend queries are index range scans. Snapshots are
+captured set-based from scrapped_competence; the primary key makes capture
+idempotent, so it can run as often as needed.
+
+Configuration (environment variables):
+    PRICE_HISTORY_CAPTURE_INTERVAL_SECONDS  capture period, 0 disables the thread (default 900)
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+PRICE_HISTORY_CAPTURE_INTERVAL_SECONDS = int(os.getenv("PRICE_HISTORY_CAPTURE_INTERVAL_SECONDS", "900"))
+MAX_SPARKLINE_POINTS = 500
+
+_capture_thread = None
+
+
+def capture_price_snapshots(db: Session) -> int:
+    """Append the current scraped price of every completed item not yet in the history."""
+    # Only names not registered yet: InnoDB burns an AUTO_INCREMENT value for every
+    # row INSERT IGNORE skips, and competitors.id is a SMALLINT (IGNORE only covers
+    # a concurrent capture inserting the same new name)
+    db.execute(text("""
+        INSERT IGNORE INTO mercadolibre.competitors (name)
+        SELECT DISTINCT c.competitor
+        FROM mercadolibre.scrapped_competence c
+        WHERE c.competitor IS NOT NULL AND c.competitor != ''
+          AND NOT EXISTS (
+              SELECT 1 FROM mercadolibre.competitors comp WHERE comp.name = c.competitor
+          )
+    """))
+    result = db.execute(text("""
+        INSERT IGNORE INTO mercadolibre.competence_price_history (product_code, ts, price_cents, competitor_id)
+        SELECT c.product_code, c.timestamp, c.price * 100, comp.id
+        FROM mercadolibre.scrapped_competence c
+        LEFT JOIN mercadolibre.competitors comp ON comp.name = c.competitor
+        WHERE c.status = 'completed'
+          AND c.price > 0
+          AND c.timestamp IS NOT NULL
+    """))
+    db.commit()
+    return result.rowcount or 0
+
+
+def window_stats(db: Session, product_code: str, windows: list) -> list:
+    """Min/max/avg/count of the price for each trailing window (in days), in one query."""
+    windows = sorted({int(w) for w in windows if int(w) > 0})
+    if not windows:
+        return []
+
+    now = datetime.now()
+    params = {"code": product_code, "since": now - timedelta(days=windows[-1])}
+    selects = []
+    for w in windows:
+        params[f"since_{w}"] = now - timedelta(days=w)
+        in_window = f"CASE WHEN ts >= :since_{w} THEN price_cents END"
+        selects.append(
+            f"MIN({in_window}) AS min_{w}, MAX({in_window}) AS max_{w}, "
+            f"AVG({in_window}) AS avg_{w}, COUNT({in_window}) AS count_{w}"
+        )
+
+    row = db.execute(text(f"""
+        SELECT {", ".join(selects)}
+        FROM mercadolibre.competence_price_history
+        WHERE product_code = :code AND ts >= :since
+    """), params).mappings().first() or {}
+
+    def pesos(cents):
+        return float(cents) / 100 if cents is not None else None
+
+    return [
+        {
+            "days": w,
+            "min_price": pesos(row.get(f"min_{w}")),
+            "max_price": pesos(row.get(f"max_{w}")),
+            "avg_price": pesos(row.get(f"avg_{w}")),
+            "samples": int(row.get(f"count_{w}") or 0),
+        }
+        for w in windows
+    ]
+
+
+def sparkline(db: Session, product_code: str, days: int = 30, points: int = 60) -> list:
+    """Downsample the window into at most `points` buckets (avg/min/max per bucket) server-side."""
+    points = max(1, min(points, MAX_SPARKLINE_POINTS))
+    since = datetime.now() - timedelta(days=days)
+    bucket_seconds = max(1, (days * 86400) // points)
+
+    rows = db.execute(text("""
+        SELECT
+            FLOOR(TIMESTAMPDIFF(SECOND, :since, ts) / :bucket) AS bucket,
+            AVG(price_cents) AS avg_cents,
+            MIN(price_cents) AS min_cents,
+            MAX(price_cents) AS max_cents
+        FROM mercadolibre.competence_price_history
+        WHERE product_code = :code AND ts >= :since
+        GROUP BY bucket
+        ORDER BY bucket
+    """), {"code": product_code, "since": since, "bucket": bucket_seconds}).fetchall()
+
+    return [
+        {
+            "ts": since + timedelta(seconds=int(r.bucket) * bucket_seconds),
+            "price": float(r.avg_cents) / 100,
+            "min_price": float(r.min_cents) / 100,
+            "max_price": float(r.max_cents) / 100,
+        }
+        for r in rows
+    ]
+
+
+def _capture_loop():
+    from db_conn import SessionLocal
+    while True:
+        db = SessionLocal()
+        try:
+            appended = capture_price_snapshots(db)
+            if appended:
+                print(f"Price history: captured {appended} new price points")
+        except Exception as e:
+            db.rollback()
+            print(f"Price history capture error: {e}")
+        finally:
+            db.close()
+        time.sleep(PRICE_HISTORY_CAPTURE_INTERVAL_SECONDS)
+
+
+def start_price_history_capture():
+    """Start the periodic capture thread (idempotent)."""
+    global _capture_thread
+    if PRICE_HISTORY_CAPTURE_INTERVAL_SECONDS <= 0:
+        print("Price history capture disabled")
+        return None
+    if _capture_thread and _capture_thread.is_alive():
+        return _capture_thread
+    _capture_thread = threading.Thread(target=_capture_loop, name="price-history-capture", daemon=True)
+    _capture_thread.start()
+    return _capture_thread
@@ -0,0 +1,256 @@
+"""
+Competence Scrape Jobs
+Queue of per-item scrape requests for mercadolibre.scrapped_competence.
+
+A job is a set of product codes (chosen explicitly or by a staleness policy)
+stored in mercadolibre.scrape_job_items, and progress is kept as counters on the
+mercadolibre.scrape_jobs row. Items are marked finished when the scrapper writes
+a newer timestamp/status for them in scrapped_competence.
+
+The scrapper's start_scrapping webhook takes {"secret"} and scrapes everything
+that is due. Only when SCRAPER_ACCEPTS_PRODUCT_CODES is enabled (a scrapper
+version that reads an optional "product_codes" list and scrapes just those) are
+the codes sent, in batches with bounded concurrency. Otherwise a job falls back
+to one plain request (a full scrape, logged and reported as dispatch_mode
+"full") and tracks its items as the global scrape reaches them.
+
+Job bookkeeping (created_at, dispatched_at, finished_at, the timeout) uses UTC.
+
+A job still unfinished SCRAPE_JOB_TIMEOUT_SECONDS after it was created is closed
+on the next progress read: items never re-scraped are marked failed and the job
+ends "partial" (some items done) or "failed".
+
+Configuration (environment variables):
+    SCRAPER_ACCEPTS_PRODUCT_CODES   send product codes to the scrapper in batches (default false)
+    SCRAPE_BATCH_SIZE               product codes per scrapper request (default 25)
+    SCRAPE_MAX_CONCURRENCY          scrapper requests in flight per job (default 3)
+    SCRAPE_DISPATCH_TIMEOUT_SECONDS timeout of each scrapper request (default 60)
+    SCRAPE_JOB_TIMEOUT_SECONDS      time after which an unfinished job is closed (default 21600)
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from db_conn import SessionLocal
+from models import ScrapeJob, ScrapeJobItem, ScrappedCompetence
+from services import http_client
+
+SCRAPE_BATCH_SIZE = int(os.getenv("SCRAPE_BATCH_SIZE", "25"))
+SCRAPE_MAX_CONCURRENCY = int(os.getenv("SCRAPE_MAX_CONCURRENCY", "3"))
+SCRAPE_DISPATCH_TIMEOUT_SECONDS = float(os.getenv("SCRAPE_DISPATCH_TIMEOUT_SECONDS", "60"))
+SCRAPE_JOB_TIMEOUT_SECONDS = int(os.getenv("SCRAPE_JOB_TIMEOUT_SECONDS", "21600"))
+SCRAPER_ACCEPTS_PRODUCT_CODES = os.getenv("SCRAPER_ACCEPTS_PRODUCT_CODES", "false").lower() in ("1", "true", "yes")
+
+# How jobs reach the scrapper: "codes" (only the job's items) or "full" (fallback: global scrape)
+DISPATCH_MODE = "codes" if SCRAPER_ACCEPTS_PRODUCT_CODES else "full"
+
+# Statuses that mean the job no longer changes
+FINAL_JOB_STATUSES = ("completed", "partial", "failed")
+
+
+def select_stale_codes(db: Session, stale_hours: int = 24, include_errors: bool = True, limit: int = None):
+    """Product codes not scraped in the last `stale_hours` (plus never-scraped and, optionally, errored ones)."""
+    cutoff = datetime.utcnow() - timedelta(hours=stale_hours)
+    conditions = [
+        ScrappedCompetence.status == None,
+        ScrappedCompetence.status == 'pending',
+        ScrappedCompetence.timestamp == None,
+        ScrappedCompetence.timestamp < cutoff,
+    ]
+    if include_errors:
+        conditions.append(ScrappedCompetence.status == 'error')
+
+    query = db.query(ScrappedCompetence.product_code).filter(
+        ScrappedCompetence.catalog_link != '',
+        ScrappedCompetence.catalog_link != None,
+        or_(*conditions)
+    ).order_by(ScrappedCompetence.timestamp)
+    if limit:
+        query = query.limit(limit)
+    return [row[0] for row in query.all()]
+
+
+def create_job(db: Session, product_codes: list, policy: str) -> ScrapeJob:
+    """Persist a job and its items (duplicates removed, order kept)."""
+    codes = list(dict.fromkeys(c for c in product_codes if c))
+    job = ScrapeJob(
+        id=str(uuid.uuid4()),
+        policy=policy,
+        status="queued" if codes else "completed",
+        total_items=len(codes),
+        dispatched_items=0,
+        completed_items=0,
+        failed_items=0
+    )
+    db.add(job)
+    db.bulk_insert_mappings(ScrapeJobItem, [
+        {"job_id": job.id, "product_code": code, "status": "queued", "attempts": 0}
+        for code in codes
+    ])
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def _update_counters(db: Session, job: ScrapeJob):
+    """Recompute job counters from its items with one grouped query."""
+    rows = db.query(ScrapeJobItem.status, func.count()).filter(
+        ScrapeJobItem.job_id == job.id
+    ).group_by(ScrapeJobItem.status).all()
+    by_status = {status: count for status, count in rows}
+
+    job.completed_items = by_status.get("completed", 0)
+    job.failed_items = by_status.get("failed", 0)
+    job.dispatched_items = by_status.get("dispatched", 0) + job.completed_items + job.failed_items
+
+    if job.status not in FINAL_JOB_STATUSES and job.total_items and \
+            job.completed_items + job.failed_items >= job.total_items:
+        job.status = "failed" if job.completed_items == 0 else "completed"
+
+
+def _record_batch(job_id: str, codes: list, success: bool, error: str = None):
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        db.query(ScrapeJobItem).filter(
+            ScrapeJobItem.job_id == job_id,
+            ScrapeJobItem.product_code.in_(codes)
+        ).update({
+            "status": "dispatched" if success else "failed",
+            "attempts": ScrapeJobItem.attempts + 1,
+            "dispatched_at": now,
+            "finished_at": None if success else now,
+            "error": None if success else (error or "")[:1000]
+        }, synchronize_session=False)
+        job = db.query(ScrapeJob).filter(ScrapeJob.id == job_id).first()
+        if job:
+            _update_counters(db, job)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Scrape job {job_id}: error recording batch: {e}")
+    finally:
+        db.close()
+
+
+def _set_job_status(job_id: str, status: str, error: str = None):
+    db = SessionLocal()
+    try:
+        job = db.query(ScrapeJob).filter(ScrapeJob.id == job_id).first()
+        if job and job.status not in FINAL_JOB_STATUSES:
+            job.status = status
+            if error:
+                job.error = error[:1000]
+            db.commit()
+    finally:
+        db.close()
+
+
+def _queued_codes(job_id: str) -> list:
+    db = SessionLocal()
+    try:
+        return [row[0] for row in db.query(ScrapeJobItem.product_code).filter(
+            ScrapeJobItem.job_id == job_id,
+            ScrapeJobItem.status == "queued"
+        ).all()]
+    finally:
+        db.close()
+
+
+async def dispatch_job(job_id: str, webhook_url: str, secret: str):
+    """Send the job's queued items to the scrapper (in concurrent batches when it takes product codes)."""
+    codes = await asyncio.to_thread(_queued_codes, job_id)
+    if not codes:
+        return
+    await asyncio.to_thread(_set_job_status, job_id, "dispatching")
+
+    if SCRAPER_ACCEPTS_PRODUCT_CODES:
+        batches = [codes[i:i + SCRAPE_BATCH_SIZE] for i in range(0, len(codes), SCRAPE_BATCH_SIZE)]
+    else:
+        # One global scrape covers every item of the job
+        print(f"Scrape job {job_id}: scrapper takes no product codes, falling back to a full scrape "
+              f"for {len(codes)} items (set SCRAPER_ACCEPTS_PRODUCT_CODES to send only these)")
+        batches = [codes]
+    semaphore = asyncio.Semaphore(max(1, SCRAPE_MAX_CONCURRENCY))
+
+    async def send_batch(batch):
+        payload = {"secret": secret}
+        if SCRAPER_ACCEPTS_PRODUCT_CODES:
+            payload["product_codes"] = batch
+        async with semaphore:
+            try:
+                response = await http_client.post(
+                    "scrapper", webhook_url, json=payload, timeout=SCRAPE_DISPATCH_TIMEOUT_SECONDS
+                )
+                ok = 200 <= response.status_code < 300
+                error = None if ok else f"Status: {response.status_code} - {response.text[:500]}"
+            except Exception as e:
+                ok, error = False, str(e)
+            print(f"Scrape job {job_id}: batch of {len(batch)} dispatched (ok={ok})")
+            await asyncio.to_thread(_record_batch, job_id, batch, ok, error)
+            return ok
+
+    results = await asyncio.gather(*(send_batch(batch) for batch in batches))
+
+    if not any(results):
+        await asyncio.to_thread(_set_job_status, job_id, "failed", "All scrapper requests failed")
+    else:
+        await asyncio.to_thread(_set_job_status, job_id, "running")
+
+
+def refresh_job_progress(db: Session, job_id: str):
+    """Mark dispatched items whose competence row was re-scraped since dispatch, then refresh counters."""
+    job = db.query(ScrapeJob).filter(ScrapeJob.id == job_id).first()
+    if not job:
+        return None
+    if job.status in FINAL_JOB_STATUSES:
+        return job
+
+    finished = db.query(
+        ScrapeJobItem.product_code, ScrappedCompetence.status, ScrappedCompetence.timestamp
+    ).join(
+        ScrappedCompetence, ScrappedCompetence.product_code == ScrapeJobItem.product_code
+    ).filter(
+        ScrapeJobItem.job_id == job_id,
+        ScrapeJobItem.status == "dispatched",
+        ScrappedCompetence.timestamp >= ScrapeJobItem.dispatched_at,
+        ScrappedCompetence.status.in_(("completed", "error"))
+    ).all()
+
+    for item_status, codes in (
+        ("completed", [code for code, status, _ in finished if status == "completed"]),
+        ("failed", [code for code, status, _ in finished if status == "error"]),
+    ):
+        if codes:
+            db.query(ScrapeJobItem).filter(
+                ScrapeJobItem.job_id == job_id,
+                ScrapeJobItem.product_code.in_(codes)
+            ).update({"status": item_status, "finished_at": datetime.utcnow()}, synchronize_session=False)
+
+    _update_counters(db, job)
+    if job.status not in FINAL_JOB_STATUSES and job.created_at and \
+            datetime.utcnow() - job.created_at > timedelta(seconds=SCRAPE_JOB_TIMEOUT_SECONDS):
+        _time_out(db, job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def _time_out(db: Session, job: ScrapeJob):
+    """Close a job the scrapper never finished: pending items fail, the job ends partial or failed."""
+    db.query(ScrapeJobItem).filter(
+        ScrapeJobItem.job_id == job.id,
+        ScrapeJobItem.status.in_(("queued", "dispatched"))
+    ).update({
+        "status": "failed",
+        "finished_at": datetime.utcnow(),
+        "error": "Timed out waiting for the scrapper"
+    }, synchronize_session=False)
+    _update_counters(db, job)
+    job.status = "partial" if job.completed_items else "failed"
+    job.error = f"Timed out after {SCRAPE_JOB_TIMEOUT_SECONDS}s: {job.failed_items} items not scraped"
+    print(f"Scrape job {job.id}: {job.error}")
@@ -2,12 +2,30 @@
 Settings Service (Google Drive Backend)
 Stores application settings (logos, themes) in a JSON file on Google Drive.
 This bypasses database schema requirements.
+
+Settings are cached in memory together with the md5Checksum of the Drive file
+they came from. A reload first looks the file up (in the local metadata index
+when it is in sync) and only downloads it when that checksum changed; lookups
+are skipped entirely for SETTINGS_CHECK_SECONDS after the last one. Concurrent
+updates are folded into a single write, and the small JSON file is sent with a
+simple (non-resumable) upload.
+
+Configuration (environment variables):
+    SETTINGS_CHECK_SECONDS  time a loaded copy is served without checking Drive (default 10)
 """
+import io
 import json
 import os
-from services import drive_service
+import threading
+import time
+
+from services import drive_service, drive_index
 
 SETTINGS_FILENAME = "app_settings.json"
+SETTINGS_CHECK_SECONDS = float(os.getenv("SETTINGS_CHECK_SECONDS", "10"))
+
+# Payloads up to this size go in one multipart request instead of a resumable session
+SIMPLE_UPLOAD_MAX_BYTES = 5 * 1024 * 1024
 
 class SettingsService:
     def __init__(self):
@@ -19,59 +37,89 @@ class SettingsService:
         }
         self.file_id = None
         self.service = None
+        self.version = None  # md5Checksum of the Drive file self.settings reflects
+        self.checked_at = 0.0
+
+        # Group commit: updates queue in _pending and one writer saves them all
+        self._write_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending = {}
+        self._batch_no = 0        # batch the next queued update belongs to
+        self._written_batch = -1  # last batch that was saved
+        self._batch_results = {}
 
     def _get_service(self):
-        if not self.service:
-            # Import here to avoid circular dependencies if any
-            from services.drive_service import get_drive_service
-            self.service = get_drive_service()
+        # drive_service caches credentials and a per-thread client, so this is cheap
+        # and never shares one (non thread-safe) client between request threads
+        from services.drive_service import get_drive_service
+        self.service = get_drive_service()
         return self.service
 
-    def load_settings(self):
-        """Load settings from Google Drive file"""
-        print(f"DEBUG: Loading settings from Drive...")
+    def _folder_id(self):
+        return os.getenv('LOGOS_FOLDER_ID', drive_service.ROOT_FOLDER_ID)
+
+    def _find_file(self, service):
+        """(file_id, md5Checksum) of the settings file, or (None, None)."""
+        folder_id = self._folder_id()
+        if drive_index.is_ready():
+            files = drive_index.find_files(folder_id, name=SETTINGS_FILENAME)
+        else:
+            query = f"name = '{SETTINGS_FILENAME}' and '{folder_id}' in parents and trashed = false"
+            results = service.files().list(q=query, fields="files(id, name, md5Checksum)").execute()
+            files = results.get('files', [])
+        if not files:
+            return None, None
+        return files[0]['id'], files[0].get('md5Checksum')
+
+    def load_settings(self, force=False, create_missing=True):
+        """Load settings from Google Drive file (downloaded only when it changed since the last load)"""
+        if not force and self.file_id and time.time() - self.checked_at < SETTINGS_CHECK_SECONDS:
+            return self.settings
+
         try:
             service = self._get_service()
             if not service:
                 print("WARNING: Could not connect to Drive for settings")
                 return self.settings
 
-            # Search for settings file
-            folder_id = os.getenv('LOGOS_FOLDER_ID', drive_service.ROOT_FOLDER_ID)
-            query = f"name = '{SETTINGS_FILENAME}' and '{folder_id}' in parents and trashed = false"
-            
-            results = service.files().list(q=query, fields="files(id, name)").execute()
-            files = results.get('files', [])
+            file_id, version = self._find_file(service)
+            self.checked_at = time.time()
+
+            if file_id:
+                if file_id == self.file_id and version and version == self.version:
+                    return self.settings
+
+                print(f"DEBUG: Loading settings from Drive (ID: {file_id}, version: {version})")
+                self.file_id = file_id
 
-            if files:
-                self.file_id = files[0]['id']
-                print(f"DEBUG: Settings file found (ID: {self.file_id})")
-                
                 # Download content
                 content = service.files().get_media(fileId=self.file_id).execute()
                 loaded_json = content.decode('utf-8')
-                
+
                 if not loaded_json.strip():
                     print("WARNING: Settings file is empty")
                     loaded_settings = {}
                 else:
                     loaded_settings = json.loads(loaded_json)
-                
+
                 # Merge with existing settings (don't overwrite self.settings completely)
                 # This preserves any in-memory updates that might be pending
                 for k, v in loaded_settings.items():
                     self.settings[k] = v
-                    
+                self.version = version
+
                 print(f"DEBUG: Active Settings: {self.settings}")
             else:
-                print("DEBUG: Settings file not found on Drive. Creating new.")
-                self.save_settings() # Create empty file
+                self.file_id = None
+                if create_missing:
+                    print("DEBUG: Settings file not found on Drive. Creating new.")
+                    self.save_settings() # Create empty file
 
         except Exception as e:
             print(f"ERROR loading settings: {e}")
             import traceback
             traceback.print_exc()
-        
+
         return self.settings
 
     def save_settings(self):
@@ -81,29 +129,29 @@ class SettingsService:
             if not service:
                 return False
 
-            folder_id = os.getenv('LOGOS_FOLDER_ID', drive_service.ROOT_FOLDER_ID)
-            
+            folder_id = self._folder_id()
+
             file_metadata = {
                 'name': SETTINGS_FILENAME,
                 'parents': [folder_id]
             }
-            
+
             from googleapiclient.http import MediaIoBaseUpload
-            import io
-            
-            json_content = json.dumps(self.settings, indent=2)
+
+            payload = json.dumps(self.settings, indent=2).encode('utf-8')
             media = MediaIoBaseUpload(
-                io.BytesIO(json_content.encode('utf-8')),
+                io.BytesIO(payload),
                 mimetype='application/json',
-                resumable=True
+                resumable=len(payload) > SIMPLE_UPLOAD_MAX_BYTES
             )
 
             if self.file_id:
                 # Update existing file
                 print(f"DEBUG: Updating existing settings file {self.file_id}")
-                service.files().update(
+                file = service.files().update(
                     fileId=self.file_id,
-                    media_body=media
+                    media_body=media,
+                    fields='id, modifiedTime, md5Checksum'
                 ).execute()
             else:
                 # Create new file
@@ -111,10 +159,14 @@ class SettingsService:
                 file = service.files().create(
                     body=file_metadata,
                     media_body=media,
-                    fields='id'
+                    fields='id, modifiedTime, md5Checksum'
                 ).execute()
                 self.file_id = file.get('id')
-                
+            drive_index.record(file, name=SETTINGS_FILENAME, folder_id=folder_id, mime_type='application/json')
+
+            # Our own write is the current version: no need to download it again
+            self.version = file.get('md5Checksum')
+            self.checked_at = time.time()
             print(f"DEBUG: Settings saved successfully")
             return True
 
@@ -128,19 +180,42 @@ class SettingsService:
         return self.update_settings({key: value})
 
     def update_settings(self, updates):
-        """Update multiple settings at once to avoid race conditions"""
+        """Update multiple settings at once to avoid race conditions.
+
+        Updates arriving while another save is running are queued and written
+        together by the next writer; every caller gets the result of the write
+        that included its changes."""
         print(f"DEBUG: REQUEST UPDATE settings: {updates.keys()}")
-        
-        # 1. Reload first to get latest state from Drive
-        self.load_settings()
-        
-        # 2. Update local state with all updates
-        for k, v in updates.items():
-            self.settings[k] = v
-        
-        # 3. Save everything back
-        print(f"DEBUG: Saving full settings object: {self.settings}")
-        return self.save_settings()
+        with self._pending_lock:
+            self._pending.update(updates)
+            my_batch = self._batch_no
+
+        with self._write_lock:
+            with self._pending_lock:
+                if self._written_batch >= my_batch:
+                    # Saved by the writer that ran while we waited
+                    return self._batch_results.get(my_batch, False)
+                batch, self._pending = self._pending, {}
+                batch_no = self._batch_no
+                self._batch_no += 1
+
+            # 1. Pick up remote changes (downloads only if the file changed;
+            #    a missing file is created by the save below)
+            self.load_settings(force=True, create_missing=False)
+
+            # 2. Update local state with all queued updates
+            for k, v in batch.items():
+                self.settings[k] = v
+
+            # 3. Save everything back in one write
+            print(f"DEBUG: Saving full settings object: {self.settings}")
+            ok = self.save_settings()
+
+            with self._pending_lock:
+                self._written_batch = batch_no
+                self._batch_results[batch_no] = ok
+                self._batch_results.pop(batch_no - 100, None)
+            return ok
 
     def get_setting(self, key, default=None):
         # Refresh if empty
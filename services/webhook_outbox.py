@@ -0,0 +1,281 @@
+"""
+Webhook Outbox
+Durable delivery of the publication webhooks (publish/pause/delete/update,
+size grid) through mercadolibre.webhook_outbox.
+
+The endpoint adds the outbox row to the same session as its status change, so
+both are committed (or rolled back) together, and returns the delivery id at
+once. Background workers on the app event loop claim due rows, post them with
+the shared HTTP client and record the outcome: delivered, retried later with
+exponential backoff, or dead-lettered after too many attempts (or a
+non-retryable 4xx). Dead deliveries can be re-queued from the API.
+
+"update" events are coalesced: the row is held back for a short window and
+further updates of the same (item_id, event_type, site) inside that window
+reuse the pending row (pushing it back) instead of adding another, so quick
+successive edits reach the publisher as a single update. A row is never held
+back more than OUTBOX_COALESCE_MAX_SECONDS after its first update, so an item
+edited continuously is still delivered.
+
+Configuration (environment variables):
+    OUTBOX_WORKERS          concurrent delivery workers (default 2)
+    OUTBOX_BATCH_SIZE       rows claimed per worker pass (default 20)
+    OUTBOX_POLL_SECONDS     idle wait between passes when nothing is due (default 2)
+    OUTBOX_MAX_ATTEMPTS     attempts before a delivery is dead-lettered (default 8)
+    OUTBOX_COALESCE_SECONDS coalescing window for "update" events, 0 disables it (default 3)
+    OUTBOX_COALESCE_MAX_SECONDS longest an update is held back by coalescing (default 30)
+"""
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from db_conn import SessionLocal
+from models import WebhookDelivery
+from services import http_client
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_COALESCE_SECONDS = float(os.getenv("OUTBOX_COALESCE_SECONDS", "3"))
+OUTBOX_COALESCE_MAX_SECONDS = float(os.getenv("OUTBOX_COALESCE_MAX_SECONDS", "30"))
+
+# Events where only the latest one matters (the publisher re-reads the item)
+COALESCED_EVENTS = ("update",)
+
+# Backoff between attempts: 5s, 10s, 20s ... capped at 15 minutes
+_BACKOFF_BASE_SECONDS = 5
+_BACKOFF_MAX_SECONDS = 900
+# A row left in 'sending' this long (worker died mid-delivery) is claimed again
+_CLAIM_TIMEOUT_SECONDS = 300
+
+_worker_tasks = []
+_wakeup = None
+_loop = None  # event loop the workers (and _wakeup) belong to
+
+
+def _coalesce(db: Session, url: str, payload_json: str, event_type: str, item_key: str, site: str,
+              send_at: datetime, now: datetime):
+    """Fold into a pending, never-attempted delivery of the same key; returns its id or None."""
+    max_wait = timedelta(seconds=max(OUTBOX_COALESCE_MAX_SECONDS, OUTBOX_COALESCE_SECONDS))
+    existing = db.query(WebhookDelivery.id, WebhookDelivery.created_at).filter(
+        WebhookDelivery.item_id == item_key,
+        WebhookDelivery.event_type == event_type,
+        WebhookDelivery.site == site,
+        WebhookDelivery.url == url,
+        WebhookDelivery.status == "pending",
+        WebhookDelivery.attempts == 0,
+        WebhookDelivery.created_at >= now - max_wait
+    ).order_by(WebhookDelivery.created_at.desc()).first()
+    if not existing:
+        return None
+    # Debounce, but never past max_wait from the first update folded into the row
+    send_at = min(send_at, existing.created_at + max_wait)
+    # Conditional so a row a worker claimed meanwhile is not reused (the change would be missed)
+    updated = db.query(WebhookDelivery).filter(
+        WebhookDelivery.id == existing.id,
+        WebhookDelivery.status == "pending"
+    ).update({"next_attempt_at": send_at, "payload": payload_json}, synchronize_session=False)
+    return existing.id if updated else None
+
+
+def enqueue(db: Session, url: str, payload: dict, event_type: str, item_id=None, site: str = None) -> str:
+    """Add a delivery to the caller's session (committed with the caller's transaction)."""
+    now = datetime.utcnow()
+    item_key = json.dumps(item_id) if isinstance(item_id, list) else str(item_id)
+    payload_json = json.dumps(payload)
+
+    send_at = now
+    if event_type in COALESCED_EVENTS and OUTBOX_COALESCE_SECONDS > 0:
+        send_at = now + timedelta(seconds=OUTBOX_COALESCE_SECONDS)
+        delivery_id = _coalesce(db, url, payload_json, event_type, item_key, site, send_at, now)
+        if delivery_id:
+            print(f"Webhook outbox: {event_type} for item {item_key} ({site}) coalesced into {delivery_id}")
+            return delivery_id
+
+    delivery = WebhookDelivery(
+        id=str(uuid.uuid4()),
+        event_type=event_type,
+        item_id=item_key,
+        site=site,
+        url=url,
+        payload=payload_json,
+        status="pending",
+        attempts=0,
+        next_attempt_at=send_at,
+        created_at=now
+    )
+    db.add(delivery)
+    return delivery.id
+
+
+def wake_workers():
+    """Let idle workers pick up freshly committed rows without waiting for the next poll.
+
+    Safe from any thread: sync handlers run in the threadpool, and asyncio.Event
+    may only be touched from its own loop."""
+    if _wakeup is None or _loop is None or _loop.is_closed():
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is _loop:
+        _wakeup.set()
+    else:
+        _loop.call_soon_threadsafe(_wakeup.set)
+
+
+def requeue(db: Session, delivery_id: str):
+    """Send a dead (or pending) delivery again as soon as possible."""
+    delivery = db.query(WebhookDelivery).filter(WebhookDelivery.id == delivery_id).first()
+    if not delivery:
+        return None
+    if delivery.status in ("dead", "pending"):
+        delivery.status = "pending"
+        delivery.attempts = 0
+        delivery.next_attempt_at = datetime.utcnow()
+        delivery.last_error = None
+        db.commit()
+        db.refresh(delivery)
+        wake_workers()
+    return delivery
+
+
+def _claim_batch(token: str, limit: int) -> list:
+    """Claim due rows for this worker; the conditional UPDATE makes concurrent claims safe."""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        due = or_(
+            and_(WebhookDelivery.status == "pending", WebhookDelivery.next_attempt_at <= now),
+            and_(WebhookDelivery.status == "sending",
+                 WebhookDelivery.claimed_at < now - timedelta(seconds=_CLAIM_TIMEOUT_SECONDS))
+        )
+        ids = [row[0] for row in db.query(WebhookDelivery.id).filter(due).order_by(
+            WebhookDelivery.next_attempt_at
+        ).limit(limit).all()]
+        if not ids:
+            return []
+
+        db.query(WebhookDelivery).filter(WebhookDelivery.id.in_(ids), due).update({
+            "status": "sending",
+            "claimed_by": token,
+            "claimed_at": now
+        }, synchronize_session=False)
+        db.commit()
+
+        rows = db.query(WebhookDelivery.id, WebhookDelivery.url, WebhookDelivery.payload, WebhookDelivery.attempts).filter(
+            WebhookDelivery.id.in_(ids),
+            WebhookDelivery.claimed_by == token,
+            WebhookDelivery.status == "sending"
+        ).all()
+        return [(r.id, r.url, json.loads(r.payload), r.attempts) for r in rows]
+    except Exception as e:
+        db.rollback()
+        print(f"Webhook outbox: claim error: {e}")
+        return []
+    finally:
+        db.close()
+
+
+def _record_result(delivery_id: str, token: str, attempts: int, ok: bool, retryable: bool, error: str = None,
+                   defer_seconds: float = None):
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        if defer_seconds is not None:
+            # Not attempted (target circuit open): try again when it may be closed
+            values = {"status": "pending", "next_attempt_at": now + timedelta(seconds=defer_seconds), "last_error": error}
+        elif ok:
+            values = {"status": "delivered", "delivered_at": now, "last_error": None}
+        elif not retryable or attempts >= OUTBOX_MAX_ATTEMPTS:
+            values = {"status": "dead", "last_error": (error or "")[:1000]}
+        else:
+            delay = min(_BACKOFF_BASE_SECONDS * (2 ** (attempts - 1)), _BACKOFF_MAX_SECONDS)
+            values = {
+                "status": "pending",
+                "next_attempt_at": now + timedelta(seconds=delay),
+                "last_error": (error or "")[:1000]
+            }
+        values["attempts"] = attempts
+        values["claimed_by"] = None
+        db.query(WebhookDelivery).filter(
+            WebhookDelivery.id == delivery_id,
+            WebhookDelivery.claimed_by == token
+        ).update(values, synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Webhook outbox: error recording delivery {delivery_id}: {e}")
+    finally:
+        db.close()
+
+
+async def _deliver(token: str, delivery_id: str, url: str, payload: dict, attempts: int):
+    try:
+        response = await http_client.post("publications", url, json=payload)
+    except http_client.CircuitOpenError as e:
+        await asyncio.to_thread(_record_result, delivery_id, token, attempts, False, True, str(e), e.retry_after)
+        return
+    except Exception as e:
+        response, error = None, str(e)
+
+    attempts += 1
+    if response is not None:
+        status = response.status_code
+        ok = status in (200, 202)
+        # Client errors other than timeouts/rate limits will not succeed on retry
+        retryable = not (400 <= status < 500) or status in (408, 429)
+        error = None if ok else f"Status: {status} - {response.text[:500]}"
+    else:
+        ok, retryable = False, True
+    print(f"Webhook outbox: {payload.get('event_type')} delivery {delivery_id} attempt {attempts} (ok={ok})")
+    await asyncio.to_thread(_record_result, delivery_id, token, attempts, ok, retryable, error)
+
+
+async def _worker_loop(worker_no: int):
+    token = str(uuid.uuid4())
+    while True:
+        try:
+            batch = await asyncio.to_thread(_claim_batch, token, OUTBOX_BATCH_SIZE)
+            if batch:
+                await asyncio.gather(*(_deliver(token, *row) for row in batch))
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Webhook outbox worker {worker_no} error: {e}")
+
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_outbox_workers():
+    """Start the delivery workers on the running event loop (idempotent)."""
+    global _wakeup, _loop
+    if OUTBOX_WORKERS <= 0:
+        print("Webhook outbox workers disabled")
+        return []
+    if any(not t.done() for t in _worker_tasks):
+        return _worker_tasks
+    _loop = asyncio.get_running_loop()
+    _wakeup = asyncio.Event()
+    _worker_tasks[:] = [_loop.create_task(_worker_loop(n)) for n in range(OUTBOX_WORKERS)]
+    return _worker_tasks
+
+
+async def stop_outbox_workers():
+    """Cancel the workers; rows they had claimed are picked up again after the claim timeout."""
+    for task in _worker_tasks:
+        task.cancel()
+    await asyncio.gather(*_worker_tasks, return_exceptions=True)
+    _worker_tasks.clear()
@@ -0,0 +1,41 @@
+"""
+Test setup: a throwaway SQLite database (with the `mercadolibre` schema
+attached) and the in-memory Drive backend. The environment must be set before
+db_conn / drive_service are imported, so it is done here at collection time.
+"""
+import os
+import sys
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="inventory-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP, 'app.db')}"
+os.environ["DRIVE_BACKEND"] = "fake"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import event
+
+import db_conn
+import models
+
+
+@event.listens_for(db_conn.engine, "connect")
+def _attach_schemas(dbapi_connection, _record):
+    dbapi_connection.execute(f"ATTACH DATABASE '{os.path.join(_TMP, 'mercadolibre.db')}' AS mercadolibre")
+
+
+@pytest.fixture
+def drive_tables():
+    tables = [models.DriveFile.__table__, models.DriveSyncState.__table__]
+    db_conn.Base.metadata.create_all(db_conn.engine, tables=tables)
+    yield
+    db_conn.Base.metadata.drop_all(db_conn.engine, tables=tables)
+
+
+@pytest.fixture
+def fake_drive():
+    from services import fake_drive as fake
+    fake.reset_fake_drive()
+    yield fake.get_fake_drive()
+    fake.reset_fake_drive()
@@ -0,0 +1,86 @@
+from services import drive_index, drive_service
+from services.fake_drive import FOLDER_MIME
+
+
+def _folder(drive, name, parent=None):
+    return drive.put(None, {"name": name, "mimeType": FOLDER_MIME, "parents": [parent] if parent else []})["id"]
+
+
+def _image(drive, name, parent):
+    return drive.put(None, {"name": name, "mimeType": "image/jpeg", "parents": [parent]}, b"jpeg-bytes")["id"]
+
+
+def _indexed_ids():
+    db = drive_index.SessionLocal()
+    try:
+        return {row.id for row in db.query(drive_index.DriveFile).all()}
+    finally:
+        db.close()
+
+
+def _setup_tree(drive, monkeypatch):
+    root = _folder(drive, "catalog")
+    logos = _folder(drive, "logos")
+    monkeypatch.setattr(drive_service, "ROOT_FOLDER_ID", root)
+    monkeypatch.setenv("LOGOS_FOLDER_ID", logos)
+    product = _folder(drive, "812", root)
+    return root, logos, product
+
+
+def test_full_sync_copies_only_the_app_folders(drive_tables, fake_drive, monkeypatch):
+    root, logos, product = _setup_tree(fake_drive, monkeypatch)
+    photo = _image(fake_drive, "front.jpg", product)
+    settings = fake_drive.put(None, {"name": "app_settings.json", "parents": [logos]}, b"{}")["id"]
+    nested = _image(fake_drive, "deep.jpg", _folder(fake_drive, "old", product))
+    elsewhere = _image(fake_drive, "private.jpg", _folder(fake_drive, "personal"))
+
+    result = drive_index.sync_once(fake_drive)
+
+    assert result["mode"] == "full"
+    indexed = _indexed_ids()
+    assert {product, photo, settings} <= indexed
+    assert nested not in indexed and elsewhere not in indexed
+    assert drive_index.is_ready()
+
+
+def test_listings_link_images_to_the_proxy(drive_tables, fake_drive, monkeypatch):
+    _, _, product = _setup_tree(fake_drive, monkeypatch)
+    photo = _image(fake_drive, "front.jpg", product)
+    drive_index.sync_once(fake_drive)
+
+    files = drive_index.list_folder(product)
+
+    assert [f["id"] for f in files] == [photo]
+    assert files[0]["thumbnailLink"] == f"/api/products/drive-image/{photo}?size=thumbnail"
+    assert files[0]["largeImageLink"] == f"/api/products/drive-image/{photo}?size=large"
+
+
+def test_changes_feed_adds_new_files_and_drops_moved_out_ones(drive_tables, fake_drive, monkeypatch):
+    _, _, product = _setup_tree(fake_drive, monkeypatch)
+    moved = _image(fake_drive, "front.jpg", product)
+    drive_index.sync_once(fake_drive)
+
+    added = _image(fake_drive, "back.jpg", product)
+    fake_drive.put(moved, {"parents": [_folder(fake_drive, "archive")]})
+    outside = _image(fake_drive, "other.jpg", _folder(fake_drive, "personal"))
+    result = drive_index.sync_once(fake_drive)
+
+    assert result["mode"] == "changes"
+    indexed = _indexed_ids()
+    assert added in indexed
+    assert moved not in indexed and outside not in indexed
+
+
+def test_reset_makes_the_next_pass_copy_again(drive_tables, fake_drive, monkeypatch):
+    _, _, product = _setup_tree(fake_drive, monkeypatch)
+    _image(fake_drive, "front.jpg", product)
+    drive_index.sync_once(fake_drive)
+
+    db = drive_index.SessionLocal()
+    try:
+        drive_index.reset(db)
+    finally:
+        db.close()
+
+    assert not drive_index.is_ready()
+    assert drive_index.sync_once(fake_drive)["mode"] == "full"
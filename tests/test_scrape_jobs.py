@@ -0,0 +1,81 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+import db_conn
+import models
+from services import http_client, scrape_jobs
+
+
+@pytest.fixture
+def db():
+    tables = [models.ScrapeJob.__table__, models.ScrapeJobItem.__table__, models.ScrappedCompetence.__table__]
+    db_conn.Base.metadata.create_all(db_conn.engine, tables=tables)
+    session = db_conn.SessionLocal()
+    yield session
+    session.close()
+    db_conn.Base.metadata.drop_all(db_conn.engine, tables=tables)
+
+
+@pytest.fixture
+def scrapper(monkeypatch):
+    bodies = []
+
+    async def handler(request):
+        bodies.append(json.loads(request.content))
+        return httpx.Response(200)
+
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return bodies
+
+
+def test_dispatch_falls_back_to_one_full_scrape(db, scrapper, monkeypatch):
+    monkeypatch.setattr(scrape_jobs, "SCRAPER_ACCEPTS_PRODUCT_CODES", False)
+    job = scrape_jobs.create_job(db, [f"C{i}" for i in range(60)], "codes")
+
+    asyncio.run(scrape_jobs.dispatch_job(job.id, "http://scrapper/start", "secret"))
+
+    assert scrapper == [{"secret": "secret"}]
+    job = scrape_jobs.refresh_job_progress(db, job.id)
+    assert job.status == "running" and job.dispatched_items == 60
+
+
+def test_dispatch_batches_codes_when_the_scrapper_takes_them(db, scrapper, monkeypatch):
+    monkeypatch.setattr(scrape_jobs, "SCRAPER_ACCEPTS_PRODUCT_CODES", True)
+    monkeypatch.setattr(scrape_jobs, "SCRAPE_BATCH_SIZE", 25)
+    job = scrape_jobs.create_job(db, [f"C{i}" for i in range(60)], "codes")
+
+    asyncio.run(scrape_jobs.dispatch_job(job.id, "http://scrapper/start", "secret"))
+
+    assert sorted(len(body["product_codes"]) for body in scrapper) == [10, 25, 25]
+
+
+def test_items_finish_when_rescraped_after_dispatch(db, scrapper, monkeypatch):
+    monkeypatch.setattr(scrape_jobs, "SCRAPER_ACCEPTS_PRODUCT_CODES", False)
+    job = scrape_jobs.create_job(db, ["C1", "C2"], "codes")
+    asyncio.run(scrape_jobs.dispatch_job(job.id, "http://scrapper/start", "secret"))
+
+    # The scrapper writes its results with the same (UTC) clock as dispatched_at
+    db.add(models.ScrappedCompetence(product_code="C1", catalog_link="https://x/1", status="completed",
+                                     timestamp=datetime.utcnow() + timedelta(seconds=1)))
+    db.commit()
+    job = scrape_jobs.refresh_job_progress(db, job.id)
+
+    assert job.completed_items == 1 and job.status == "running"
+
+
+def test_unfinished_job_times_out(db, scrapper, monkeypatch):
+    monkeypatch.setattr(scrape_jobs, "SCRAPER_ACCEPTS_PRODUCT_CODES", False)
+    job = scrape_jobs.create_job(db, ["C1", "C2"], "codes")
+    asyncio.run(scrape_jobs.dispatch_job(job.id, "http://scrapper/start", "secret"))
+
+    job.created_at = datetime.utcnow() - timedelta(seconds=scrape_jobs.SCRAPE_JOB_TIMEOUT_SECONDS + 60)
+    db.commit()
+    job = scrape_jobs.refresh_job_progress(db, job.id)
+
+    assert job.status == "failed"
+    assert job.failed_items == 2
+    assert "Timed out" in job.error